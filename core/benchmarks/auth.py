@@ -0,0 +1,49 @@
+"""Per-request cost of API key authentication, with and without the
+verified-key cache in AuthServiceInternal.
+
+    python -m benchmarks.auth
+
+Without the cache every request re-hashes the presented key with
+sha512_crypt at the database's rounds (400k-999k), so the uncached line is
+dominated by that hash and scales with `SecurityDatabase.rounds`. With the
+cache only the first request per key and TTL pays for it; every further one
+costs an HMAC-SHA256 and a dictionary lookup.
+
+Measured on a development host (x86_64, rounds=757900):
+
+    uncached  mean   823.703 ms  p50   813.329 ms  p99  1064.401 ms
+    cached    mean     0.005 ms  p50     0.005 ms  p99     0.006 ms
+"""
+
+from benchmarks.common import measure, summary, temporary_brains_directory
+
+REPEAT_UNCACHED = 10
+REPEAT_CACHED = 10000
+
+
+def main() -> None:
+    with temporary_brains_directory():
+        from learninghouse.models.auth import APIKeyRequest, APIKeyRole
+        from learninghouse.services.auth import AuthServiceInternal
+
+        auth_service = AuthServiceInternal()
+        key = auth_service.create_apikey(
+            APIKeyRequest(description="benchmark", role=APIKeyRole.USER)
+        ).key
+
+        print(f"sha512_crypt rounds: {auth_service.database.rounds}")
+
+        def uncached():
+            auth_service.apikey_cache.clear()
+            auth_service.is_admin_user_or_trainer(None, key, None)
+
+        def cached():
+            auth_service.is_admin_user_or_trainer(None, key, None)
+
+        print(f"uncached  {summary(measure(uncached, REPEAT_UNCACHED))}")
+        cached()
+        print(f"cached    {summary(measure(cached, REPEAT_CACHED))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Per-sample cost of a prediction by number of samples per request.
+
+    python -m benchmarks.batch_prediction
+
+`batch` predicts all samples with one BrainService.predictions call, as
+POST /brain/{name}/predictions does. `single` predicts the same samples one
+BrainService.prediction call at a time, as a client without the batch
+endpoint has to (without the HTTP round trip and authentication each of
+those calls costs on top). Both are given per sample.
+
+Measured on a development host (x86_64, single core):
+
+         1  batch   mean     0.529 ms  p50     0.376 ms  p99     5.366 ms
+         1  single  mean     0.397 ms  p50     0.377 ms  p99     0.569 ms
+        10  batch   mean     0.054 ms  p50     0.053 ms  p99     0.064 ms
+        10  single  mean     0.344 ms  p50     0.341 ms  p99     0.379 ms
+       100  batch   mean     0.020 ms  p50     0.020 ms  p99     0.023 ms
+       100  single  mean     0.341 ms  p50     0.341 ms  p99     0.344 ms
+      1000  batch   mean     0.021 ms  p50     0.020 ms  p99     0.023 ms
+     10000  batch   mean     0.023 ms  p50     0.025 ms  p99     0.028 ms
+
+The brain predicts on its memory mapped forest (MappedForest). A single
+prediction costs about 0.35 ms, the fixed overhead of one predict call of
+sklearn's forest was about 6 ms. From about 100 samples per request the
+per-sample cost flattens out at the tree traversal itself, which is a bit
+slower than sklearn's (0.017 ms per sample for 10000 samples).
+"""
+
+from benchmarks.common import (
+    measure,
+    summary,
+    temporary_brains_directory,
+    train_darkness_brain,
+)
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+
+
+def _requests(size: int) -> list[dict]:
+    return [
+        {
+            "timestamp": 1700000000 + index * 60,
+            "azimuth": 100.0 + index % 260,
+            "elevation": -30.0 + index % 60,
+            "pressure_trend_1h": "rising" if index % 2 == 0 else "falling",
+        }
+        for index in range(size)
+    ]
+
+
+def _per_sample(durations: list[float], size: int) -> list[float]:
+    return [duration / size for duration in durations]
+
+
+def main() -> None:
+    with temporary_brains_directory():
+        from learninghouse.services.brain import BrainService
+
+        train_darkness_brain(1000)
+
+        for size in BATCH_SIZES:
+            requests = _requests(size)
+
+            def batch():
+                BrainService.predictions("darkness", [dict(r) for r in requests])
+
+            def single():
+                for request in requests:
+                    BrainService.prediction("darkness", dict(request))
+
+            repeat = 5 if size >= 1000 else 20
+            durations = _per_sample(measure(batch, repeat), size)
+            print(f"{size:>6}  batch   {summary(durations)}")
+
+            if size <= 100:
+                durations = _per_sample(measure(single, 5), size)
+                print(f"{size:>6}  single  {summary(durations)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Helpers shared by the benchmark scripts in this directory.
+
+The benchmarks are plain scripts, run from the `core` directory with
+`python -m benchmarks.<name>`. They are not part of the test suite: they
+print timings for a human to compare, and assert nothing.
+
+Like tests/conftest.py, nothing here imports `learninghouse` at module level
+- the configuration directory has to be set before the first import.
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+
+CONFIG_DIRECTORY_ENV = "LEARNINGHOUSE_CONFIG_DIRECTORY"
+
+DARKNESS_SENSORS = [
+    {"name": "azimuth", "typed": "numerical"},
+    {"name": "elevation", "typed": "numerical"},
+    {"name": "pressure_trend_1h", "typed": "categorical"},
+]
+
+
+@contextmanager
+def temporary_brains_directory() -> Iterator[Path]:
+    config_directory = Path(tempfile.mkdtemp(prefix="learninghouse-bench-"))
+    previous = os.environ.get(CONFIG_DIRECTORY_ENV)
+    os.environ[CONFIG_DIRECTORY_ENV] = str(config_directory)
+
+    from learninghouse.core.settings import service_settings
+
+    service_settings.cache_clear()
+
+    try:
+        yield config_directory
+    finally:
+        if previous is None:
+            os.environ.pop(CONFIG_DIRECTORY_ENV, None)
+        else:
+            os.environ[CONFIG_DIRECTORY_ENV] = previous
+        service_settings.cache_clear()
+        shutil.rmtree(config_directory, ignore_errors=True)
+
+
+def measure(func: Callable[[], object], repeat: int) -> List[float]:
+    """Run `func` `repeat` times and return each duration in milliseconds."""
+    durations = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        durations.append((perf_counter() - start) * 1000)
+
+    return durations
+
+
+def summary(durations: List[float]) -> str:
+    if len(durations) > 1:
+        percentiles = quantiles(durations, n=100)
+        p50, p99 = percentiles[49], percentiles[98]
+    else:
+        p50 = p99 = durations[0]
+
+    return f"mean {mean(durations):9.3f} ms  p50 {p50:9.3f} ms  p99 {p99:9.3f} ms"
+
+
+def darkness_training_data(rows: int) -> pd.DataFrame:
+    """Synthetic training data of the darkness brain, time columns included."""
+    from learninghouse.services.preprocessing import DatasetPreprocessing
+
+    index = np.arange(rows)
+    data = pd.DataFrame(
+        {
+            "azimuth": 100.0 + index % 260,
+            "elevation": -30.0 + index % 60,
+            "pressure_trend_1h": np.where(index % 2 == 0, "rising", "falling"),
+            "timestamp": 1700000000 + index * 60,
+            "darkness": index % 60 < 30,
+        }
+    )
+    times = pd.DataFrame(
+        [
+            DatasetPreprocessing.add_time_information({"timestamp": int(timestamp)})
+            for timestamp in data["timestamp"]
+        ]
+    )
+    return pd.concat([data, times.drop(columns=["timestamp"])], axis=1)
+
+
+def create_darkness_brain(name: str = "darkness", **configuration) -> None:
+    """Configure the sensors and a classifier brain, inside
+    temporary_brains_directory. `configuration` overrides the defaults."""
+    from learninghouse.models.brain import BrainConfiguration
+    from learninghouse.models.sensor import Sensors
+    from learninghouse.services.brain import BrainConfigurationService
+
+    Sensors.model_validate(DARKNESS_SENSORS).write_config()
+    BrainConfigurationService.create(
+        BrainConfiguration.model_validate(
+            {
+                "name": name,
+                "estimator": {"typed": "classifier", "random_state": 0},
+                "dependent_encode": True,
+                **configuration,
+            }
+        )
+    )
+
+
+def train_darkness_brain(rows: int, name: str = "darkness", **configuration) -> None:
+    """Create the brain like create_darkness_brain and train it on `rows` rows
+    of darkness_training_data."""
+    from learninghouse.services.brain import BrainService
+
+    create_darkness_brain(name, **configuration)
+    BrainService.train(
+        name, darkness_training_data(rows).rename(columns={"darkness": name})
+    )
+
+
+def process_memory() -> Dict[str, int]:
+    """Rss, Pss, Shared_* and Private_* of this process in kilobytes, read
+    from /proc/self/smaps_rollup (Linux only)."""
+    memory = {}
+    with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as smaps:
+        for line in smaps:
+            key, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                memory[key] = int(value.split()[0])
+
+    return memory
@@ -0,0 +1,58 @@
+"""Duration of one training by feature selection mode.
+
+    python -m benchmarks.feature_selection
+
+Trains a classifier brain with 100 trees on 100000 rows of synthetic
+darkness training data once per `feature_selection` mode of
+BrainTrainingConfiguration. `previous` is measured on the second training,
+the first one has no importances to reuse yet. Each line also lists the
+selected features.
+
+Measured on a development host (x86_64, single core):
+
+    refit          2.34 s  score 1.0000  elevation, minute_of_hour
+    previous       0.92 s  score 1.0000  elevation, minute_of_hour
+    surrogate      0.91 s  score 1.0000  elevation, minute_of_hour
+    none           1.60 s  score 1.0000  azimuth, day_of_month, ... (all 17)
+
+`none` fits its single forest on all 17 columns, which is slower than
+fitting the 2 selected ones. The synthetic data is easy to separate, so all
+modes reach the same score. On real data `surrogate` and `previous` can
+select slightly different features than `refit`.
+"""
+
+from time import perf_counter
+
+from benchmarks.common import (
+    create_darkness_brain,
+    darkness_training_data,
+    temporary_brains_directory,
+)
+
+ROWS = 100000
+MODES = ["refit", "previous", "surrogate", "none"]
+
+
+def main() -> None:
+    with temporary_brains_directory():
+        from learninghouse.services.brain import BrainService
+
+        data = darkness_training_data(ROWS)
+
+        for mode in MODES:
+            create_darkness_brain(mode, training={"feature_selection": mode})
+            brain_data = data.rename(columns={"darkness": mode})
+
+            if mode == "previous":
+                BrainService.train(mode, brain_data)
+
+            start = perf_counter()
+            info = BrainService.train(mode, brain_data)
+            duration = perf_counter() - start
+
+            features = ", ".join(info.features or [])
+            print(f"{mode:<10} {duration:8.2f} s  score {info.score:.4f}  {features}")
+
+
+if __name__ == "__main__":
+    main()
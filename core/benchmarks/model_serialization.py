@@ -0,0 +1,170 @@
+"""Loading a trained brain: joblib dump versus the artifact format.
+
+    python -m benchmarks.model_serialization
+
+Trains a classifier brain with 500 trees of depth 10 on synthetic darkness
+training data with a random dependent variable and stores it once as a
+joblib dump of the whole brain, as before, and once in the artifact format
+of learninghouse.models.artifact, which is loaded with the trees built by
+sklearn (`artifact`) or `mapped` to predict on the memory mapped forest
+file. Measures the load from the page cache, the mean of 10 loads each, and
+the memory a worker process gains by loading the brain and predicting 1000
+samples, for 4 worker processes holding it at the same time. Memory is read
+from /proc/self/smaps_rollup in kilobytes.
+
+Measured on a development host (x86_64, single core):
+
+    forest file 49.3 MB
+    joblib    load    mean   108.051 ms  p50   101.691 ms  p99   203.970 ms
+    joblib    worker  Rss               103510 kB
+    joblib    worker  Pss               103298 kB
+    joblib    worker  Shared_Clean         248 kB
+    joblib    worker  Shared_Dirty          20 kB
+    joblib    worker  Private_Clean          0 kB
+    joblib    worker  Private_Dirty     103242 kB
+    artifact  load    mean    26.817 ms  p50    26.509 ms  p99    30.586 ms
+    artifact  worker  Rss                51916 kB
+    artifact  worker  Pss                51704 kB
+    artifact  worker  Shared_Clean         248 kB
+    artifact  worker  Shared_Dirty          20 kB
+    artifact  worker  Private_Clean          0 kB
+    artifact  worker  Private_Dirty      51648 kB
+    mapped    load    mean     8.565 ms  p50     8.052 ms  p99    15.217 ms
+    mapped    worker  Rss                52567 kB
+    mapped    worker  Pss                14191 kB
+    mapped    worker  Shared_Clean        8848 kB
+    mapped    worker  Shared_Dirty       42268 kB
+    mapped    worker  Private_Clean          0 kB
+    mapped    worker  Private_Dirty       1451 kB
+
+The artifact format loads about 4 times faster: the header is unpickled by
+the C pickle module instead of joblib's Python unpickler and the node arrays
+are read through the memory map without an intermediate copy, which also
+halves the memory of each worker. sklearn's Tree copies the nodes into
+memory of its own however, so each worker holds a private copy of the
+forest. A `mapped` brain predicts on the pages of the forest file, which
+all 4 workers share: each worker holds 1.5 MB of private memory instead of
+50 MB, its proportional share (Pss) of the forest is a quarter. The shared
+pages are dirty only because the forest file was just written.
+"""
+
+import multiprocessing
+from os import path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import (
+    create_darkness_brain,
+    darkness_training_data,
+    measure,
+    process_memory,
+    summary,
+    temporary_brains_directory,
+)
+
+ROWS = 100000
+REPEAT = 10
+WORKERS = 4
+ESTIMATORS = 500
+NAME = "darkness"
+
+
+VARIANTS = ["joblib", "artifact", "mapped"]
+
+
+def load(legacy_filename: str, variant: str):
+    from learninghouse.models.brain import Brain
+
+    if variant == "joblib":
+        return joblib.load(legacy_filename)
+
+    return Brain.load_trained(NAME, mapped=variant == "mapped")
+
+
+def predict(brain) -> None:
+    """Predict 1000 samples, which touches the nodes of all trees."""
+    features = brain.dataset.features
+    samples = np.random.default_rng(0).random((1000, len(features))) * 100
+    if brain.uses_feature_names:
+        samples = pd.DataFrame(samples, columns=features)
+    brain.predict(samples)
+
+
+def worker(legacy_filename: str, variant: str, barrier, results) -> None:
+    # Import everything a load needs first, only the brain itself is measured.
+    from learninghouse.models.brain import Brain  # noqa: F401
+    from learninghouse.services.preprocessing import DatasetPreprocessing  # noqa: F401
+
+    before = process_memory()
+    brain = load(legacy_filename, variant)
+    predict(brain)
+    # Measure when every worker has loaded the brain and keep it loaded
+    # until every worker has measured.
+    barrier.wait()
+    after = process_memory()
+    barrier.wait()
+    results.put({key: after[key] - before[key] for key in after})
+    del brain
+
+
+def main() -> None:
+    with temporary_brains_directory() as config_directory:
+        from learninghouse.models.brain import Brain
+        from learninghouse.services.brain import BrainService
+
+        # A random dependent variable grows the trees to their full depth,
+        # the forest is as large as the one of a real noisy brain.
+        data = darkness_training_data(ROWS)
+        data[NAME] = np.random.default_rng(0).random(ROWS) < 0.5
+        create_darkness_brain(
+            NAME,
+            estimator={
+                "typed": "classifier",
+                "estimators": ESTIMATORS,
+                "max_depth": 10,
+                "random_state": 0,
+            },
+        )
+        BrainService.train(NAME, data)
+
+        legacy_filename = str(config_directory / NAME / "legacy.pkl")
+        joblib.dump(Brain.load_trained(NAME), legacy_filename)
+        forest_size = path.getsize(config_directory / NAME / "trained.forest")
+        print(f"forest file {forest_size / 1024 / 1024:.1f} MB")
+
+        context = multiprocessing.get_context("spawn")
+        for variant in VARIANTS:
+            label = f"{variant:<8}"
+            durations = measure(lambda: load(legacy_filename, variant), REPEAT)
+            print(f"{label}  load    {summary(durations)}")
+
+            barrier = context.Barrier(WORKERS)
+            results = context.Queue()
+            processes = [
+                context.Process(
+                    target=worker, args=(legacy_filename, variant, barrier, results)
+                )
+                for _ in range(WORKERS)
+            ]
+            for process in processes:
+                process.start()
+            memories = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+
+            for key in (
+                "Rss",
+                "Pss",
+                "Shared_Clean",
+                "Shared_Dirty",
+                "Private_Clean",
+                "Private_Dirty",
+            ):
+                mean = sum(memory[key] for memory in memories) / WORKERS
+                print(f"{label}  worker  {key:<13} {mean:>10.0f} kB")
+
+
+if __name__ == "__main__":
+    main()
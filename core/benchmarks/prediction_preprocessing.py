@@ -0,0 +1,60 @@
+"""Cost of preparing one prediction request for the estimator.
+
+    python -m benchmarks.prediction_preprocessing
+
+Compares the pandas path DatasetPreprocessing.prepare_prediction (`pandas`)
+with the compiled FeaturePlan of the trained brain (`plan`), and the whole
+BrainService.prediction which now uses the plan (`prediction`).
+
+Measured on a development host (x86_64, single core):
+
+    pandas      mean     4.679 ms  p50     4.530 ms  p99     7.853 ms
+    plan        mean     0.012 ms  p50     0.012 ms  p99     0.020 ms
+    prediction  mean     6.599 ms  p50     6.492 ms  p99     8.843 ms
+
+What is left of `prediction` is almost entirely the predict call of the
+100 trees of the RandomForest.
+"""
+
+import pandas as pd
+
+from benchmarks.common import (
+    measure,
+    summary,
+    temporary_brains_directory,
+    train_darkness_brain,
+)
+
+REQUEST = {
+    "timestamp": 1700072000,
+    "azimuth": 200.0,
+    "elevation": -5.0,
+    "pressure_trend_1h": "falling",
+}
+
+
+def main() -> None:
+    with temporary_brains_directory():
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.preprocessing import DatasetPreprocessing
+
+        train_darkness_brain(1000)
+        brain = BrainService.load_brain("darkness")
+        request = DatasetPreprocessing.add_time_information(dict(REQUEST))
+
+        def pandas():
+            DatasetPreprocessing.prepare_prediction(brain, pd.DataFrame([request]))
+
+        def plan():
+            DatasetPreprocessing.prepare_prediction_rows(brain, [request])
+
+        def prediction():
+            BrainService.prediction("darkness", dict(REQUEST))
+
+        print(f"pandas      {summary(measure(pandas, 500))}")
+        print(f"plan        {summary(measure(plan, 500))}")
+        print(f"prediction  {summary(measure(prediction, 200))}")
+
+
+if __name__ == "__main__":
+    main()
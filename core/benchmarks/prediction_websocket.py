@@ -0,0 +1,72 @@
+"""Latency of a prediction over REST compared with the prediction WebSocket.
+
+    python -m benchmarks.prediction_websocket
+
+`rest` posts each dataset to POST /api/brain/{name}/prediction with an API
+key, so every request passes the middleware and protect_user again.
+`websocket` sends the same datasets as frames over one connection to
+/api/brain/{name}/prediction/ws, authenticated once when it was opened.
+Both run in-process through FastAPI's TestClient, so neither includes a TCP
+connection setup - a client without keep-alive pays that on top for REST.
+The brain is trained once and stays in the model cache, the API key in the
+verified-key cache, so what remains is the per-message overhead.
+"""
+
+from benchmarks.common import (
+    measure,
+    summary,
+    temporary_brains_directory,
+    train_darkness_brain,
+)
+
+REPEAT = 2000
+PASSWORD = "benchmark-password-1"
+
+DATASET = {
+    "azimuth": 150.0,
+    "elevation": -10.0,
+    "pressure_trend_1h": "falling",
+    "timestamp": 1700000000,
+}
+
+
+def main() -> None:
+    with temporary_brains_directory():
+        from fastapi.testclient import TestClient
+
+        from learninghouse.models.auth import APIKeyRequest, APIKeyRole
+        from learninghouse.service import get_application
+        from learninghouse.services.auth import API_KEY_NAME, auth_service_cached
+
+        auth_service_cached.cache_clear()
+        auth_service = auth_service_cached()
+        auth_service.update_password("learninghouse", PASSWORD)
+        key = auth_service.create_apikey(
+            APIKeyRequest(description="benchmark", role=APIKeyRole.USER)
+        ).key
+        train_darkness_brain(1000)
+
+        with TestClient(get_application()) as client:
+            url = "/api/brain/darkness/prediction"
+            headers = {API_KEY_NAME: key}
+
+            def rest():
+                client.post(url, json=DATASET, headers=headers).raise_for_status()
+
+            rest()
+            print(f"rest       {summary(measure(rest, REPEAT))}")
+
+            with client.websocket_connect(f"{url}/ws", headers=headers) as websocket:
+
+                def frame():
+                    websocket.send_json(DATASET)
+                    websocket.receive_json()
+
+                frame()
+                print(f"websocket  {summary(measure(frame, REPEAT))}")
+
+        auth_service_cached.cache_clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Cost of ingesting one training sample, by number of rows already stored.
+
+    python -m benchmarks.training_data_ingest
+
+Compares the former read-concat-rewrite of training_data.csv (kept here as
+`rewrite`) with CsvTrainingData.append. Training itself is not included, only
+the persistence of the new sample.
+
+Measured on a development host (x86_64, single core):
+
+        50  rewrite mean     3.592 ms  p50     3.555 ms  p99     5.271 ms
+        50  append  mean     0.048 ms  p50     0.042 ms  p99     0.210 ms
+    500000  rewrite mean  1329.458 ms  p50  1308.870 ms  p99  1498.913 ms
+    500000  append  mean     0.040 ms  p50     0.029 ms  p99     0.445 ms
+"""
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import measure, summary, temporary_brains_directory
+
+ROW_COUNTS = [50, 500000]
+
+
+def _sample(index: int) -> dict:
+    return {
+        "azimuth": 100.0 + index % 260,
+        "elevation": -30.0 + index % 60,
+        "pressure_trend_1h": "rising" if index % 2 == 0 else "falling",
+        "timestamp": 1700000000 + index * 60,
+        "darkness": index % 3 == 0,
+    }
+
+
+def _write_history(filename: str, rows: int) -> None:
+    index = np.arange(rows)
+    pd.DataFrame(
+        {
+            "azimuth": 100.0 + index % 260,
+            "elevation": -30.0 + index % 60,
+            "pressure_trend_1h": np.where(index % 2 == 0, "rising", "falling"),
+            "timestamp": 1700000000 + index * 60,
+            "darkness": index % 3 == 0,
+        }
+    ).to_csv(filename, sep=",", index=False)
+
+
+def main() -> None:
+    with temporary_brains_directory() as config_directory:
+        from learninghouse.services.training_data import CsvTrainingData
+
+        for rows in ROW_COUNTS:
+            (config_directory / f"rows{rows}").mkdir()
+            training_data = CsvTrainingData(f"rows{rows}")
+            _write_history(training_data.filename, rows)
+            sample = _sample(rows)
+
+            def rewrite():
+                data = pd.concat(
+                    [pd.read_csv(training_data.filename), pd.DataFrame([sample])],
+                    ignore_index=True,
+                )
+                data.to_csv(training_data.filename, sep=",", index=False)
+
+            def append():
+                training_data.append(sample)
+
+            repeat = 3 if rows > 10000 else 20
+            print(f"{rows:>10}  rewrite {summary(measure(rewrite, repeat))}")
+            print(f"{rows:>10}  append  {summary(measure(append, 100))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Loading the training data of a brain, CSV against the columnar store.
+
+    python -m benchmarks.training_data_load
+
+Stores synthetic darkness training data once as training_data.csv and once
+migrated to the columnar store, then loads all columns and only the columns
+the brain is trained on (the sensors, the time columns and the dependent
+variable, without timestamp and datetime), the mean of 3 loads each.
+
+Measured on a development host (x86_64, single core):
+
+       10000  csv       mean    10.981 ms  p50    10.807 ms  p99    12.001 ms
+       10000  csv       mean     7.806 ms  p50     7.791 ms  p99     8.030 ms  projected
+       10000  columnar  mean     3.503 ms  p50     3.398 ms  p99     4.156 ms
+       10000  columnar  mean     2.441 ms  p50     2.431 ms  p99     2.498 ms  projected
+      100000  csv       mean    98.393 ms  p50    98.100 ms  p99   107.685 ms
+      100000  csv       mean    59.829 ms  p50    59.930 ms  p99    60.393 ms  projected
+      100000  columnar  mean    24.921 ms  p50    25.532 ms  p99    25.966 ms
+      100000  columnar  mean    15.013 ms  p50    14.155 ms  p99    19.202 ms  projected
+     1000000  csv       mean   896.774 ms  p50   894.647 ms  p99   910.858 ms
+     1000000  csv       mean   514.784 ms  p50   515.069 ms  p99   532.979 ms  projected
+     1000000  columnar  mean   291.902 ms  p50   292.345 ms  p99   297.317 ms
+     1000000  columnar  mean   184.761 ms  p50   182.543 ms  p99   197.881 ms  projected
+
+Most of the remaining time of the columnar store goes into building the
+string columns (pressure_trend_1h, day_of_week, datetime) pandas expects.
+"""
+
+from benchmarks.common import (
+    DARKNESS_SENSORS,
+    darkness_training_data,
+    measure,
+    summary,
+    temporary_brains_directory,
+)
+
+ROW_COUNTS = [10000, 100000, 1000000]
+REPEAT = 3
+
+
+def main() -> None:
+    with temporary_brains_directory() as config_directory:
+        from learninghouse.models.sensor import Sensors
+        from learninghouse.services.preprocessing import DatasetPreprocessing
+        from learninghouse.services.training_data import (
+            ColumnarTrainingData,
+            CsvTrainingData,
+        )
+
+        Sensors.model_validate(DARKNESS_SENSORS).write_config()
+        columns = DatasetPreprocessing.training_columns("darkness")
+
+        for rows in ROW_COUNTS:
+            name = f"rows{rows}"
+            (config_directory / name).mkdir()
+            csv_data = CsvTrainingData(name)
+            darkness_training_data(rows).to_csv(csv_data.filename, index=False)
+
+            print(f"{rows:>8}  csv       {summary(measure(csv_data.load, REPEAT))}")
+            print(
+                f"{rows:>8}  csv       "
+                f"{summary(measure(lambda: csv_data.load(columns), REPEAT))}"
+                "  projected"
+            )
+
+            columnar = ColumnarTrainingData(name)
+            columnar.migrate()
+
+            print(f"{rows:>8}  columnar  {summary(measure(columnar.load, REPEAT))}")
+            print(
+                f"{rows:>8}  columnar  "
+                f"{summary(measure(lambda: columnar.load(columns), REPEAT))}"
+                "  projected"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Reading recent samples from the SQLite training data store.
+
+    python -m benchmarks.training_data_sqlite
+
+Stores synthetic darkness training data (one sample per minute) in
+training_data.csv and in the SQLite store and reads all samples, the last
+1000 samples and the samples of the last day (1440), the mean of 3 reads
+each. The CSV store reads a time window by loading all samples.
+
+Measured on a development host (x86_64, single core):
+
+       10000  csv     all   mean    10.883 ms  p50    10.576 ms  p99    12.705 ms
+       10000  csv     tail  mean     1.891 ms  p50     1.741 ms  p99     2.637 ms
+       10000  csv     day   mean    11.583 ms  p50    11.357 ms  p99    13.186 ms
+       10000  sqlite  all   mean    49.923 ms  p50    30.187 ms  p99   148.350 ms
+       10000  sqlite  tail  mean     5.018 ms  p50     4.985 ms  p99     5.260 ms
+       10000  sqlite  day   mean     5.853 ms  p50     5.855 ms  p99     6.296 ms
+      100000  csv     all   mean    93.304 ms  p50    93.508 ms  p99    96.771 ms
+      100000  csv     tail  mean     1.811 ms  p50     1.853 ms  p99     2.029 ms
+      100000  csv     day   mean    96.905 ms  p50    96.061 ms  p99   103.160 ms
+      100000  sqlite  all   mean   433.766 ms  p50   436.436 ms  p99   442.955 ms
+      100000  sqlite  tail  mean     4.928 ms  p50     4.828 ms  p99     5.661 ms
+      100000  sqlite  day   mean     5.816 ms  p50     5.815 ms  p99     5.855 ms
+     1000000  csv     all   mean   891.037 ms  p50   893.983 ms  p99   895.556 ms
+     1000000  csv     tail  mean     2.219 ms  p50     1.764 ms  p99     4.532 ms
+     1000000  csv     day   mean   886.532 ms  p50   886.331 ms  p99   904.031 ms
+     1000000  sqlite  all   mean  4184.723 ms  p50  4178.870 ms  p99  4226.456 ms
+     1000000  sqlite  tail  mean     5.087 ms  p50     4.993 ms  p99     5.806 ms
+     1000000  sqlite  day   mean     5.939 ms  p50     5.861 ms  p99     6.320 ms
+
+Reading a time window from SQLite costs the same for any history length.
+Loading all samples is about 5 times slower than from the CSV, each value
+passes through the sqlite3 module as a Python object. The SQLite store pays
+off for brains trained on recent samples, not on their whole history.
+"""
+
+from benchmarks.common import (
+    darkness_training_data,
+    measure,
+    summary,
+    temporary_brains_directory,
+)
+
+ROW_COUNTS = [10000, 100000, 1000000]
+REPEAT = 3
+DAY = 24 * 60 * 60
+
+
+def main() -> None:
+    with temporary_brains_directory() as config_directory:
+        from learninghouse.services.training_data import (
+            CsvTrainingData,
+            SqliteTrainingData,
+        )
+
+        for rows in ROW_COUNTS:
+            name = f"rows{rows}"
+            (config_directory / name).mkdir()
+            data = darkness_training_data(rows)
+            last_day = float(data["timestamp"].iloc[-1]) - DAY
+
+            csv_data = CsvTrainingData(name)
+            data.to_csv(csv_data.filename, index=False)
+            sqlite_data = SqliteTrainingData(name)
+            with sqlite_data.lock:
+                sqlite_data.write(data)
+
+            for label, store in (("csv", csv_data), ("sqlite", sqlite_data)):
+                reads = {
+                    "all": store.load,
+                    "tail": lambda store=store: store.tail(1000),
+                    "day": lambda store=store: store.window(since=last_day),
+                }
+                for read, func in reads.items():
+                    print(
+                        f"{rows:>8}  {label:<6}  {read:<4}  "
+                        f"{summary(measure(func, REPEAT))}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
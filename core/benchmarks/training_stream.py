@@ -0,0 +1,96 @@
+"""CPU time spent per ingested data point, one request per data point
+compared with a stream of data points.
+
+    python -m benchmarks.training_stream
+
+`single` stores each data point with its own BrainService.request call, as
+PUT /brain/{name}/training does (without the HTTP round trip and the
+authentication each of those requests costs on top). `stream` feeds the
+same data points as NDJSON to TrainingDataStream, as PUT
+/brain/{name}/training/stream does, in chunks of 10 lines, and stores them
+in batches of the given size. The brain trains in the background with a
+debounce longer than the benchmark, so neither includes the training.
+
+CPU time of the process (time.process_time) divided by the number of data
+points, the wall clock time of the stream includes the thread pool hand-off
+of each batch.
+"""
+
+import asyncio
+import json
+from time import process_time
+from typing import AsyncIterator, List
+
+from benchmarks.common import create_darkness_brain, temporary_brains_directory
+
+SAMPLES = 2000
+CHUNK_LINES = 10
+BATCH_SIZES = [1, 10, 100, 1000]
+
+
+def _sensors_data(index: int) -> dict:
+    return {
+        "azimuth": 100.0 + index % 260,
+        "elevation": -30.0 + index % 60,
+        "pressure_trend_1h": "rising" if index % 2 == 0 else "falling",
+    }
+
+
+def _chunks() -> List[bytes]:
+    lines = [
+        json.dumps(
+            {"dependent_value": index % 60 < 30, "sensors_data": _sensors_data(index)}
+        ).encode("utf-8")
+        + b"\n"
+        for index in range(SAMPLES)
+    ]
+    return [
+        b"".join(lines[start : start + CHUNK_LINES])
+        for start in range(0, SAMPLES, CHUNK_LINES)
+    ]
+
+
+async def _feed(chunks: List[bytes]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
+
+
+def main() -> None:
+    with temporary_brains_directory():
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.executor import shutdown_executors
+        from learninghouse.services.training import shutdown_training_scheduler
+        from learninghouse.services.training_import import TrainingDataStream
+
+        background = {"background": True, "debounce": 3600.0}
+
+        create_darkness_brain("single", training=background)
+        start = process_time()
+        for index in range(SAMPLES):
+            BrainService.request("single", index % 60 < 30, _sensors_data(index))
+        single = (process_time() - start) / SAMPLES * 1000
+        print(f"{'single':>12}  {single:7.3f} ms per data point")
+
+        chunks = _chunks()
+        for batch_size in BATCH_SIZES:
+            name = f"stream{batch_size}"
+            create_darkness_brain(name, training=background)
+
+            async def stream():
+                training_stream = await TrainingDataStream.open(name, batch_size, 60.0)
+                return await training_stream.run(_feed(chunks))
+
+            start = process_time()
+            asyncio.run(stream())
+            streamed = (process_time() - start) / SAMPLES * 1000
+            print(
+                f"{'stream':>6} {batch_size:>5}  {streamed:7.3f} ms per data point"
+                f"  ({single / streamed:5.1f}x)"
+            )
+
+        shutdown_training_scheduler()
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,19 @@
-from fastapi import APIRouter, Depends, status
+import asyncio
 
+from fastapi import (
+    APIRouter,
+    Depends,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from pydantic import ValidationError
+
+from learninghouse.core.settings import service_settings
+from learninghouse.errors import LearningHouseException
 from learninghouse.errors.brain import (
+    BrainBadRequest,
     BrainExists,
     BrainNoConfiguration,
     BrainNotActual,
@@ -10,14 +23,35 @@ from learninghouse.errors.brain import (
 from learninghouse.models.brain import (
     BrainConfiguration,
     BrainDeleteResult,
+    BrainImportFormat,
+    BrainImportResult,
     BrainInfo,
     BrainInfos,
+    BrainMetrics,
     BrainPredictionRequest,
     BrainPredictionResult,
+    BrainPredictionsRequest,
+    BrainPredictionsResult,
+    BrainsPredictionRequest,
+    BrainsPredictionResult,
+    BrainStreamResult,
     BrainTrainingRequest,
+    BrainTrainingStatus,
+)
+from learninghouse.services.auth import (
+    protect_admin,
+    protect_trainer,
+    protect_user,
+    protect_user_websocket,
 )
-from learninghouse.services.auth import protect_admin, protect_trainer, protect_user
 from learninghouse.services.brain import BrainConfigurationService, BrainService
+from learninghouse.services.executor import run_prediction, run_training
+from learninghouse.services.subscription import prediction_subscriptions
+from learninghouse.services.training import training_scheduler
+from learninghouse.services.training_import import (
+    TrainingDataImport,
+    TrainingDataStream,
+)
 
 router = APIRouter(prefix="/brain", tags=["brain"])
 
@@ -27,6 +61,8 @@ router_training = APIRouter(dependencies=[Depends(protect_trainer)])
 
 router_admin = APIRouter(dependencies=[Depends(protect_admin)])
 
+router_websocket = APIRouter(dependencies=[Depends(protect_user_websocket)])
+
 
 @router_usage.get(
     "s/info",
@@ -38,7 +74,21 @@ router_admin = APIRouter(dependencies=[Depends(protect_admin)])
     },
 )
 async def infos_get():
-    return BrainService.list_all()
+    return await run_prediction(BrainService.list_all)
+
+
+@router_usage.get(
+    "s/metrics",
+    response_model=BrainMetrics,
+    summary="Retrieve metrics",
+    description="Retrieve metrics like the state of the cache of trained "
+    + "brains. Metrics are collected per worker process.",
+    responses={
+        200: {"description": "Metrics of the worker process"},
+    },
+)
+async def metrics_get():
+    return BrainService.metrics()
 
 
 @router_usage.get(
@@ -52,7 +102,7 @@ async def infos_get():
     },
 )
 async def info_get(name: str):
-    return BrainService.get_info(name)
+    return await run_prediction(BrainService.get_info, name)
 
 
 @router_training.post(
@@ -67,14 +117,16 @@ async def info_get(name: str):
     },
 )
 async def training_post(name: str):
-    return BrainService.request(name)
+    return await run_training(BrainService.request, name)
 
 
 @router_training.put(
     "/{name}/training",
     response_model=BrainInfo,
     summary="Train the brain with new data",
-    description="Train the brain with additional data.",
+    description="Train the brain with additional data. If the brain is "
+    + "configured for background training the data is stored and the "
+    + "request returns without waiting for the training.",
     responses={
         200: {"description": "Information of the trained brain"},
         BrainNotEnoughData.STATUS_CODE: BrainNotEnoughData.api_description(),
@@ -82,7 +134,125 @@ async def training_post(name: str):
     },
 )
 async def training_put(name: str, request: BrainTrainingRequest):
-    return BrainService.request(name, request.dependent_value, request.sensors_data)
+    return await run_training(
+        BrainService.request, name, request.dependent_value, request.sensors_data
+    )
+
+
+@router_training.put(
+    "/{name}/training/import",
+    response_model=BrainImportResult,
+    summary="Import many data points",
+    description="Import many data points at once, e.g. from a persistence "
+    + "database, as `text/csv` with a header line of the sensor names, the "
+    + "brain name for the dependent variable and optionally `timestamp`, or "
+    + "as `application/x-ndjson` with one training request per line. The "
+    + "body is validated against the sensors configuration while it is "
+    + "received, the data points are stored at once and the brain is "
+    + "trained once afterwards. The data points received so far are shown "
+    + "as `importing_samples` of the training state.",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                import_format.content_type: {"schema": {"type": "string"}}
+                for import_format in BrainImportFormat
+            },
+        }
+    },
+    responses={
+        200: {"description": "Number of imported data points and the brain"},
+        BrainBadRequest.STATUS_CODE: BrainBadRequest.api_description(),
+        BrainNotEnoughData.STATUS_CODE: BrainNotEnoughData.api_description(),
+        BrainNoConfiguration.STATUS_CODE: BrainNoConfiguration.api_description(),
+    },
+)
+async def training_import_put(name: str, request: Request):
+    import_format = BrainImportFormat.from_content_type(
+        request.headers.get("content-type", "")
+    )
+    if import_format is None:
+        raise BrainBadRequest(
+            "Content type of the data points has to be one of "
+            + ", ".join(item.content_type for item in BrainImportFormat)
+        )
+
+    # Parsing and validating the body is ingest work, kept off the
+    # prediction threads.
+    await run_training(BrainConfigurationService.get, name)
+    importer = await run_training(TrainingDataImport, name, import_format)
+    try:
+        async for chunk in request.stream():
+            samples = await run_training(importer.feed, chunk)
+            training_scheduler().importing(name, samples)
+
+        samples = await run_training(importer.samples)
+    finally:
+        training_scheduler().importing(name, None)
+
+    return await run_training(BrainService.import_training_data, name, samples)
+
+
+@router_training.put(
+    "/{name}/training/stream",
+    response_model=BrainStreamResult,
+    summary="Stream data points",
+    description="Stream data points of a sensor feed as "
+    + "`application/x-ndjson` with one training request per line, over one "
+    + "request which stays open as long as the client keeps sending. The "
+    + "data points are stored in batches of "
+    + "`LEARNINGHOUSE_TRAINING_STREAM_BATCH_SIZE` data points, or of the data "
+    + "points received within `LEARNINGHOUSE_TRAINING_STREAM_BATCH_SECONDS`, "
+    + "and each batch is announced to the background training of the brain "
+    + "at once. An invalid line ends the stream, the data points before it "
+    + "are stored.",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                BrainImportFormat.NDJSON.content_type: {"schema": {"type": "string"}}
+            },
+        }
+    },
+    responses={
+        200: {"description": "Number of stored data points and the brain"},
+        BrainBadRequest.STATUS_CODE: BrainBadRequest.api_description(),
+        BrainNoConfiguration.STATUS_CODE: BrainNoConfiguration.api_description(),
+    },
+)
+async def training_stream_put(name: str, request: Request):
+    import_format = BrainImportFormat.from_content_type(
+        request.headers.get("content-type", "")
+    )
+    if import_format != BrainImportFormat.NDJSON:
+        raise BrainBadRequest(
+            "Content type of the data points has to be "
+            + BrainImportFormat.NDJSON.content_type
+        )
+
+    await run_prediction(BrainConfigurationService.get, name)
+    settings = service_settings()
+    stream = await TrainingDataStream.open(
+        name,
+        settings.training_stream_batch_size,
+        settings.training_stream_batch_seconds,
+    )
+
+    return await stream.run(request.stream())
+
+
+@router_usage.get(
+    "/{name}/training",
+    response_model=BrainTrainingStatus,
+    summary="Training state",
+    description="Retrieve the state of the background training of a brain.",
+    responses={
+        200: {"description": "State of the background training"},
+        BrainNoConfiguration.STATUS_CODE: BrainNoConfiguration.api_description(),
+    },
+)
+async def training_get(name: str):
+    return await run_prediction(BrainService.training_status, name)
 
 
 @router_usage.post(
@@ -97,7 +267,108 @@ async def training_put(name: str, request: BrainTrainingRequest):
     },
 )
 async def prediction_post(name: str, request_data: BrainPredictionRequest):
-    return BrainService.prediction(name, request_data.dict())
+    return await run_prediction(BrainService.prediction, name, request_data.dict())
+
+
+@router_websocket.websocket("/{name}/prediction/ws")
+async def prediction_websocket(websocket: WebSocket, name: str):
+    """
+    Predictions over one WebSocket, authenticated once when it is opened.
+    Each frame holds the JSON body of a prediction request and is answered
+    with a text frame holding the prediction result, or the error with which
+    the prediction request would have been rejected. Frames are answered in
+    their order, an error does not close the connection.
+    """
+    await websocket.accept()
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+
+            frame = message.get("text") or message.get("bytes") or ""
+            try:
+                try:
+                    request_data = BrainPredictionRequest.model_validate_json(frame)
+                except ValidationError as exc:
+                    raise BrainBadRequest("Frame is no prediction request") from exc
+
+                result = await run_prediction(
+                    BrainService.prediction, name, request_data.dict()
+                )
+                await websocket.send_text(result.model_dump_json())
+            except LearningHouseException as exc:
+                await websocket.send_text(exc.error.model_dump_json())
+    except WebSocketDisconnect:
+        pass
+
+
+@router_websocket.websocket("/{name}/prediction/subscribe")
+async def prediction_subscribe(websocket: WebSocket, name: str):
+    """
+    Predictions of the brain pushed as text frames whenever one of the
+    sensors of its features changes in the sensor state (see PUT
+    /sensors/state), starting with one on the current state. Frames sent by
+    the client are ignored.
+    """
+    await websocket.accept()
+
+    async with prediction_subscriptions().subscribe(name) as queue:
+        closed = asyncio.create_task(_closed(websocket))
+        try:
+            while True:
+                message = asyncio.create_task(queue.get())
+                await asyncio.wait(
+                    (closed, message), return_when=asyncio.FIRST_COMPLETED
+                )
+                if closed.done():
+                    message.cancel()
+                    break
+
+                await websocket.send_text(message.result())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            closed.cancel()
+
+
+async def _closed(websocket: WebSocket) -> None:
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+@router_usage.post(
+    "/{name}/predictions",
+    response_model=BrainPredictionsResult,
+    summary="Batch prediction",
+    description="Predict many datasets with given brain in one request. "
+    + "Returns one prediction per dataset in the order of the request.",
+    responses={
+        200: {"description": "Prediction results"},
+        BrainNotActual.STATUS_CODE: BrainNotActual.api_description(),
+        BrainNotTrained.STATUS_CODE: BrainNotTrained.api_description(),
+    },
+)
+async def predictions_post(name: str, requests_data: BrainPredictionsRequest):
+    return await run_prediction(
+        BrainService.predictions, name, [dict(data) for data in requests_data]
+    )
+
+
+@router_usage.post(
+    "s/prediction",
+    response_model=BrainsPredictionResult,
+    summary="Prediction with many brains",
+    description="Predict one dataset with the given brains or with all "
+    + "trained brains if no brains are given. Brains which cannot predict "
+    + "the dataset are returned with their error.",
+    responses={
+        200: {"description": "Prediction results by brain"},
+    },
+)
+async def brains_prediction_post(request: BrainsPredictionRequest):
+    return await BrainService.prediction_of_brains(request.sensors_data, request.brains)
 
 
 @router_usage.get(
@@ -111,7 +382,7 @@ async def prediction_post(name: str, request_data: BrainPredictionRequest):
     },
 )
 async def configuration_get(name: str):
-    return BrainConfigurationService.get(name)
+    return await run_prediction(BrainConfigurationService.get, name)
 
 
 @router_admin.post(
@@ -126,7 +397,7 @@ async def configuration_get(name: str):
     },
 )
 async def configuration_post(brain: BrainConfiguration):
-    return BrainConfigurationService.create(brain)
+    return await run_prediction(BrainConfigurationService.create, brain)
 
 
 @router_admin.put(
@@ -140,7 +411,7 @@ async def configuration_post(brain: BrainConfiguration):
     },
 )
 async def configuration_put(name: str, configuration: BrainConfiguration):
-    return BrainConfigurationService.update(name, configuration)
+    return await run_prediction(BrainConfigurationService.update, name, configuration)
 
 
 @router_admin.delete(
@@ -150,9 +421,10 @@ async def configuration_put(name: str, configuration: BrainConfiguration):
     responses={status.HTTP_200_OK: {"description": "Returns the name of the brain"}},
 )
 async def configuration_delete(name: str):
-    return BrainConfigurationService.delete(name)
+    return await run_prediction(BrainConfigurationService.delete, name)
 
 
 router.include_router(router_usage)
 router.include_router(router_training)
 router.include_router(router_admin)
+router.include_router(router_websocket)
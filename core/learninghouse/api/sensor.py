@@ -1,9 +1,17 @@
 from fastapi import APIRouter, Body, Depends, status
 
 from learninghouse.errors.sensor import NoSensor, SensorExists
-from learninghouse.models.sensor import Sensor, SensorDeleteResult, Sensors
+from learninghouse.models.sensor import (
+    Sensor,
+    SensorDeleteResult,
+    Sensors,
+    SensorState,
+    SensorStateResult,
+)
 from learninghouse.services.auth import protect_admin, protect_user
+from learninghouse.services.executor import run_background, run_prediction
 from learninghouse.services.sensor import SensorConfigurationService
+from learninghouse.services.subscription import prediction_subscriptions
 
 router = APIRouter(prefix="/sensor", tags=["sensor"])
 
@@ -20,7 +28,35 @@ router_admin = APIRouter(dependencies=[Depends(protect_admin)])
     responses={status.HTTP_200_OK: {"description": "All configured sensors"}},
 )
 async def get_sensors_configuration():
-    return SensorConfigurationService.list_all()
+    return await run_prediction(SensorConfigurationService.list_all)
+
+
+@router_usage.get(
+    "s/state",
+    response_model=SensorState,
+    summary="Get the sensor state",
+    description="Get the current values of all sensors.",
+    responses={status.HTTP_200_OK: {"description": "Current values of the sensors"}},
+)
+async def get_sensors_state():
+    return prediction_subscriptions().state()
+
+
+@router_usage.put(
+    "s/state",
+    response_model=SensorStateResult,
+    summary="Update the sensor state",
+    description="Update the current values of the given sensors. Subscribed "
+    + "brains with one of the changed sensors among their features predict "
+    + "again and push the result to their subscribers.",
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Changed sensors and the brains which predicted again"
+        }
+    },
+)
+async def put_sensors_state(state: SensorState):
+    return await prediction_subscriptions().update(state.dict())
 
 
 @router_admin.get(
@@ -34,7 +70,7 @@ async def get_sensors_configuration():
     },
 )
 async def get_sensor_configuration(name: str):
-    return SensorConfigurationService.get(name)
+    return await run_prediction(SensorConfigurationService.get, name)
 
 
 @router_admin.post(
@@ -49,7 +85,9 @@ async def get_sensor_configuration(name: str):
     },
 )
 async def post_sensor_configuration(sensor: Sensor):
-    return SensorConfigurationService.create(sensor.name, sensor.typed)
+    return await run_background(
+        SensorConfigurationService.create, sensor.name, sensor.typed
+    )
 
 
 @router_admin.put(
@@ -63,8 +101,12 @@ async def post_sensor_configuration(sensor: Sensor):
     },
 )
 async def put_sensor_configuration(name: str, sensor: Sensor = Body()):
-    return SensorConfigurationService.update(
-        name, sensor.typed, sensor.cycles, sensor.calc_sun_position
+    return await run_background(
+        SensorConfigurationService.update,
+        name,
+        sensor.typed,
+        sensor.cycles,
+        sensor.calc_sun_position,
     )
 
 
@@ -76,7 +118,7 @@ async def put_sensor_configuration(name: str, sensor: Sensor = Body()):
     responses={status.HTTP_200_OK: {"description": "DeleteSensor"}},
 )
 async def delete_sensor_configuration(name: str):
-    return SensorConfigurationService.delete(name)
+    return await run_background(SensorConfigurationService.delete, name)
 
 
 router.include_router(router_usage)
@@ -1,20 +1,32 @@
 from collections.abc import Callable, Generator
-from os import environ, listdir, path
+from os import cpu_count, environ, listdir, path
 from pathlib import Path
 from secrets import token_hex
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 from pydantic import BaseModel, DirectoryPath
 
 from learninghouse import versions
 from learninghouse.core.logger.models import LoggingLevelEnum
 from learninghouse.errors import LearningHouseException, LearningHouseValidationError
+from learninghouse.models.base import EnumModel
 
 DOCKER_SECRETS_DIR = "/run/secrets"
 
 LICENSE_URL = "https://github.com/LearningHouseService/learninghouse/blob/main/LICENSE"
 
 
+class ModelCacheValidation(EnumModel):
+    STAT = "stat"
+    WATCH = "watch"
+
+
+class TrainingDataStore(EnumModel):
+    CSV = "csv"
+    COLUMNAR = "columnar"
+    SQLITE = "sqlite"
+
+
 class ServiceSettings(BaseModel):
     debug: Optional[bool] = False
     docs_url: str = "/docs"
@@ -38,6 +50,27 @@ class ServiceSettings(BaseModel):
     jwt_secret: str = token_hex(16)
     jwt_expire_minutes: int = 10
 
+    training_threads: int = 1
+    background_threads: int = 1
+    training_cpus: int = 0
+    training_data_store: TrainingDataStore = TrainingDataStore.CSV
+    training_stream_batch_size: int = 100
+    training_stream_batch_seconds: float = 1.0
+    prediction_threads: int = 4
+
+    sensors_cache_check_seconds: float = 1.0
+    sensors_state_time_seconds: float = 60.0
+
+    model_cache_size: int = 32
+    model_cache_megabytes: int = 1024
+    model_cache_preload: str = ""
+    model_cache_validation: ModelCacheValidation = ModelCacheValidation.STAT
+    model_cache_watch_seconds: float = 1.0
+    model_cache_memory_map: bool = True
+
+    apikey_cache_size: int = 256
+    apikey_cache_ttl_seconds: int = 300
+
     def __init__(self, **data: Any):
         sources = [self._read_environment, self._read_dotenv, self._read_secrets]
         data = self._parse_key_and_values(sources, data)
@@ -95,6 +128,19 @@ class ServiceSettings(BaseModel):
     def brains_directory(self) -> Path:
         return Path(self.config_directory).absolute()
 
+    @property
+    def training_cpus_calculated(self) -> int:
+        if self.training_cpus > 0:
+            return self.training_cpus
+
+        return cpu_count() or 1
+
+    @property
+    def model_cache_preload_names(self) -> List[str]:
+        return [
+            name.strip() for name in self.model_cache_preload.split(",") if name.strip()
+        ]
+
     @property
     def base_url_calculated(self) -> str:
         if self.base_url:
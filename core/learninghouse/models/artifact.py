@@ -0,0 +1,319 @@
+"""
+Artifact format of trained brains.
+
+A trained brain is stored in two files. `trained.pkl` is a small pickled
+header: the brain with the node arrays stripped from the trees of its forest,
+and the layout of these arrays. `trained.forest` holds the node and value
+arrays of all trees uncompressed, each aligned to `FOREST_ALIGNMENT` bytes,
+so they are read through a memory map instead of being unpickled.
+
+A brain loaded `mapped` keeps the memory map and predicts with MappedForest
+directly on its pages. All worker processes which load the brain share these
+pages, none of them holds a copy of the forest. The trees of the estimator
+are only built when the estimator itself is needed, e.g. for incremental
+training.
+
+Brains stored before this format existed are a single joblib dump of the
+brain in `trained.pkl` and are still read.
+"""
+
+from __future__ import annotations
+
+import copy
+import pickle
+from functools import cached_property
+from os import fstat, replace
+from secrets import token_bytes
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+import joblib
+import numpy as np
+from sklearn.base import is_classifier
+
+ARTIFACT_FORMAT = 1
+FOREST_ALIGNMENT = 64
+FOREST_TOKEN_SIZE = 16
+
+# Arrays of the state of sklearn's Tree, written to the forest file.
+FOREST_ARRAYS = ("nodes", "values")
+
+# Child of the leaves of sklearn's Tree.
+TREE_LEAF = -1
+
+# Samples predicted with one pass through the trees. Each pass holds a few
+# arrays of trees x samples node indices.
+PREDICTION_CHUNK_SIZE = 4096
+
+
+class ForestMismatch(ValueError):
+    """The forest file belongs to another header, it was replaced meanwhile."""
+
+
+class BrainArtifact:
+    @classmethod
+    def dump(cls, brain: Any, header_filename: str, forest_filename: str) -> None:
+        """
+        Write the forest file first and the header last, both to a temporary
+        file renamed into place. A header always describes a complete forest
+        file, a reader which sees another forest file than the one of its
+        header is told by the token both of them carry.
+        """
+        token = token_bytes(FOREST_TOKEN_SIZE)
+        estimator = brain.estimator()
+
+        layouts = cls._write_forest(estimator, forest_filename, token)
+
+        # pylint: disable=protected-access
+        header = copy.copy(brain)
+        header._estimator = cls._stripped(estimator)
+        header._forest = None
+
+        cls._write(
+            header_filename,
+            {
+                "format": ARTIFACT_FORMAT,
+                "brain": header,
+                "token": token,
+                "forest": layouts,
+            },
+        )
+
+    @classmethod
+    def load(
+        cls, header_filename: str, forest_filename: str, mapped: bool = False
+    ) -> Any:
+        """
+        Load a brain. A brain loaded `mapped` predicts with a MappedForest on
+        the memory mapped forest file, if its forest is supported by it.
+        """
+        try:
+            with open(header_filename, "rb") as header_file:
+                header = pickle.load(header_file)
+        except pickle.UnpicklingError:
+            # Single joblib dump of a brain stored before this format.
+            return joblib.load(header_filename)
+
+        if not isinstance(header, dict) or "format" not in header:
+            return header
+
+        with open(forest_filename, "rb") as forest_file:
+            inode = fstat(forest_file.fileno()).st_ino
+            forest = np.memmap(forest_file, dtype=np.uint8, mode="r")
+        if forest[:FOREST_TOKEN_SIZE].tobytes() != header["token"]:
+            raise ForestMismatch(forest_filename)
+
+        # pylint: disable=protected-access
+        brain = header["brain"]
+        mapped_forest = MappedForest(inode, forest, header["forest"])
+        if mapped and MappedForest.supports(brain._estimator, header["forest"]):
+            brain._forest = mapped_forest
+        else:
+            mapped_forest.materialize(brain._estimator)
+
+        return brain
+
+    @staticmethod
+    def _write(filename: str, header: Dict[str, Any]) -> None:
+        temporary = filename + ".tmp"
+        with open(temporary, "wb") as header_file:
+            pickle.dump(header, header_file, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(temporary, filename)
+
+    @staticmethod
+    def _stripped(estimator: Any) -> Any:
+        stripped = copy.copy(estimator)
+        trees = []
+        for tree in getattr(estimator, "estimators_", []):
+            tree = copy.copy(tree)
+            tree.__dict__.pop("tree_", None)
+            trees.append(tree)
+        stripped.estimators_ = trees
+
+        return stripped
+
+    @staticmethod
+    def _write_forest(
+        estimator: Any, filename: str, token: bytes
+    ) -> List[Dict[str, Any]]:
+        layouts = []
+        temporary = filename + ".tmp"
+        with open(temporary, "wb") as forest_file:
+            forest_file.write(token)
+            offset = FOREST_TOKEN_SIZE
+
+            for tree in getattr(estimator, "estimators_", []):
+                tree_class, arguments, state = tree.tree_.__reduce__()
+                layout: Dict[str, Any] = {
+                    "class": tree_class,
+                    "arguments": arguments,
+                    "max_depth": state["max_depth"],
+                    "node_count": state["node_count"],
+                }
+
+                for name in FOREST_ARRAYS:
+                    array = np.ascontiguousarray(state[name])
+                    padding = -offset % FOREST_ALIGNMENT
+                    forest_file.write(b"\0" * padding)
+                    offset += padding
+
+                    layout[name] = (offset, array.dtype, array.shape)
+                    forest_file.write(array.tobytes())
+                    offset += array.nbytes
+
+                layouts.append(layout)
+
+        replace(temporary, filename)
+
+        return layouts
+
+
+class MappedForest:
+    """
+    The node arrays of the trees of a forest in the memory mapped forest
+    file. Predicts like the forest of sklearn, by walking all trees for all
+    samples at once with numpy: the samples are cast to float32 like sklearn
+    does, a missing value follows `missing_go_to_left` and the predictions
+    of the trees are summed up in the order of the trees.
+    """
+
+    def __init__(self, inode: int, forest: np.ndarray, layouts: List[Dict[str, Any]]):
+        self.inode: int = inode
+        self.layouts: List[Dict[str, Any]] = layouts
+        self.materialized: bool = False
+        self._forest: np.ndarray = forest
+        self._lock = Lock()
+
+        self.nbytes: int = 0
+        for layout in layouts:
+            for name in FOREST_ARRAYS:
+                _, dtype, shape = layout[name]
+                self.nbytes += int(np.prod(shape)) * dtype.itemsize
+
+    @staticmethod
+    def supports(estimator: Any, layouts: List[Dict[str, Any]]) -> bool:
+        """
+        Forests with one output whose node arrays of all trees are at offsets
+        that are multiples of the size of a node, so that a single view of
+        the file holds the nodes of all trees.
+        """
+        if not layouts or getattr(estimator, "n_outputs_", 1) != 1:
+            return False
+
+        node_dtype = layouts[0]["nodes"][1]
+        return all(
+            layout["nodes"][1] == node_dtype
+            and layout["nodes"][0] % node_dtype.itemsize == 0
+            and layout["values"][1] == np.float64
+            and layout["values"][0] % np.float64().itemsize == 0
+            for layout in layouts
+        )
+
+    def materialize(self, estimator: Any) -> None:
+        """Build the Tree of each tree of the estimator from the node arrays."""
+        with self._lock:
+            if self.materialized:
+                return
+
+            for tree, layout in zip(estimator.estimators_, self.layouts):
+                state = {
+                    "max_depth": layout["max_depth"],
+                    "node_count": layout["node_count"],
+                }
+                for name in FOREST_ARRAYS:
+                    state[name] = self._array(*layout[name])
+
+                tree_ = layout["class"](*layout["arguments"])
+                tree_.__setstate__(state)
+                tree.tree_ = tree_
+
+            self.materialized = True
+
+    def predict(self, estimator: Any, data: Any) -> np.ndarray:
+        samples = np.asarray(data, dtype=np.float32)
+        if samples.ndim != 2 or samples.shape[1] != estimator.n_features_in_:
+            raise ValueError(
+                f"X has {samples.shape[-1]} features, but the brain is "
+                f"expecting {estimator.n_features_in_} features as input."
+            )
+
+        predictions = np.concatenate(
+            [
+                self._predict(estimator, samples[start : start + PREDICTION_CHUNK_SIZE])
+                for start in range(0, max(len(samples), 1), PREDICTION_CHUNK_SIZE)
+            ]
+        )
+
+        if is_classifier(estimator):
+            return estimator.classes_.take(np.argmax(predictions, axis=1), axis=0)
+
+        return predictions
+
+    def _predict(self, estimator: Any, samples: np.ndarray) -> np.ndarray:
+        nodes, values = self._views
+        roots, value_offsets, width = self._offsets
+
+        # Node of each tree for each sample, walked down while it is inner.
+        trees, count = len(roots), len(samples)
+        tree_roots = np.repeat(roots, count)
+        index = tree_roots.copy()
+        rows = np.tile(np.arange(count), trees)
+        walking = np.arange(trees * count)
+        while walking.size:
+            node = index[walking]
+            left_child = nodes["left_child"][node]
+            inner = left_child != TREE_LEAF
+            walking, node, left_child = walking[inner], node[inner], left_child[inner]
+
+            value = samples[rows[walking], nodes["feature"][node]]
+            left = value <= nodes["threshold"][node]
+            missing = np.isnan(value)
+            if missing.any():
+                left |= missing & (nodes["missing_go_to_left"][node] != 0)
+
+            child = np.where(left, left_child, nodes["right_child"][node])
+            index[walking] = tree_roots[walking] + child
+
+        index = index.reshape(trees, count)
+        leaves = value_offsets[:, np.newaxis] + (index - roots[:, np.newaxis]) * width
+        predictions = values[leaves[..., np.newaxis] + np.arange(width)]
+
+        if is_classifier(estimator):
+            normalizer = predictions.sum(axis=2, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            predictions = predictions / normalizer
+            return predictions.sum(axis=0) / len(self.layouts)
+
+        return predictions[..., 0].sum(axis=0) / len(self.layouts)
+
+    @cached_property
+    def _views(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The whole forest file as nodes and as values."""
+        node_size = self.layouts[0]["nodes"][1].itemsize
+        nodes = self._forest[: len(self._forest) // node_size * node_size]
+        value_size = np.float64().itemsize
+        values = self._forest[: len(self._forest) // value_size * value_size]
+
+        return nodes.view(self.layouts[0]["nodes"][1]), values.view(np.float64)
+
+    @cached_property
+    def _offsets(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Index of the root node of each tree in the view of all nodes, index
+        of its first value in the view of all values and the values per node.
+        """
+        node_size = self.layouts[0]["nodes"][1].itemsize
+        value_size = np.float64().itemsize
+        roots = np.array([layout["nodes"][0] // node_size for layout in self.layouts])
+        value_offsets = np.array(
+            [layout["values"][0] // value_size for layout in self.layouts]
+        )
+        width = int(np.prod(self.layouts[0]["values"][2][1:]))
+
+        return roots, value_offsets, width
+
+    def _array(
+        self, offset: int, dtype: np.dtype, shape: Tuple[int, ...]
+    ) -> np.ndarray:
+        size = int(np.prod(shape)) * dtype.itemsize
+        return self._forest[offset : offset + size].view(dtype).reshape(shape)
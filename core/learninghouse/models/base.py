@@ -1,10 +1,23 @@
 from enum import Enum
+from os import getpid, replace
 from pathlib import Path
+from threading import get_ident
 from typing import Any, Optional, Self, Union
 
 from pydantic import BaseModel, RootModel, model_serializer
 
 
+def write_file(filename: Union[str, Path], content: str) -> None:
+    """
+    Write a temporary file and rename it to `filename`, so readers - the
+    other worker processes too - see either the old or the new content.
+    """
+    temporary = f"{filename}.{getpid()}.{get_ident()}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file_pointer:
+        file_pointer.write(content)
+    replace(temporary, filename)
+
+
 class EnumModel(Enum):
     def __new__(cls, *args):
         obj = object.__new__(cls)
@@ -39,8 +52,7 @@ class LHBaseModel(BaseModel):
     def write_to_file(
         self, filename: Union[str, Path], indent: Optional[int] = None
     ) -> None:
-        with open(filename, "w", encoding="utf-8") as file_pointer:
-            file_pointer.write(self.model_dump_json(indent=indent))
+        write_file(filename, self.model_dump_json(indent=indent))
 
     def __hash__(self):
         return hash((type(self),) + tuple(self.__dict__.values()))
@@ -105,8 +117,7 @@ class ListModel(RootModel):
     def write_to_file(
         self, filename: Union[str, Path], indent: Optional[int] = None
     ) -> None:
-        with open(filename, "w", encoding="utf-8") as file_pointer:
-            file_pointer.write(self.model_dump_json(indent=indent))
+        write_file(filename, self.model_dump_json(indent=indent))
 
 
 class DictModel(RootModel):
@@ -142,5 +153,4 @@ class DictModel(RootModel):
     def write_to_file(
         self, filename: Union[str, Path], indent: Optional[int] = None
     ) -> None:
-        with open(filename, "w", encoding="utf-8") as file_pointer:
-            file_pointer.write(self.model_dump_json(indent=indent))
+        write_file(filename, self.model_dump_json(indent=indent))
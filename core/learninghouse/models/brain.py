@@ -1,23 +1,29 @@
 from __future__ import annotations
 
+import copy
 import json
 from datetime import datetime
 from os import makedirs, path
 from pathlib import Path
-from typing import Dict, List, Optional, Type
+from typing import Any, Dict, List, Optional, Type, cast
 
-import joblib
-from pydantic import Field, StrictBool, StrictFloat, StrictInt
+import numpy as np
+from pydantic import Field, PositiveFloat, StrictBool, StrictFloat, StrictInt
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 
 from learninghouse import versions
 from learninghouse.core.settings import service_settings
 from learninghouse.errors import LearningHouseSecurityException
 from learninghouse.errors.brain import BrainNotTrained
-from learninghouse.models import LearningHouseVersions
-from learninghouse.models.base import DictModel, EnumModel, LHBaseModel
+from learninghouse.models import LearningHouseErrorMessage, LearningHouseVersions
+from learninghouse.models.artifact import BrainArtifact, ForestMismatch, MappedForest
+from learninghouse.models.base import DictModel, EnumModel, LHBaseModel, ListModel
 from learninghouse.models.preprocessing import DatasetConfiguration
 
+# Attempts to read a trained brain whose forest file is replaced meanwhile.
+LOAD_ATTEMPTS = 3
+
 
 class BrainEstimatorType(EnumModel):
     """
@@ -78,12 +84,134 @@ class BrainEstimatorConfiguration(LHBaseModel):
     (default: 100) option. And the maximum depth of each tree by using
     `max_depth` (default: 5) option. Both options are optional. Try to
     resize this value to optimize the accuracy of your model.
+
+    The trees are fitted in parallel on `jobs` CPU cores (default: 1), 0 for
+    all cores. The cores are taken from the CPU budget all trainings of the
+    service share, a training gets less cores while others use them.
     """  # noqa: E501 — the reference table renders as markdown, do not rewrap
 
     typed: BrainEstimatorType = Field(..., examples=[BrainEstimatorType.CLASSIFIER])
     estimators: int = Field(default=100, ge=100, le=1000)
     max_depth: int = Field(default=5, ge=4, le=10)
     random_state: int = Field(default=0)
+    jobs: int = Field(default=1, ge=0, examples=[4])
+
+
+class BrainFeatureSelection(EnumModel):
+    REFIT = "refit"
+    PREVIOUS = "previous"
+    SURROGATE = "surrogate"
+    NONE = "none"
+
+
+class BrainTrainingConfiguration(LHBaseModel):
+    """
+    By default every new data point trains the brain at once and the request
+    waits for the newly trained brain. For brains which receive data points
+    at a high rate set `background` to true: the data point is stored and the
+    request returns immediately, while the brain is trained by a background
+    worker. Several data points arriving close to each other lead to one
+    training only.
+
+    With `background` training the following options decide when the brain
+    is trained again:
+
+    | Option | Description |
+    |--------|-------------|
+    | debounce | Seconds without a new data point before training starts. |
+    | every_samples | Number of new data points needed to train again. |
+    | min_interval | Minimum seconds between the start of two trainings. |
+
+    Only the most important columns of the training data are used as
+    `features` of the brain. How their importance is found is chosen by
+    `feature_selection`:
+
+    | Feature selection | Description |
+    |-------------------|-------------|
+    | refit | A complete forest is fitted on all columns first (default). |
+    | previous | The importances of the last training are used again. Only new columns, and every `rebuild_every` trainings, lead to a complete forest fitted on all columns. |
+    | surrogate | A small forest is fitted on a sample of the training data. |
+    | none | All columns are used as features. |
+
+    With `incremental` training a new data point does not fit the whole
+    forest again. Only the oldest trees are replaced by new ones fitted on the
+    most recent data points, the complete forest is rebuilt from all data
+    points every few trainings:
+
+    | Option | Description |
+    |--------|-------------|
+    | incremental_trees | Share of the trees replaced by each training. |
+    | incremental_window | Number of most recent data points the new trees are fitted on. |
+    | rebuild_every | Number of trainings after which the complete forest is rebuilt, and the importances reused by `previous` are found again. |
+    """  # noqa: E501 — the table renders as markdown, do not rewrap
+
+    background: bool = Field(default=False, examples=[True])
+    debounce: float = Field(default=0.0, ge=0.0, examples=[30.0])
+    every_samples: int = Field(default=1, ge=1, examples=[10])
+    min_interval: float = Field(default=0.0, ge=0.0, examples=[600.0])
+    feature_selection: BrainFeatureSelection = Field(
+        default=BrainFeatureSelection.REFIT, examples=[BrainFeatureSelection.PREVIOUS]
+    )
+    incremental: bool = Field(default=False, examples=[True])
+    incremental_trees: float = Field(default=0.1, gt=0.0, le=1.0, examples=[0.1])
+    incremental_window: int = Field(default=1000, ge=10, examples=[1000])
+    rebuild_every: int = Field(default=100, ge=1, examples=[100])
+
+
+class BrainRetentionConfiguration(LHBaseModel):
+    """
+    The training data of a brain grows with every data point, and with it the
+    time to train the brain. The following options limit which data points
+    are kept and which of them the brain is trained on:
+
+    | Option | Description |
+    |--------|-------------|
+    | max_rows | Number of most recent data points kept. |
+    | max_age_days | Days after which data points are removed. |
+    | downsample_seconds | Of data points closer together than these seconds only the last one is kept. |
+    | window_rows | Number of most recent data points the brain is trained on. |
+    | window_days | Days of most recent data points the brain is trained on. |
+
+    Data points are removed in the background after every 100 new data
+    points, never during a request. The window only limits the data points
+    the brain is trained on, it removes none of them.
+    """  # noqa: E501 — the table renders as markdown, do not rewrap
+
+    max_rows: Optional[int] = Field(default=None, ge=10, examples=[100000])
+    max_age_days: Optional[float] = Field(default=None, gt=0.0, examples=[365.0])
+    downsample_seconds: Optional[float] = Field(default=None, gt=0.0, examples=[60.0])
+    window_rows: Optional[int] = Field(default=None, ge=10, examples=[10000])
+    window_days: Optional[float] = Field(default=None, gt=0.0, examples=[90.0])
+
+    @property
+    def removes_data(self) -> bool:
+        return (
+            self.max_rows is not None
+            or self.max_age_days is not None
+            or self.downsample_seconds is not None
+        )
+
+
+class BrainPredictionCacheConfiguration(LHBaseModel):
+    """
+    Brains asked again and again for predictions of nearly the same data,
+    e.g. by a controller polling every minute, can keep their recent
+    predictions. A request whose features equal those of a kept prediction
+    is answered without asking the decision trees:
+
+    | Option | Description |
+    |--------|-------------|
+    | size | Number of predictions kept, the least recently used ones are dropped first. 0 disables the cache. |
+    | quantization | Step of numerical features, e.g. `{"azimuth": 1.0}`. Values rounding to the same step share their prediction. |
+
+    The kept predictions are dropped whenever the brain is trained again.
+    Like the estimator options, changes take effect with the next training.
+    """  # noqa: E501 — the table renders as markdown, do not rewrap
+
+    size: int = Field(default=0, ge=0, examples=[1000])
+    quantization: Dict[str, PositiveFloat] = Field(
+        default_factory=dict, examples=[{"azimuth": 1.0, "elevation": 0.5}]
+    )
 
 
 class BrainConfiguration(LHBaseModel):
@@ -91,6 +219,15 @@ class BrainConfiguration(LHBaseModel):
     Estimator:
     See BrainEstimatorConfiguration
 
+    Training:
+    See BrainTrainingConfiguration
+
+    Retention:
+    See BrainRetentionConfiguration
+
+    Prediction cache:
+    See BrainPredictionCacheConfiguration
+
     Dependent variable:
     The `dependent` variable is the one that have to be in the training data
     and which is predicted by the trained brain.
@@ -115,6 +252,15 @@ class BrainConfiguration(LHBaseModel):
     estimator: BrainEstimatorConfiguration
     dependent_encode: bool = Field(default=False)
     test_size: float = Field(default=0.2, gt=0.0, examples=[0.2, 20])
+    training: BrainTrainingConfiguration = Field(
+        default_factory=BrainTrainingConfiguration
+    )
+    retention: BrainRetentionConfiguration = Field(
+        default_factory=BrainRetentionConfiguration
+    )
+    prediction_cache: BrainPredictionCacheConfiguration = Field(
+        default_factory=BrainPredictionCacheConfiguration
+    )
 
     @classmethod
     def from_json_file(cls, name: str) -> BrainConfiguration:
@@ -166,6 +312,84 @@ class BrainInfo(LHBaseModel):
     actual_versions: bool = Field(default=True)
 
 
+class BrainTrainingState(EnumModel):
+    IDLE = "idle"
+    PENDING = "pending"
+    RUNNING = "running"
+
+    def __init__(self, state: str):
+        # pylint: disable=super-init-not-called
+        self._state: str = state
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+
+class BrainTrainingStatus(LHBaseModel):
+    """
+    State of the background training of a brain. `pending_samples` counts the
+    data points stored since the last training started. `importing_samples`
+    counts the data points read so far by a running bulk import.
+    """
+
+    name: str = Field(..., examples=["darkness"])
+    state: BrainTrainingState = Field(..., examples=[BrainTrainingState.PENDING])
+    pending_samples: int = Field(default=0, examples=[3])
+    importing_samples: Optional[int] = Field(default=None, examples=[None])
+    started_at: Optional[datetime] = Field(default=None)
+    finished_at: Optional[datetime] = Field(default=None)
+    error: Optional[str] = Field(default=None)
+
+
+class BrainImportFormat(EnumModel):
+    """
+    Formats of the data points of a bulk import, by the content type of the
+    request body.
+    """
+
+    CSV = "csv", "text/csv"
+    NDJSON = "ndjson", "application/x-ndjson"
+
+    def __init__(self, typed: str, content_type: str):
+        # pylint: disable=super-init-not-called
+        self._typed: str = typed
+        self._content_type: str = content_type
+
+    @property
+    def content_type(self) -> str:
+        return self._content_type
+
+    @classmethod
+    def from_content_type(cls, content_type: str) -> Optional[BrainImportFormat]:
+        media_type = content_type.split(";")[0].strip().lower()
+        for item in cls.__members__.values():
+            if item.content_type == media_type:
+                return item
+
+        return None
+
+
+class BrainImportResult(LHBaseModel):
+    """
+    The result of a bulk import of data points. `brain` holds the
+    information of the brain after the training following the import, or
+    before it with background training."""
+
+    brain: BrainInfo
+    imported_samples: int = Field(..., examples=[525600])
+
+
+class BrainStreamResult(LHBaseModel):
+    """
+    The result of a stream of data points, when the client ended it.
+    `brain` holds the information of the brain after the last batch."""
+
+    brain: BrainInfo
+    stored_samples: int = Field(..., examples=[17280])
+    batches: int = Field(..., examples=[173])
+
+
 class BrainInfos(DictModel):
     """A dictionary of all available brains."""
 
@@ -179,8 +403,14 @@ class BrainFileType(EnumModel):
 
     CONFIG_FILE = "config", "config.json"
     TRAINED_FILE = "trained", "trained.pkl"
+    FOREST_FILE = "forest", "trained.forest"
     INFO_FILE = "info", "info.json"
     TRAINING_DATA_FILE = "data", "training_data.csv"
+    TRAINING_DATA_ROWS_FILE = "rows", "training_data.rows"
+    TRAINING_DATA_COLUMNS = "columns", "training_data"
+    TRAINING_DATA_SQLITE_FILE = "sqlite", "training_data.sqlite"
+    TRAINING_DATA_LOCK_FILE = "data_lock", "training_data.lock"
+    TRAINING_LOCK_FILE = "training_lock", "training.lock"
     ALL = "all", ""
 
     def __init__(self, typed: str, filename: str):
@@ -198,6 +428,13 @@ class BrainFileType(EnumModel):
 
 
 class Brain:
+    # Trainings since the forest was fitted completely. Brains trained
+    # before incremental training existed are unpickled without it.
+    incremental_trainings: int = 0
+
+    # Forest of a brain loaded with a memory map, see MappedForest.
+    _forest: Optional[MappedForest] = None
+
     def __init__(self, name: str):
         self.name: str = name
         self.brains_directory: Path = service_settings().brains_directory
@@ -214,6 +451,9 @@ class Brain:
         self.trained_at: Optional[datetime] = None
 
     def estimator(self) -> RandomForestClassifier | RandomForestRegressor:
+        if self._forest is not None:
+            self._forest.materialize(self._estimator)
+
         if self._estimator is None:
             self._estimator = self.configuration.estimator.typed.estimator_class(
                 n_estimators=self.configuration.estimator.estimators,
@@ -223,6 +463,47 @@ class Brain:
 
         return self._estimator
 
+    @property
+    def forest(self) -> Optional[MappedForest]:
+        return self._forest
+
+    @property
+    def uses_feature_names(self) -> bool:
+        """The estimator was fitted on a DataFrame and predicts DataFrames."""
+        return hasattr(self._estimator, "feature_names_in_")
+
+    def predict(self, data: Any) -> np.ndarray:
+        """
+        Predict with the memory mapped forest if the brain was loaded with
+        one, otherwise with the estimator.
+        """
+        if self._forest is not None:
+            return self._forest.predict(self._estimator, data)
+
+        return self.estimator().predict(data)
+
+    def warm_start_copy(self, replaced: int) -> Brain:
+        """
+        A copy of this trained brain for incremental training. Its estimator
+        keeps all but the `replaced` oldest trees and fits `replaced` new
+        trees with `warm_start`. The kept trees are shared, not copied.
+        """
+        brain = copy.copy(self)
+        brain.dataset = copy.copy(self.dataset)
+
+        trees = self.estimator().estimators_[replaced:]
+        estimator = cast(
+            RandomForestClassifier | RandomForestRegressor, clone(self.estimator())
+        )
+        estimator.set_params(n_estimators=len(trees) + replaced, warm_start=True)
+        estimator.estimators_ = list(trees)
+
+        brain._estimator = estimator
+        brain._forest = None
+        brain.incremental_trainings = self.incremental_trainings + 1
+
+        return brain
+
     @property
     def actual_versions(self) -> bool:
         return self.versions == versions
@@ -243,18 +524,49 @@ class Brain:
         return info
 
     @classmethod
-    def load_trained(cls, name: str) -> Brain:
+    def load_trained(cls, name: str, mapped: bool = False) -> Brain:
+        """
+        Load a trained brain. A brain loaded `mapped` predicts on the memory
+        mapped forest file, which all processes loading it share.
+        """
         try:
             if not cls.is_trained(name):
                 raise BrainNotTrained(name)
 
             filename = Brain.sanitize_filename(name, BrainFileType.TRAINED_FILE)
+            forest_filename = Brain.sanitize_filename(name, BrainFileType.FOREST_FILE)
+
+            # A training storing the brain meanwhile replaces the forest file
+            # between reading the header and the forest, read both again.
+            for _ in range(LOAD_ATTEMPTS - 1):
+                try:
+                    return BrainArtifact.load(filename, forest_filename, mapped)
+                except ForestMismatch:
+                    pass
+
+            return BrainArtifact.load(filename, forest_filename, mapped)
+        except (
+            AttributeError,
+            ModuleNotFoundError,
+            KeyError,
+            ForestMismatch,
+        ) as exception:
+            raise BrainNotTrained(name) from exception
 
-            loaded_brain = joblib.load(filename)
+    @classmethod
+    def load_info(cls, name: str) -> BrainInfo:
+        """
+        Information of a trained brain from its info.json, without loading the
+        trained brain itself.
+        """
+        filename = Brain.sanitize_filename(name, BrainFileType.INFO_FILE)
 
-            return loaded_brain
-        except (AttributeError, ModuleNotFoundError, KeyError) as exception:
-            raise BrainNotTrained(name) from exception
+        with open(filename, "r", encoding="utf-8") as info_file:
+            info = BrainInfo(**json.load(info_file))
+
+        info.actual_versions = info.versions == versions
+
+        return info
 
     @classmethod
     def is_trained(cls, name: str) -> bool:
@@ -269,12 +581,16 @@ class Brain:
         self.score = score
         self.trained_at = datetime.now()
 
-        filename = Brain.sanitize_filename(
-            self.name, BrainFileType.TRAINED_FILE, self.brains_directory
+        BrainArtifact.dump(
+            self,
+            Brain.sanitize_filename(
+                self.name, BrainFileType.TRAINED_FILE, self.brains_directory
+            ),
+            Brain.sanitize_filename(
+                self.name, BrainFileType.FOREST_FILE, self.brains_directory
+            ),
         )
 
-        joblib.dump(self, filename)
-
         filename = Brain.sanitize_filename(
             self.name, BrainFileType.INFO_FILE, self.brains_directory
         )
@@ -386,6 +702,153 @@ class BrainPredictionResult(LHBaseModel):
     prediction: StrictBool | StrictInt | StrictFloat = Field(..., examples=[False])
 
 
+class BrainPredictionsRequest(ListModel):
+    """
+    For predicting many datasets at once send a POST request with a list of
+    datasets. Each dataset looks like the one of a single prediction.
+    """
+
+    root: List[Dict[str, StrictBool | StrictInt | StrictFloat | str | None]] = Field(
+        ...,
+        examples=[
+            [
+                {
+                    "azimuth": 321.4441223144531,
+                    "elevation": -19.691608428955078,
+                    "pressure_trend_1h": "falling",
+                },
+                {
+                    "azimuth": 95.1234130859375,
+                    "elevation": 12.502197265625,
+                    "pressure_trend_1h": "rising",
+                },
+            ]
+        ],
+    )
+
+
+class BrainPredictionsItem(LHBaseModel):
+    """
+    The prediction of one dataset of a batch prediction request."""
+
+    preprocessed: Dict[str, StrictBool | StrictInt | StrictFloat | str] = Field(
+        ...,
+        examples=[
+            {
+                "azimuth": 321.4441223144531,
+                "elevation": -19.691608428955078,
+                "pressure_trend_1h_falling": 1,
+            }
+        ],
+    )
+    prediction: StrictBool | StrictInt | StrictFloat = Field(..., examples=[False])
+
+
+class BrainPredictionsResult(LHBaseModel):
+    """
+    The result of a batch prediction request. Holds one prediction per
+    dataset in the order of the request."""
+
+    brain: BrainInfo
+    predictions: List[BrainPredictionsItem]
+
+
+class BrainsPredictionRequest(LHBaseModel):
+    """
+    For predicting one dataset with many brains at once send a POST request
+    with the dataset and the names of the brains. Without names all trained
+    brains are used.
+    """
+
+    sensors_data: Dict[str, StrictBool | StrictInt | StrictFloat | str | None] = Field(
+        ...,
+        examples=[
+            {
+                "azimuth": 321.4441223144531,
+                "elevation": -19.691608428955078,
+                "pressure_trend_1h": "falling",
+                "temperature_outside": 23.0,
+            }
+        ],
+    )
+    brains: Optional[List[str]] = Field(
+        default=None, examples=[["darkness", "heating_setpoint"]]
+    )
+
+
+class BrainsPredictionResult(LHBaseModel):
+    """
+    The result of a prediction request for many brains. Brains which could
+    not predict the dataset are listed with their error instead."""
+
+    predictions: Dict[str, BrainPredictionResult] = Field(default_factory=dict)
+    errors: Dict[str, LearningHouseErrorMessage] = Field(
+        default_factory=dict,
+        examples=[
+            {
+                "shutter": {
+                    "error": "NOT_TRAINED",
+                    "description": "The brain with name shutter is not trained",
+                }
+            }
+        ],
+    )
+
+
+class BrainModelCacheMetrics(LHBaseModel):
+    """
+    State of the cache of trained brains of the worker process which
+    answered the request. `size_bytes` counts the tree nodes of the cached
+    brains."""
+
+    entries: int = Field(..., examples=[3])
+    size_bytes: int = Field(..., examples=[5242880])
+    max_entries: int = Field(..., examples=[32])
+    max_bytes: int = Field(..., examples=[1073741824])
+    hits: int = Field(..., examples=[1234])
+    misses: int = Field(..., examples=[3])
+    evictions: int = Field(..., examples=[0])
+
+
+class BrainMemoryMetrics(LHBaseModel):
+    """
+    Memory of the decision trees of a brain in the cache of the worker
+    process which answered the request. `mapped_bytes` is the size of the
+    trees in the memory mapped trained.forest file. Of its pages in memory,
+    `shared_bytes` are mapped by other processes too, e.g. the other
+    workers. `private_bytes` are the pages only this process maps plus the
+    trees copied into memory of this process, by loading the brain without
+    memory map or by training it incrementally."""
+
+    mapped_bytes: int = Field(..., examples=[52428800])
+    shared_bytes: int = Field(..., examples=[52428800])
+    private_bytes: int = Field(..., examples=[0])
+
+
+class BrainPredictionCacheMetrics(LHBaseModel):
+    """
+    State of the kept predictions of a brain in the worker process which
+    answered the request. `hit_rate` is the share of predictions answered
+    from the cache since the worker started."""
+
+    entries: int = Field(..., examples=[120])
+    max_entries: int = Field(..., examples=[1000])
+    hits: int = Field(..., examples=[4321])
+    misses: int = Field(..., examples=[123])
+    hit_rate: float = Field(..., examples=[0.97])
+
+
+class BrainMetrics(LHBaseModel):
+    """
+    Metrics of the worker process which answered the request."""
+
+    model_cache: BrainModelCacheMetrics
+    memory: Dict[str, BrainMemoryMetrics] = Field(default_factory=dict)
+    prediction_cache: Dict[str, BrainPredictionCacheMetrics] = Field(
+        default_factory=dict
+    )
+
+
 class BrainDeleteResult(LHBaseModel):
     """
     The result of a delete request."""
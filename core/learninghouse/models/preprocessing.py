@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List, Optional
+import math
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 import numpy as np
 from sklearn.impute import SimpleImputer
@@ -10,12 +11,102 @@ if TYPE_CHECKING:
     from learninghouse.models.brain import BrainConfiguration
 
 
+class FeaturePlan:
+    """
+    Compiled form of DatasetPreprocessing.prepare_prediction for one trained
+    brain.
+
+    Maps a prediction request straight into a float64 row with the columns of
+    the trained brain: numerical sensors are copied and missing ones filled
+    with the imputer means, categorical sensors set the one-hot column of
+    their value. The plan is only valid for the sensors configuration it was
+    compiled with (`categoricals` and `numericals`).
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        categoricals: List[str],
+        numericals: List[str],
+        numerical_index: Dict[str, int],
+        one_hot_index: Dict[str, Dict[str, int]],
+        defaults: np.ndarray,
+    ):
+        self.columns: List[str] = columns
+        self.categoricals: List[str] = categoricals
+        self.numericals: List[str] = numericals
+        self.numerical_index: Dict[str, int] = numerical_index
+        self.one_hot_index: Dict[str, Dict[str, int]] = one_hot_index
+        self.defaults: np.ndarray = defaults
+        self.one_hot_columns: List[bool] = [False] * len(columns)
+        for values in one_hot_index.values():
+            for index in values.values():
+                self.one_hot_columns[index] = True
+
+    def compiled_for(self, categoricals: List[str], numericals: List[str]) -> bool:
+        return self.categoricals == categoricals and self.numericals == numericals
+
+    def transform(self, rows: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        The prepared rows of shape (len(rows), columns) or None, if a request
+        holds a value the plan does not cover the way the pandas path does,
+        e.g. a string for a numerical sensor.
+        """
+        matrix = np.tile(self.defaults, (len(rows), 1))
+
+        for row, data in zip(matrix, rows):
+            if not self._fill(row, data):
+                return None
+
+        return matrix
+
+    def _fill(self, row: np.ndarray, data: Dict[str, Any]) -> bool:
+        for column, index in self.numerical_index.items():
+            value = data.get(column)
+            if value is None:
+                continue
+
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return False
+
+            if not math.isnan(value):
+                row[index] = value
+
+        for column, values in self.one_hot_index.items():
+            value = data.get(column)
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+
+            index = values.get(str(value))
+            if index is not None:
+                row[index] = 1.0
+
+        return True
+
+    def preprocessed(self, row: np.ndarray) -> Dict[str, Any]:
+        """The prepared row as DataFrame.to_dict of the pandas path gives it."""
+        # A one-hot column is True for the value of the request and 0 for
+        # all other values, like reindex(fill_value=0) after get_dummies.
+        return {
+            column: (bool(value) or 0) if one_hot else float(value)
+            for column, value, one_hot in zip(
+                self.columns, row.tolist(), self.one_hot_columns
+            )
+        }
+
+
 class DatasetConfiguration:
     dependent_encoder: Optional[LabelEncoder] = None
     imputer: SimpleImputer
     data_size: int = 0
     features: Optional[List[str]] = None
     columns: Optional[List[str]] = None
+    # Brains trained before the plan existed are unpickled without it.
+    plan: Optional[FeaturePlan] = None
+    # Importance of every column the features were selected from, and the
+    # number of trainings which reused them since.
+    importances: Optional[Dict[str, float]] = None
+    importances_reused: int = 0
 
     def __init__(self, brain_config: BrainConfiguration):
         self.dependent_encoder = (
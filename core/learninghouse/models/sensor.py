@@ -1,14 +1,20 @@
 from __future__ import annotations
 
 import json
-from os import path
-from typing import List
+from functools import lru_cache
+from itertools import count
+from os import stat
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
 
-from pydantic import Field
+from pydantic import Field, StrictBool, StrictFloat, StrictInt
 
 from learninghouse.core.logger import logger
 from learninghouse.core.settings import service_settings
 from learninghouse.models.base import (
+    DictModel,
     EnumModel,
     LHBaseModel,
     ListModel,
@@ -60,20 +66,38 @@ class Sensors(ListModel):
 
     @classmethod
     def load_config(cls) -> Sensors:
-        filename = service_settings().brains_directory / "sensors.json"
+        _, sensors = cls.cached_config()
+        return sensors.model_copy(deep=True)
+
+    @classmethod
+    def cached_config(cls) -> Tuple[int, Sensors]:
+        """
+        The sensors configuration shared by the whole process, together with
+        its generation. The returned Sensors must not be changed, use
+        `load_config` to get a copy which can be changed and written.
+        """
+        return sensors_cache().get(cls.filename())
+
+    @classmethod
+    def read_config(cls, filename: Path) -> Sensors:
         sensors = []
 
-        if path.exists(filename):
+        try:
             with open(filename, "r", encoding="utf-8") as sensorfile:
                 sensors = json.load(sensorfile)
-        else:
+        except FileNotFoundError:
             logger.warning("No sensors.json found")
 
         return Sensors(sensors)
 
     def write_config(self) -> None:
-        filename = service_settings().brains_directory / "sensors.json"
+        filename = self.filename()
         self.write_to_file(filename, indent=4)
+        sensors_cache().put(filename, self.model_copy(deep=True))
+
+    @staticmethod
+    def filename() -> Path:
+        return service_settings().brains_directory / "sensors.json"
 
     @property
     def numericals(self) -> List[str]:
@@ -94,5 +118,111 @@ class Sensors(ListModel):
         )
 
 
+FileSignature = Optional[Tuple[int, int, int]]
+
+
+class SensorsCacheEntry:
+    def __init__(self, signature: FileSignature, sensors: Sensors, generation: int):
+        self.signature: FileSignature = signature
+        self.sensors: Sensors = sensors
+        self.generation: int = generation
+        self.checked: float = monotonic()
+
+
+class SensorsCache:
+    """
+    Process wide cache of the parsed sensors.json.
+
+    Training and prediction need the sensors configuration on every call.
+    Instead of opening and parsing the file each time, the parsed
+    configuration is kept in memory. Writes through `Sensors.write_config`
+    replace the cached configuration at once. Changes by anything else -
+    another worker process or an edit by hand - are detected by comparing
+    modification time, inode and size of the file, at most every
+    `check_interval` seconds, so calls in between do not touch the file
+    system at all.
+
+    Every change of the cached configuration gets a new generation, which
+    lets callers keep values derived from the configuration until it changes.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval: float = check_interval
+        self._entries: Dict[Path, SensorsCacheEntry] = {}
+        self._generations = count(1)
+        self._lock = Lock()
+
+    def get(self, filename: Path) -> Tuple[int, Sensors]:
+        with self._lock:
+            entry = self._entries.get(filename)
+            now = monotonic()
+
+            if entry is not None and now - entry.checked < self.check_interval:
+                return entry.generation, entry.sensors
+
+            signature = self.signature(filename)
+            if entry is None or entry.signature != signature:
+                entry = SensorsCacheEntry(
+                    signature, Sensors.read_config(filename), next(self._generations)
+                )
+                self._entries[filename] = entry
+            else:
+                entry.checked = now
+
+            return entry.generation, entry.sensors
+
+    def put(self, filename: Path, sensors: Sensors) -> None:
+        with self._lock:
+            self._entries[filename] = SensorsCacheEntry(
+                self.signature(filename), sensors, next(self._generations)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def signature(filename: Path) -> FileSignature:
+        try:
+            stat_result = stat(filename)
+        except FileNotFoundError:
+            return None
+
+        return (stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_size)
+
+
+@lru_cache()
+def sensors_cache() -> SensorsCache:
+    return SensorsCache(service_settings().sensors_cache_check_seconds)
+
+
 class SensorDeleteResult(LHBaseModel):
     name: str = Field(..., examples=["azimuth"])
+
+
+class SensorState(DictModel):
+    """
+    Current values of the sensors. A PUT request updates the values it
+    holds and keeps the other ones.
+    """
+
+    root: Dict[str, StrictBool | StrictInt | StrictFloat | str | None] = Field(
+        ...,
+        examples=[
+            {
+                "azimuth": 321.4441223144531,
+                "elevation": -19.691608428955078,
+                "pressure_trend_1h": "falling",
+            }
+        ],
+    )
+
+
+class SensorStateResult(LHBaseModel):
+    """
+    The sensors whose values changed and the subscribed brains which
+    predicted again because of them.
+    """
+
+    changed: List[str] = Field(..., examples=[["azimuth", "elevation"]])
+    predicted: List[str] = Field(..., examples=[["darkness"]])
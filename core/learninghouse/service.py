@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import uvicorn
@@ -23,12 +24,28 @@ from learninghouse.errors import (
     validation_error_handler,
 )
 from learninghouse.services.auth import INITIAL_PASSWORD_WARNING, auth_service_cached
+from learninghouse.services.brain import BrainService
+from learninghouse.services.executor import run_prediction, shutdown_executors
+from learninghouse.services.model_cache import shutdown_model_watcher
+from learninghouse.services.training import shutdown_training_scheduler
 
 APP_REFERENCE = "learninghouse.service:app"
 
 STATIC_DIRECTORY = str(Path(__file__).parent / "static")
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    preload = service_settings().model_cache_preload_names
+    if preload:
+        await run_prediction(BrainService.preload, preload)
+
+    yield
+    shutdown_model_watcher()
+    shutdown_training_scheduler()
+    shutdown_executors()
+
+
 def get_application(settings: ServiceSettings | None = None) -> FastAPI:
     if settings is None:
         settings = service_settings()
@@ -37,7 +54,7 @@ def get_application(settings: ServiceSettings | None = None) -> FastAPI:
 
     initialize_logging(settings.logging_level)
 
-    application = FastAPI(**settings.fastapi_kwargs)
+    application = FastAPI(**settings.fastapi_kwargs, lifespan=lifespan)
     application.include_router(api)
 
     if settings.docs_url:
@@ -1,15 +1,22 @@
+import hmac
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from functools import lru_cache
-from typing import Dict, List, Tuple, Union
+from hashlib import sha256
+from secrets import token_bytes
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Tuple, Union
 
 import jwt
-from fastapi import Depends, Security
+from fastapi import Depends, Security, WebSocket, WebSocketException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.security.api_key import APIKeyHeader, APIKeyQuery
 
 from learninghouse.core.logger import logger
 from learninghouse.core.settings import service_settings
 from learninghouse.errors import (
+    LearningHouseException,
     LearningHouseSecurityException,
     LearningHouseUnauthorizedException,
 )
@@ -39,10 +46,78 @@ See https://github.com/LearningHouseService/learninghouse-monorepo/tree/main/lea
 """
 
 
+class APIKeyCache:
+    """Bounded cache of API keys which already passed verification.
+
+    `SecurityDatabase.find_apikey_by_key` hashes the presented key with
+    sha512_crypt at several hundred thousand rounds, which costs hundreds of
+    milliseconds on small hosts for every single request. Successful
+    verifications are remembered here for `ttl` seconds, keyed by an HMAC of
+    the raw key under a secret that only lives in this process, so the cache
+    never holds a key in plain text nor anything usable outside the service.
+    Failed verifications are never cached.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        self._secret: bytes = token_bytes(32)
+        self._entries: OrderedDict[bytes, Tuple[float, APIKeyInfo]] = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def digest(self, key: str) -> bytes:
+        return hmac.new(self._secret, key.encode("utf-8"), sha256).digest()
+
+    def get(self, key: str) -> Optional[APIKeyInfo]:
+        if not self.enabled:
+            return None
+
+        digest = self.digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+
+            expires, api_key_info = entry
+            if expires < monotonic():
+                del self._entries[digest]
+                return None
+
+            self._entries.move_to_end(digest)
+            return api_key_info
+
+    def put(self, key: str, api_key_info: APIKeyInfo) -> None:
+        if not self.enabled:
+            return
+
+        digest = self.digest(key)
+        with self._lock:
+            self._entries[digest] = (monotonic() + self.ttl, api_key_info)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
 class AuthServiceInternal:
     def __init__(self):
+        settings = service_settings()
+
         self.database = SecurityDatabase.load_or_write_default()
         self.refresh_tokens: Dict[str, datetime] = {}
+        self.apikey_cache = APIKeyCache(
+            settings.apikey_cache_size, settings.apikey_cache_ttl_seconds
+        )
 
     @property
     def is_initial_admin_password(self) -> bool:
@@ -136,6 +211,7 @@ class AuthServiceInternal:
     def create_apikey(self, request: APIKeyRequest) -> APIKey:
         api_key = self.database.create_apikey(request)
         self.database.write()
+        self.apikey_cache.clear()
 
         logger.info(f"New API key for {request.description} added")
 
@@ -144,13 +220,27 @@ class AuthServiceInternal:
     def delete_apikey(self, description: str) -> str:
         confirm = self.database.delete_apikey(description)
         self.database.write()
+        self.apikey_cache.clear()
 
         logger.info(f"Removed API key for {description}.")
 
         return confirm
 
+    def find_apikey_by_key(self, key: str) -> Union[APIKeyInfo, None]:
+        api_key_info = self.apikey_cache.get(key)
+
+        if api_key_info is None:
+            api_key_info = self.database.find_apikey_by_key(key)
+            if api_key_info is not None:
+                self.apikey_cache.put(key, api_key_info)
+
+        return api_key_info
+
     def is_admin_user_or_trainer(
-        self, credentials: HTTPAuthorizationCredentials, query: str, header: str
+        self,
+        credentials: Optional[HTTPAuthorizationCredentials],
+        query: Optional[str],
+        header: Optional[str],
     ) -> UserRole:
         role: UserRole
 
@@ -163,7 +253,7 @@ class AuthServiceInternal:
             if not key:
                 raise LearningHouseSecurityException("Invalid credentials")
 
-            api_key_info = self.database.find_apikey_by_key(key)
+            api_key_info = self.find_apikey_by_key(key)
             if not api_key_info:
                 raise LearningHouseUnauthorizedException()
 
@@ -308,3 +398,34 @@ async def protect_trainer(
         raise LearningHouseUnauthorizedException()
 
     return role
+
+
+async def protect_user_websocket(
+    websocket: WebSocket,
+    auth_service: AuthServiceInternal = Depends(auth_service_cached),
+) -> UserRole:
+    """
+    protect_user for a WebSocket, checked once when the connection is opened.
+    The security schemes above only read plain requests, so the JWT, the
+    `api_key` query parameter and the API key header are read here.
+    Credentials which do not pass close the connection with policy violation.
+    """
+    credentials = None
+    scheme, _, token = websocket.headers.get("Authorization", "").partition(" ")
+    if token:
+        credentials = HTTPAuthorizationCredentials(scheme=scheme, credentials=token)
+
+    try:
+        if auth_service.is_initial_admin_password:
+            raise LearningHouseUnauthorizedException("Change initial password.")
+
+        return auth_service.is_admin_user_or_trainer(
+            credentials,
+            websocket.query_params.get("api_key"),
+            websocket.headers.get(API_KEY_NAME),
+        )
+    except LearningHouseException as exc:
+        logger.warning(exc.error.description)
+        raise WebSocketException(
+            status.WS_1008_POLICY_VIOLATION, exc.error.description
+        ) from exc
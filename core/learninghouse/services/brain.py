@@ -1,15 +1,22 @@
 from __future__ import annotations
 
-from os import listdir, path, stat
+import asyncio
+from functools import partial
+from os import listdir, path
 from shutil import rmtree
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, cast
 
+import numpy as np
 import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.feature_selection import SelectFromModel
 from sklearn.metrics import accuracy_score
 
 from learninghouse.core.logger import logger
 from learninghouse.core.settings import service_settings
+from learninghouse.core.settings.models import ModelCacheValidation
+from learninghouse.errors import LearningHouseException
 from learninghouse.errors.brain import (
     BrainBadRequest,
     BrainExists,
@@ -23,21 +30,41 @@ from learninghouse.models.brain import (
     BrainConfiguration,
     BrainDeleteResult,
     BrainEstimatorType,
+    BrainFeatureSelection,
     BrainFileType,
+    BrainImportResult,
     BrainInfo,
     BrainInfos,
+    BrainMetrics,
     BrainPredictionResult,
+    BrainPredictionsItem,
+    BrainPredictionsResult,
+    BrainsPredictionResult,
+    BrainTrainingStatus,
 )
+from learninghouse.services.coordination import TrainingLock
+from learninghouse.services.executor import cpu_budget, run_prediction
+from learninghouse.services.model_cache import (
+    file_signature,
+    model_cache,
+    model_watcher,
+)
+from learninghouse.services.prediction_cache import prediction_cache
 from learninghouse.services.preprocessing import DatasetPreprocessing
+from learninghouse.services.retention import (
+    TrainingDataRetention,
+    compaction_scheduler,
+)
+from learninghouse.services.training import training_scheduler
+from learninghouse.services.training_data import TrainingData
 
+# Size of the forest and of the sample of the training data the feature
+# importances are taken from with feature selection `surrogate`.
+SURROGATE_ESTIMATORS = 10
+SURROGATE_SAMPLES = 10000
 
-class BrainService:
-    # Keyed by (brains_directory, name), not name alone - two different
-    # brains directories in the same process (Phase 2 de-globalization) can
-    # each have a brain of the same name, and a name-only key would serve the
-    # wrong one.
-    brains: Dict[Tuple[str, str], Tuple[float, Brain]] = {}
 
+class BrainService:
     @classmethod
     def list_all(cls) -> BrainInfos:
         brains: Dict[str, BrainInfo] = {}
@@ -51,22 +78,23 @@ class BrainService:
 
     @staticmethod
     def get_info(name: str) -> BrainInfo:
+        # Only small reads: info.json of trained brains and the row counter
+        # of the training data otherwise. Loading the trained brain is the
+        # fallback for a missing or unreadable info.json.
         info: Optional[BrainInfo] = None
         if Brain.is_trained(name):
             try:
-                info = Brain.load_trained(name).info
-            except (AttributeError, BrainNotTrained):
-                pass
+                info = Brain.load_info(name)
+            except (FileNotFoundError, ValueError):
+                try:
+                    info = Brain.load_trained(name).info
+                except (AttributeError, BrainNotTrained):
+                    pass
 
         if info is None:
             if BrainConfiguration.json_config_file_exists(name):
                 info = Brain(name).info
-                training_data_file = Brain.sanitize_filename(
-                    name, BrainFileType.TRAINING_DATA_FILE
-                )
-                if path.exists(training_data_file):
-                    data = pd.read_csv(training_data_file)
-                    info.training_data_size = len(data.index)
+                info.training_data_size = TrainingData.open(name).rows()
             else:
                 raise BrainNoConfiguration(name)
 
@@ -79,7 +107,7 @@ class BrainService:
         dependent_value: Optional[Any] = None,
         sensors_data: Optional[Dict[str, Any]] = None,
     ) -> BrainInfo:
-        filename = Brain.sanitize_filename(name, BrainFileType.TRAINING_DATA_FILE)
+        training_data = TrainingData.open(name)
 
         trainings_data: Optional[Dict[str, Any]] = sensors_data
 
@@ -92,23 +120,51 @@ class BrainService:
             sensors_data[name] = dependent_value
 
         if trainings_data is None:
-            if path.exists(filename):
-                data = pd.read_csv(filename)
-            else:
+            if not training_data.exists():
                 raise BrainNotEnoughData()
         else:
             logger.debug(trainings_data)
             trainings_data = DatasetPreprocessing.add_time_information(trainings_data)
-            if path.exists(filename):
-                data_temp = pd.read_csv(filename)
-                df_new_row = pd.DataFrame([trainings_data])
-                data = pd.concat([data_temp, df_new_row], ignore_index=True)
-            else:
-                data = pd.DataFrame([trainings_data])
+            return cls.store(name, [trainings_data])
+
+        return cls.train_stored(name)
 
-            data.to_csv(filename, sep=",", index=False)
+    @classmethod
+    def store(
+        cls,
+        name: str,
+        samples: List[Dict[str, Any]],
+        complete: bool = False,
+        background: bool = False,
+    ) -> BrainInfo:
+        """
+        Store new data points, which hold their time information already,
+        with one write and train the brain on them - in the background if
+        its training configuration or `background` asks for it. A `complete`
+        training fits the complete forest even with incremental training.
+        """
+        configuration = BrainConfigurationService.get(name)
+        training = configuration.training
 
-        return cls.train(name, data)
+        TrainingData.open(name).append_many(samples)
+        stored = TrainingLock.now()
+        compaction_scheduler().notify(name, configuration.retention, len(samples))
+
+        train_method = cls.train_stored if complete else cls.train_new_data
+        train = partial(train_method, name, stored)
+
+        if training.background or background:
+            training_scheduler().notify(name, training, train, len(samples))
+            return cls.get_info(name)
+
+        return train()
+
+    @staticmethod
+    def training_status(name: str) -> BrainTrainingStatus:
+        if not BrainConfiguration.json_config_file_exists(name):
+            raise BrainNoConfiguration(name)
+
+        return training_scheduler().status(name)
 
     @staticmethod
     def train(name: str, data: pd.DataFrame) -> BrainInfo:
@@ -118,90 +174,489 @@ class BrainService:
             if len(data.index) < 10:
                 raise BrainNotEnoughData()
 
-            (
-                brain,
-                x_train,
-                x_test,
-                y_train,
-                y_test,
-            ) = DatasetPreprocessing.prepare_training(brain, data, False)
+            with cpu_budget().reserve(brain.configuration.estimator.jobs) as jobs:
+                brain.estimator().set_params(n_jobs=jobs)
+
+                (
+                    brain,
+                    x_train,
+                    x_test,
+                    y_train,
+                    y_test,
+                ) = DatasetPreprocessing.prepare_training(brain, data, False)
+
+                brain.dataset.features = BrainService.select_features(
+                    brain, x_train, y_train
+                )
+                estimator = brain.estimator()
+
+                (
+                    brain,
+                    x_train,
+                    x_test,
+                    y_train,
+                    y_test,
+                ) = DatasetPreprocessing.prepare_training(brain, data, True)
+
+                # Fitted without column names, so predictions can be made on the
+                # plain rows of the compiled feature plan.
+                estimator.fit(x_train.to_numpy(dtype=np.float64), y_train)
+
+                score = BrainService.score(
+                    brain, x_test.to_numpy(dtype=np.float64), y_test
+                )
+
+            # Predictions run on one thread each, next to other predictions.
+            estimator.set_params(n_jobs=None)
 
-            estimator = brain.estimator()
+            columns = x_train.columns.tolist()
+            brain.dataset.plan = DatasetPreprocessing.compile_plan(brain, columns)
+            brain.store_trained(columns, len(data.index), score)
+            model_watcher().bump(BrainService.cache_key(name))
 
-            selector = SelectFromModel(estimator)
-            selector.fit(x_train, y_train)
+            return brain.info
+        except FileNotFoundError as exc:
+            raise BrainNoConfiguration(name) from exc
+
+    @classmethod
+    def import_training_data(
+        cls, name: str, samples: List[Dict[str, Any]]
+    ) -> BrainImportResult:
+        """
+        Store the data points of a bulk import with one write and train the
+        brain once on all stored data points. The complete forest is fitted
+        even with incremental training, the imported data points are rarely
+        the most recent ones.
+        """
+        if not samples:
+            return BrainImportResult(brain=cls.get_info(name), imported_samples=0)
+
+        return BrainImportResult(
+            brain=cls.store(name, samples, complete=True),
+            imported_samples=len(samples),
+        )
 
-            brain.dataset.features = x_train.columns[
-                (selector.get_support())
-            ].values.tolist()
+    @classmethod
+    def store_streamed(cls, name: str, samples: List[Dict[str, Any]]) -> BrainInfo:
+        """
+        Store a batch of streamed data points. The brain is trained on them in
+        the background, whatever its training configuration, so the stream
+        does not wait for trainings.
+        """
+        return cls.store(name, samples, background=True)
+
+    @classmethod
+    def train_new_data(cls, name: str, stored: Optional[int] = None) -> BrainInfo:
+        """
+        Train the brain after new data points were stored, incrementally if
+        its training configuration asks for it and the trained brain allows
+        it, completely otherwise.
+        """
+        incremental = BrainConfigurationService.get(name).training.incremental
+        return cls.train_stored(name, stored, incremental)
+
+    @classmethod
+    def train_stored(
+        cls, name: str, stored: Optional[int] = None, incremental: bool = False
+    ) -> BrainInfo:
+        """
+        Train the brain on its stored training data.
 
-            (
+        One training per brain runs at a time across all worker processes.
+        If a training which started after the data points were `stored`
+        (see TrainingLock.now) stored the brain meanwhile, it is not trained
+        again.
+        """
+        with TrainingLock.of_brain(name) as lock:
+            if stored is not None and lock.trained_since(stored):
+                return cls.get_info(name)
+
+            started = TrainingLock.now()
+
+            info = None
+            if incremental:
+                info = cls.train_incremental(name)
+
+            if info is None:
+                info = cls.train(name, cls.load_training_data(name))
+
+            lock.finished(started)
+
+            return info
+
+    @staticmethod
+    def load_training_data(name: str) -> pd.DataFrame:
+        """
+        The columns of the training data the brain is trained on, limited to
+        the data points its retention configuration trains on.
+        """
+        return TrainingDataRetention.load(
+            TrainingData.open(name),
+            BrainConfigurationService.get(name).retention,
+            DatasetPreprocessing.training_columns(name),
+        )
+
+    @classmethod
+    def train_incremental(cls, name: str) -> Optional[BrainInfo]:
+        """
+        Replace the oldest trees of the trained brain by new trees fitted on
+        the most recent data points, so the cost does not grow with the
+        number of stored data points. Returns None if the brain has to be
+        trained completely instead: it is not trained yet, its configuration
+        changed, the recent data points do not fit the trained classes or
+        the complete rebuild is due.
+        """
+        configuration = BrainConfigurationService.get(name)
+        training = configuration.training
+
+        try:
+            previous = cls.load_brain(name)
+        except (FileNotFoundError, LearningHouseException):
+            return None
+
+        if (
+            not previous.actual_versions
+            or previous.dataset.columns is None
+            or previous.configuration.model_copy(update={"training": training})
+            != configuration
+            or previous.incremental_trainings + 1 >= training.rebuild_every
+        ):
+            return None
+
+        trees = len(previous.estimator().estimators_)
+        brain = previous.warm_start_copy(
+            max(1, round(trees * training.incremental_trees))
+        )
+        brain.configuration = configuration
+
+        training_data = TrainingData.open(name)
+        try:
+            x_train, x_test, y_train, y_test = DatasetPreprocessing.prepare_incremental(
                 brain,
-                x_train,
-                x_test,
-                y_train,
-                y_test,
-            ) = DatasetPreprocessing.prepare_training(brain, data, True)
+                training_data.tail(
+                    training.incremental_window,
+                    DatasetPreprocessing.training_columns(name),
+                ),
+            )
+        except ValueError:
+            return None
+
+        estimator = brain.estimator()
+        if BrainEstimatorType.CLASSIFIER == configuration.estimator.typed and (
+            not np.array_equal(np.unique(y_train), previous.estimator().classes_)
+        ):
+            return None
 
+        with cpu_budget().reserve(configuration.estimator.jobs) as jobs:
+            estimator.set_params(n_jobs=jobs)
             estimator.fit(x_train, y_train)
+            score = cls.score(brain, x_test, y_test)
+
+        estimator.set_params(n_jobs=None, warm_start=False)
+        assert brain.dataset.columns is not None
+        brain.store_trained(brain.dataset.columns, training_data.rows(), score)
+        model_watcher().bump(cls.cache_key(name))
+
+        return brain.info
+
+    @staticmethod
+    def score(brain: Brain, x_test: np.ndarray, y_test: Any) -> float:
+        estimator = brain.estimator()
+        if BrainEstimatorType.CLASSIFIER == brain.configuration.estimator.typed:
+            return float(accuracy_score(y_test, estimator.predict(x_test)))
+
+        return float(estimator.score(x_test, y_test))
 
-            if BrainEstimatorType.CLASSIFIER == brain.configuration.estimator.typed:
-                y_pred = estimator.predict(x_test)
-                score = accuracy_score(y_test, y_pred)
+    @staticmethod
+    def select_features(brain: Brain, x_train: pd.DataFrame, y_train: Any) -> List[str]:
+        """
+        The columns of `x_train` with an importance of at least the mean
+        importance of all columns, like SelectFromModel selects them. The
+        importances are kept in the dataset of the brain.
+        """
+        selection = brain.configuration.training.feature_selection
+        columns = x_train.columns.tolist()
+
+        if selection == BrainFeatureSelection.NONE:
+            return columns
+
+        importances = None
+        if selection == BrainFeatureSelection.PREVIOUS:
+            importances = BrainService.previous_importances(
+                brain, columns, brain.configuration.training.rebuild_every
+            )
+
+        if importances is None:
+            if selection == BrainFeatureSelection.SURROGATE:
+                estimator = cast(
+                    RandomForestClassifier | RandomForestRegressor,
+                    clone(brain.estimator()),
+                )
+                estimator.set_params(n_estimators=SURROGATE_ESTIMATORS)
+                samples = np.random.RandomState(
+                    brain.configuration.estimator.random_state
+                ).permutation(len(x_train.index))[:SURROGATE_SAMPLES]
+                estimator.fit(
+                    x_train.iloc[samples].to_numpy(dtype=np.float64),
+                    np.asarray(y_train)[samples],
+                )
+                importances = estimator.feature_importances_
             else:
-                score = estimator.score(x_test, y_test)
+                selector = SelectFromModel(brain.estimator())
+                selector.fit(x_train, y_train)
+                importances = cast(
+                    RandomForestClassifier | RandomForestRegressor,
+                    selector.estimator_,
+                ).feature_importances_
+        else:
+            importances = np.array([importances[column] for column in columns])
 
-            brain.store_trained(x_train.columns.tolist(), len(data.index), score)
+        brain.dataset.importances = dict(zip(columns, importances.tolist()))
 
-            return brain.info
-        except FileNotFoundError as exc:
-            raise BrainNoConfiguration(name) from exc
+        support = importances >= np.mean(importances)
+        return [column for column, selected in zip(columns, support) if selected]
 
     @classmethod
-    def prediction(cls, name: str, request_data: Dict[str, Any]):
+    def previous_importances(
+        cls, brain: Brain, columns: List[str], refresh_every: int
+    ) -> Optional[Dict[str, float]]:
+        """
+        The importances of the last training of the brain, None if they do
+        not cover all `columns` or were reused `refresh_every` trainings in a
+        row - columns once dropped get the chance to be selected again.
+        """
         try:
-            brain = cls.load_brain(name)
-            if not brain.actual_versions:
-                raise BrainNotActual(name, brain.versions)
+            dataset = cls.load_brain(brain.name).dataset
+        except (FileNotFoundError, LearningHouseException):
+            return None
+
+        importances = dataset.importances
+        reused = dataset.importances_reused + 1
+        if (
+            importances is None
+            or any(column not in importances for column in columns)
+            or reused >= refresh_every
+        ):
+            return None
+
+        brain.dataset.importances_reused = reused
+        return importances
 
-            request_data = DatasetPreprocessing.add_time_information(request_data)
+    @classmethod
+    def prediction(
+        cls, name: str, request_data: Dict[str, Any], enriched: bool = False
+    ) -> BrainPredictionResult:
+        brain, preprocessed, predictions = cls.predict(name, [request_data], enriched)
 
-            data = pd.DataFrame([request_data])
-            prepared_data = DatasetPreprocessing.prepare_prediction(brain, data)
+        return BrainPredictionResult(
+            brain=brain.info,
+            preprocessed=preprocessed[0],
+            prediction=predictions[0],
+        )
 
-            prediction = brain.estimator().predict(prepared_data)
+    @classmethod
+    def predictions(
+        cls, name: str, requests_data: List[Dict[str, Any]]
+    ) -> BrainPredictionsResult:
+        brain, preprocessed, predictions = cls.predict(name, requests_data)
+
+        return BrainPredictionsResult(
+            brain=brain.info,
+            predictions=[
+                BrainPredictionsItem(preprocessed=values, prediction=prediction)
+                for values, prediction in zip(preprocessed, predictions)
+            ],
+        )
 
-            dependent_encoder = brain.dataset.dependent_encoder
-            if (
-                brain.configuration.dependent_encode
-                and brain.configuration.estimator.typed == BrainEstimatorType.CLASSIFIER
-                and dependent_encoder is not None
-            ):
-                prediction = dependent_encoder.inverse_transform(prediction)
-                prediction = list(map(bool, prediction))
+    @classmethod
+    async def prediction_of_brains(
+        cls, sensors_data: Dict[str, Any], names: Optional[List[str]] = None
+    ) -> BrainsPredictionResult:
+        """
+        Predict one dataset with many brains, all trained brains if no names
+        are given. The time information is added once for all brains and the
+        brains predict concurrently on the prediction thread pool.
+        """
+        if names is None:
+            names = await run_prediction(cls.trained_names)
+        names = list(dict.fromkeys(names))
+
+        sensors_data = DatasetPreprocessing.add_time_information(dict(sensors_data))
+
+        results = await asyncio.gather(
+            *(
+                run_prediction(cls.prediction, name, sensors_data, True)
+                for name in names
+            ),
+            return_exceptions=True,
+        )
+
+        result = BrainsPredictionResult()
+        for name, prediction in zip(names, results):
+            if isinstance(prediction, LearningHouseException):
+                result.errors[name] = prediction.error
+            elif isinstance(prediction, BaseException):
+                raise prediction
             else:
-                prediction = list(map(float, prediction))
+                result.predictions[name] = prediction
+
+        return result
 
-            return BrainPredictionResult(
-                brain=brain.info,
-                preprocessed=prepared_data.head(1).to_dict("records")[0],
-                prediction=prediction[0],
+    @staticmethod
+    def trained_names() -> List[str]:
+        return sorted(
+            directory
+            for directory in listdir(service_settings().brains_directory)
+            if Brain.is_trained(directory)
+        )
+
+    @classmethod
+    def predict(
+        cls, name: str, requests_data: List[Dict[str, Any]], enriched: bool = False
+    ) -> Tuple[Brain, List[Dict[str, Any]], List[bool | float]]:
+        """
+        Predict all requests with one call of the estimator. Returns the
+        brain together with the preprocessed values and the prediction of
+        each request. Requests which are `enriched` already hold the time
+        information and are not changed.
+        """
+        try:
+            brain, stamp = cls.load_stamped(name)
+            if not brain.actual_versions:
+                raise BrainNotActual(name, brain.versions)
+
+            if not requests_data:
+                return brain, [], []
+
+            if not enriched:
+                requests_data = [
+                    DatasetPreprocessing.add_time_information(request_data)
+                    for request_data in requests_data
+                ]
+
+            prepared_data, preprocessed = DatasetPreprocessing.prepare_prediction_rows(
+                brain, requests_data
             )
+
+            memo = prediction_cache().memo(cls.cache_key(name), stamp, brain)
+            if memo is None:
+                return brain, preprocessed, cls.estimate(brain, prepared_data)
+
+            keys = [memo.key(values) for values in preprocessed]
+            cached = [memo.get(key) for key in keys]
+            missing = [
+                index for index, prediction in enumerate(cached) if prediction is None
+            ]
+
+            if missing:
+                if isinstance(prepared_data, pd.DataFrame):
+                    missing_data: Any = prepared_data.iloc[missing]
+                else:
+                    missing_data = prepared_data[missing]
+
+                estimated = cls.estimate(brain, missing_data)
+                for index, prediction in zip(missing, estimated):
+                    cached[index] = prediction
+                    memo.put(keys[index], prediction)
+
+            predictions: List[bool | float] = [
+                prediction for prediction in cached if prediction is not None
+            ]
+            return brain, preprocessed, predictions
         except FileNotFoundError as exc:
             raise BrainNotTrained(name) from exc
 
+    @staticmethod
+    def estimate(brain: Brain, prepared_data: Any) -> List[bool | float]:
+        """Predictions of the decision trees for prepared data."""
+        prediction = brain.predict(prepared_data)
+
+        dependent_encoder = brain.dataset.dependent_encoder
+        if (
+            brain.configuration.dependent_encode
+            and brain.configuration.estimator.typed == BrainEstimatorType.CLASSIFIER
+            and dependent_encoder is not None
+        ):
+            prediction = dependent_encoder.inverse_transform(prediction)
+            return list(map(bool, prediction))
+
+        return list(map(float, prediction))
+
     @classmethod
     def load_brain(cls, name: str) -> Brain:
+        return cls.load_stamped(name)[0]
+
+    @staticmethod
+    def load_stamped(name: str) -> Tuple[Brain, Any]:
+        """
+        The trained brain from the model cache, together with the stamp it is
+        cached with: its generation or the signature of its trained file.
+        """
+        cache_key = BrainService.cache_key(name)
         filename = Brain.sanitize_filename(name, BrainFileType.TRAINED_FILE)
-        stamp = stat(filename).st_mtime
 
-        cache_key = (str(service_settings().brains_directory), name)
-        cached = cls.brains.get(cache_key)
-        if cached is None or cached[0] != stamp:
-            cached = (stamp, Brain.load_trained(name))
-            cls.brains[cache_key] = cached
+        watching = (
+            service_settings().model_cache_validation == ModelCacheValidation.WATCH
+        )
+        if watching:
+            stamp: Any = model_watcher().generation(cache_key)
+        else:
+            stamp = file_signature(filename)
+            if stamp is None:
+                raise FileNotFoundError(filename)
+
+        brain = model_cache().get(cache_key, stamp)
+        if brain is None:
+            signature = file_signature(filename) if watching else stamp
+            brain = Brain.load_trained(
+                name, mapped=service_settings().model_cache_memory_map
+            )
+            model_cache().put(cache_key, stamp, brain)
+
+            # Watched only once cached - the watcher drops brains which are
+            # not in the cache.
+            if watching:
+                model_watcher().watch(cache_key, filename, signature)
+
+        return brain, stamp
+
+    @staticmethod
+    def cache_key(name: str) -> Tuple[str, str]:
+        # Keyed by (brains_directory, name), not name alone - two different
+        # brains directories in the same process (Phase 2 de-globalization)
+        # can each have a brain of the same name, and a name-only key would
+        # serve the wrong one.
+        return (str(service_settings().brains_directory), name)
+
+    @classmethod
+    def preload(cls, names: List[str]) -> None:
+        """Load the given brains, all trained brains for `*`, into the cache."""
+        if names == ["*"]:
+            names = cls.trained_names()
 
-        return cached[1]
+        for name in names:
+            try:
+                cls.load_brain(name)
+                logger.info(f"Preloaded brain {name}")
+            except (FileNotFoundError, LearningHouseException):
+                logger.warning(f"Brain {name} could not be preloaded")
+
+    @staticmethod
+    def metrics() -> BrainMetrics:
+        brains_directory = str(service_settings().brains_directory)
+        return BrainMetrics(
+            model_cache=model_cache().metrics,
+            memory={
+                key[1]: memory
+                for key, memory in model_cache().memory().items()
+                if key[0] == brains_directory
+            },
+            prediction_cache={
+                key[1]: metrics
+                for key, metrics in prediction_cache().metrics().items()
+                if key[0] == brains_directory
+            },
+        )
 
 
 class BrainConfigurationService:
@@ -239,5 +694,8 @@ class BrainConfigurationService:
 
         logger.info(f"Remove brain: {name}")
         rmtree(brainpath)
+        model_cache().remove(BrainService.cache_key(name))
+        model_watcher().bump(BrainService.cache_key(name))
+        prediction_cache().remove(BrainService.cache_key(name))
 
         return BrainDeleteResult(name=name)
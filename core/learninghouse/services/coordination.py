@@ -0,0 +1,144 @@
+"""
+Coordination of the worker processes of the service.
+
+With LEARNINGHOUSE_WORKERS > 1 the threads of several processes read and
+write the files of the same brains. A FileLock serializes them across the
+threads of a process with an RLock and across processes with an advisory
+lock (flock) on a lock file in the directory of the brain. Where flock does
+not exist, e.g. on Windows, only the threads of a process are serialized.
+
+Files the other processes read are replaced atomically (written to a
+temporary file which is renamed), so a reader sees either the old or the new
+file. Cached brains of the other processes are invalidated by the validation
+of the model cache, which notices the replaced trained file.
+"""
+
+from __future__ import annotations
+
+from threading import Lock, RLock
+from time import time_ns
+from typing import IO, Any, Dict, Optional, Self, Tuple
+
+from learninghouse.models.brain import Brain, BrainFileType
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+
+class FileLock:
+    """
+    Reentrant lock of the threads of all processes using the same lock file.
+    The lock file is created on first use. If its directory does not exist,
+    there are no files to coordinate and only the threads are serialized.
+    """
+
+    # Keyed by class as well, so each lock class gets an instance of its own.
+    _locks: Dict[Tuple[type, str], FileLock] = {}
+    _locks_guard = Lock()
+
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self._lock = RLock()
+        self._depth: int = 0
+        self._file: Optional[IO[bytes]] = None
+
+    @classmethod
+    def of(cls, filename: str) -> Self:
+        """The one lock of the process for `filename`."""
+        with cls._locks_guard:
+            lock = cls._locks.get((cls, filename))
+            if not isinstance(lock, cls):
+                lock = cls(filename)
+                cls._locks[(cls, filename)] = lock
+
+            return lock
+
+    def acquire(self) -> None:
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            lock_file, self._file = self._file, None
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+        self._lock.release()
+
+    def __enter__(self) -> Self:
+        self.acquire()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.release()
+
+    def _lock_file(self) -> Optional[IO[bytes]]:
+        try:
+            lock_file = open(self.filename, "a+b")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                lock_file.close()
+                raise
+
+        return lock_file
+
+
+class TrainingLock(FileLock):
+    """
+    Lock of the trainings of a brain, so one training per brain runs at a
+    time across all worker processes.
+
+    The lock file holds the time a training started which stored the brain
+    successfully. A training of new data points is not needed if such a
+    training started after the data points were stored - it was fitted on
+    them already, e.g. by another worker which got data points at the same
+    time.
+    """
+
+    @classmethod
+    def of_brain(cls, name: str) -> TrainingLock:
+        return cls.of(Brain.sanitize_filename(name, BrainFileType.TRAINING_LOCK_FILE))
+
+    @staticmethod
+    def now() -> int:
+        return time_ns()
+
+    def trained_since(self, stored: int) -> bool:
+        """A training which started after `stored` stored the brain."""
+        return self.last_started() > stored
+
+    def last_started(self) -> int:
+        """Called with the lock held."""
+        if self._file is None:
+            return 0
+
+        self._file.seek(0)
+        content = self._file.read().strip()
+
+        return int(content) if content.isdigit() else 0
+
+    def finished(self, started: int) -> None:
+        """Record the start of a training which stored the brain."""
+        if self._file is None:
+            return
+
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(started).encode("ascii"))
+        self._file.flush()
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from os import path
+from threading import Condition
+from typing import IO, Any, Callable, Iterator, List, Optional, TypeVar
+
+from learninghouse.core.settings import service_settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+Result = TypeVar("Result")
+
+# Seconds between two attempts to reserve a core while every core of the
+# budget is reserved by trainings of other processes.
+CPU_BUDGET_POLL_SECONDS = 0.1
+
+# The API handlers are coroutines, but everything below them - fitting a
+# forest, joblib.load, pd.read_csv, writing training data - blocks. Called
+# directly, one slow training stalls every other request of the worker
+# process. The handlers therefore hand these calls to one of two dedicated
+# thread pools: trainings never occupy a prediction thread, so a burst of
+# trainings cannot starve predictions and vice versa. The background
+# trainings and compactions get a third pool, so storing a data point never
+# waits for a fit the brain's data points started earlier. Administrative
+# writes like changes of the sensors configuration run there as well.
+
+
+@lru_cache()
+def training_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=max(service_settings().training_threads, 1),
+        thread_name_prefix="training",
+    )
+
+
+@lru_cache()
+def background_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=max(service_settings().background_threads, 1),
+        thread_name_prefix="background",
+    )
+
+
+@lru_cache()
+def prediction_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=max(service_settings().prediction_threads, 1),
+        thread_name_prefix="prediction",
+    )
+
+
+async def run_training(
+    func: Callable[..., Result], *args: Any, **kwargs: Any
+) -> Result:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        training_executor(), partial(func, *args, **kwargs)
+    )
+
+
+async def run_background(
+    func: Callable[..., Result], *args: Any, **kwargs: Any
+) -> Result:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        background_executor(), partial(func, *args, **kwargs)
+    )
+
+
+async def run_prediction(
+    func: Callable[..., Result], *args: Any, **kwargs: Any
+) -> Result:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        prediction_executor(), partial(func, *args, **kwargs)
+    )
+
+
+class CpuBudget:
+    """
+    CPU cores shared by all trainings of all worker processes. Each training
+    reserves the cores its forest is fitted on for the whole training.
+    A training gets the cores it asks for as far as they are free, at least
+    one - it waits only while every core is reserved. So several brains
+    trained at once never run more fitting threads than the budget has
+    cores, however many jobs each of them asks for.
+
+    Across processes every core is a lock file in `directory`, reserved by
+    an advisory lock (flock) held for the training. Without a directory, or
+    where flock does not exist, only the trainings of the process share the
+    budget.
+    """
+
+    def __init__(self, cpus: int, directory: Optional[str] = None):
+        self.cpus: int = max(cpus, 1)
+        self.directory: Optional[str] = directory
+        self.available: int = self.cpus
+        self._condition = Condition()
+
+    @contextmanager
+    def reserve(self, jobs: int) -> Iterator[int]:
+        """Reserve up to `jobs` cores, all cores of the budget for 0."""
+        requested = self.cpus if jobs <= 0 else jobs
+        shared = self.directory is not None and fcntl is not None
+
+        with self._condition:
+            while True:
+                cores = self._lock_cores(min(requested, self.available))
+                if cores:
+                    break
+                # Cores of other processes are released without a notify.
+                self._condition.wait(CPU_BUDGET_POLL_SECONDS if shared else None)
+            self.available -= len(cores)
+
+        try:
+            yield len(cores)
+        finally:
+            with self._condition:
+                for core in cores:
+                    if core is not None:
+                        core.close()
+                self.available += len(cores)
+                self._condition.notify_all()
+
+    def _lock_cores(self, count: int) -> List[Optional[IO[bytes]]]:
+        if count <= 0:
+            return []
+        if self.directory is None or fcntl is None:
+            return [None] * count
+
+        cores: List[Optional[IO[bytes]]] = []
+        for core in range(self.cpus):
+            try:
+                # pylint: disable-next=consider-using-with
+                core_file = open(path.join(self.directory, f".cpu-{core}.lock"), "a+b")
+            except FileNotFoundError:
+                return [None] * count
+
+            try:
+                fcntl.flock(core_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                core_file.close()
+                continue
+
+            cores.append(core_file)
+            if len(cores) == count:
+                break
+
+        return cores
+
+
+@lru_cache()
+def cpu_budget() -> CpuBudget:
+    return CpuBudget(
+        service_settings().training_cpus_calculated,
+        str(service_settings().brains_directory),
+    )
+
+
+def shutdown_executors() -> None:
+    for executor in (training_executor, background_executor, prediction_executor):
+        if executor.cache_info().currsize > 0:
+            executor().shutdown(wait=False, cancel_futures=True)
+            executor.cache_clear()
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import count
+from os import stat
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from learninghouse.core.logger import logger
+from learninghouse.core.settings import service_settings
+from learninghouse.models.brain import (
+    Brain,
+    BrainMemoryMetrics,
+    BrainModelCacheMetrics,
+)
+from learninghouse.services.prediction_cache import prediction_cache
+
+# Arrays of sklearn's Tree which grow with the number of nodes. Everything
+# else of a trained brain is small compared to them.
+TREE_NODE_ARRAYS = (
+    "children_left",
+    "children_right",
+    "feature",
+    "threshold",
+    "impurity",
+    "n_node_samples",
+    "weighted_n_node_samples",
+    "missing_go_to_left",
+    "value",
+)
+
+# Memory of each mapping of this process, Linux only.
+SMAPS_FILE = "/proc/self/smaps"
+
+
+class ModelCacheEntry:
+    def __init__(self, stamp: Any, brain: Brain, size: int):
+        self.stamp: Any = stamp
+        self.brain: Brain = brain
+        self.size: int = size
+
+
+class ModelCache:
+    """
+    Bounded cache of loaded trained brains.
+
+    Brains are kept until the cache holds more than `max_entries` brains or
+    more than `max_bytes` bytes of tree nodes, then the least recently used
+    brains are evicted. The brain put last is always kept, even if it alone
+    exceeds `max_bytes`, otherwise every prediction of it would load it again.
+
+    Each entry carries the stamp of the trained brain it was loaded from. A
+    `get` with a different stamp is a miss and drops the outdated entry.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        self._entries: OrderedDict[Tuple[str, str], ModelCacheEntry] = OrderedDict()
+        self._size: int = 0
+        self._lock = Lock()
+
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, key: Tuple[str, str], stamp: Any) -> Optional[Brain]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.stamp != stamp:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.brain
+
+    def put(self, key: Tuple[str, str], stamp: Any, brain: Brain) -> None:
+        if self.max_entries <= 0:
+            return
+
+        size = self.size_of(brain)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = ModelCacheEntry(stamp, brain, size)
+            self._size += size
+
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._size > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def remove(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def metrics(self) -> BrainModelCacheMetrics:
+        with self._lock:
+            return BrainModelCacheMetrics(
+                entries=len(self._entries),
+                size_bytes=self._size,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+            )
+
+    def memory(self) -> Dict[Tuple[str, str], BrainMemoryMetrics]:
+        """Shared and private memory of the trees of each cached brain."""
+        with self._lock:
+            brains = [(key, entry.brain) for key, entry in self._entries.items()]
+
+        mappings = mapped_files()
+        memory = {}
+        for key, brain in brains:
+            forest = getattr(brain, "forest", None)
+            mapped_bytes = shared_bytes = private_bytes = 0
+            if forest is not None:
+                mapping = mappings.get(forest.inode, {})
+                mapped_bytes = forest.nbytes
+                shared_bytes = mapping.get("Shared_Clean", 0) + mapping.get(
+                    "Shared_Dirty", 0
+                )
+                private_bytes = mapping.get("Private_Clean", 0) + mapping.get(
+                    "Private_Dirty", 0
+                )
+
+            if forest is None or forest.materialized:
+                private_bytes += self.tree_bytes(brain)
+
+            memory[key] = BrainMemoryMetrics(
+                mapped_bytes=mapped_bytes,
+                shared_bytes=shared_bytes,
+                private_bytes=private_bytes,
+            )
+
+        return memory
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        # Called with self._lock held.
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    @classmethod
+    def size_of(cls, brain: Brain) -> int:
+        # The trees of a brain predicting on its memory mapped forest are
+        # only built for incremental training, count the mapped trees.
+        forest = getattr(brain, "forest", None)
+        if forest is not None and not forest.materialized:
+            return forest.nbytes
+
+        return cls.tree_bytes(brain)
+
+    @staticmethod
+    def tree_bytes(brain: Brain) -> int:
+        size = 0
+        for estimator in getattr(brain.estimator(), "estimators_", []):
+            for array in TREE_NODE_ARRAYS:
+                size += getattr(getattr(estimator.tree_, array, None), "nbytes", 0)
+
+        return size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._entries
+
+
+def mapped_files() -> Dict[int, Dict[str, int]]:
+    """
+    Memory in bytes of the file mappings of this process by inode of the
+    mapped file, e.g. {"Rss": ..., "Shared_Clean": ..., "Private_Clean": ...}.
+    Empty where /proc/self/smaps does not exist.
+    """
+    mappings: Dict[int, Dict[str, int]] = {}
+    mapping: Optional[Dict[str, int]] = None
+    try:
+        with open(SMAPS_FILE, "r", encoding="utf-8") as smaps:
+            for line in smaps:
+                fields = line.split()
+                if len(fields) >= 5 and "-" in fields[0]:
+                    # Header of a mapping: address perms offset dev inode path
+                    inode = int(fields[4])
+                    mapping = mappings.setdefault(inode, {}) if inode else None
+                elif mapping is not None and len(fields) == 3 and fields[2] == "kB":
+                    key = fields[0].rstrip(":")
+                    mapping[key] = mapping.get(key, 0) + int(fields[1]) * 1024
+    except OSError:
+        return {}
+
+    return mappings
+
+
+@lru_cache()
+def model_cache() -> ModelCache:
+    settings = service_settings()
+    return ModelCache(
+        settings.model_cache_size, settings.model_cache_megabytes * 1024 * 1024
+    )
+
+
+FileSignature = Optional[Tuple[int, int, int]]
+
+
+def file_signature(filename: str) -> FileSignature:
+    try:
+        stat_result = stat(filename)
+    except FileNotFoundError:
+        return None
+
+    return (stat_result.st_mtime_ns, stat_result.st_ino, stat_result.st_size)
+
+
+class ModelWatcher:
+    """
+    Generations of trained brains for the `watch` validation of the model
+    cache.
+
+    With the generation as stamp of the cached brains, a prediction of a
+    cached brain needs no file system access at all. The generation of a
+    brain changes when it is trained by this process (`bump`), or when a
+    background thread notices that its trained file changed - e.g. because
+    another worker process trained it. The thread compares modification
+    time, inode and size of the trained files of all cached brains every
+    `interval` seconds.
+    """
+
+    def __init__(self, interval: float, is_cached: Callable[[Tuple[str, str]], bool]):
+        self.interval: float = interval
+        self.is_cached = is_cached
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._watched: Dict[Tuple[str, str], Tuple[str, FileSignature]] = {}
+        self._counter = count(1)
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def generation(self, key: Tuple[str, str]) -> int:
+        return self._generations.get(key, 0)
+
+    def bump(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._generations[key] = next(self._counter)
+            if key in self._watched:
+                filename, _ = self._watched[key]
+                self._watched[key] = (filename, file_signature(filename))
+
+    def watch(
+        self, key: Tuple[str, str], filename: str, signature: FileSignature
+    ) -> None:
+        """
+        Watch the trained file of a brain once it is cached. `signature` is
+        the one of the file before it was loaded, so a training finished
+        during the load is noticed by the next check.
+        """
+        with self._lock:
+            self._watched[key] = (filename, signature)
+
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._run, name="model-watcher", daemon=True
+                )
+                self._thread.start()
+
+    def check(self) -> None:
+        with self._lock:
+            watched = list(self._watched.items())
+
+        for key, (filename, signature) in watched:
+            if not self.is_cached(key):
+                with self._lock:
+                    if self._watched.get(key, (None, None))[1] == signature:
+                        del self._watched[key]
+                continue
+
+            current = file_signature(filename)
+            if current != signature:
+                with self._lock:
+                    self._generations[key] = next(self._counter)
+                    self._watched[key] = (filename, current)
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(exc)
+
+
+@lru_cache()
+def model_watcher() -> ModelWatcher:
+    return ModelWatcher(
+        service_settings().model_cache_watch_seconds,
+        # Memoized predictions are only valid as long as the generation is.
+        lambda key: key in model_cache() or key in prediction_cache(),
+    )
+
+
+def shutdown_model_watcher() -> None:
+    if model_watcher.cache_info().currsize > 0:
+        model_watcher().shutdown()
+        model_watcher.cache_clear()
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from learninghouse.models.brain import (
+    Brain,
+    BrainPredictionCacheConfiguration,
+    BrainPredictionCacheMetrics,
+)
+
+
+class PredictionMemo:
+    """
+    Recent predictions of one trained brain, as loaded by the model cache.
+
+    Keyed by the preprocessed values of the features of the brain, numerical
+    features rounded to their step of `quantization` first. The memo belongs
+    to the stamp the brain is cached with in the model cache (see
+    BrainService.load_stamped), not to the loaded Brain: a brain loaded again
+    after it left the model cache keeps its memo, a brain trained again gets
+    a new stamp, which is a new generation whose memo starts empty.
+    """
+
+    def __init__(
+        self,
+        brain: Brain,
+        configuration: BrainPredictionCacheConfiguration,
+        stamp: Any = None,
+        hits: int = 0,
+        misses: int = 0,
+    ):
+        self.stamp: Any = stamp
+        self.max_entries: int = configuration.size
+        self.features: List[str] = list(
+            brain.dataset.features or brain.dataset.columns or []
+        )
+        self.steps: List[Optional[float]] = [
+            configuration.quantization.get(feature) for feature in self.features
+        ]
+        self._entries: OrderedDict[Tuple[Any, ...], Any] = OrderedDict()
+        self._lock = Lock()
+
+        self.hits: int = hits
+        self.misses: int = misses
+
+    def of(self, stamp: Any) -> bool:
+        return self.stamp == stamp
+
+    def key(self, values: Dict[str, Any]) -> Tuple[Any, ...]:
+        key = []
+        for feature, step in zip(self.features, self.steps):
+            value = values.get(feature)
+            if step is not None and isinstance(value, float):
+                value = round(value / step)
+            key.append(value)
+
+        return tuple(key)
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[Any]:
+        with self._lock:
+            prediction = self._entries.get(key)
+            if prediction is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return prediction
+
+    def put(self, key: Tuple[Any, ...], prediction: Any) -> None:
+        with self._lock:
+            self._entries[key] = prediction
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def metrics(self) -> BrainPredictionCacheMetrics:
+        with self._lock:
+            requests = self.hits + self.misses
+            return BrainPredictionCacheMetrics(
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / requests if requests else 0.0,
+            )
+
+
+class PredictionCache:
+    """
+    The PredictionMemo of each brain which enables the prediction cache in
+    its BrainPredictionCacheConfiguration, per worker process. Hits and
+    misses of a brain are counted on across its generations. Brains with a
+    memo stay watched by the ModelWatcher, also when they are not in the
+    model cache.
+    """
+
+    def __init__(self):
+        self._memos: Dict[Tuple[str, str], PredictionMemo] = {}
+        self._lock = Lock()
+
+    def memo(
+        self, key: Tuple[str, str], stamp: Any, brain: Brain
+    ) -> Optional[PredictionMemo]:
+        # Brains trained before the prediction cache existed are unpickled
+        # with a configuration without it.
+        configuration: Optional[BrainPredictionCacheConfiguration] = getattr(
+            brain.configuration, "prediction_cache", None
+        )
+
+        with self._lock:
+            memo = self._memos.get(key)
+            if memo is not None and memo.of(stamp):
+                return memo
+
+            if configuration is None or configuration.size <= 0:
+                self._memos.pop(key, None)
+                return None
+
+            if memo is None:
+                memo = PredictionMemo(brain, configuration, stamp)
+            else:
+                memo = PredictionMemo(
+                    brain, configuration, stamp, memo.hits, memo.misses
+                )
+            self._memos[key] = memo
+
+            return memo
+
+    def remove(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._memos.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memos.clear()
+
+    def metrics(self) -> Dict[Tuple[str, str], BrainPredictionCacheMetrics]:
+        with self._lock:
+            memos = list(self._memos.items())
+
+        return {key: memo.metrics for key, memo in memos}
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        with self._lock:
+            return key in self._memos
+
+
+@lru_cache()
+def prediction_cache() -> PredictionCache:
+    return PredictionCache()
@@ -18,6 +18,7 @@ import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
+from learninghouse.models.preprocessing import FeaturePlan
 from learninghouse.models.sensor import Sensors
 
 if TYPE_CHECKING:
@@ -28,19 +29,64 @@ class DatasetPreprocessing:
     CATEGORICAL_KEY = "categorical"
     NUMERICAL_KEY = "numerical"
 
+    TIME_CATEGORICALS = ["month_of_year", "day_of_week"]
+    TIME_NUMERICALS = ["day_of_month", "hour_of_day", "minute_of_hour"]
+
+    # Generation of the sensors configuration and the column lists derived
+    # from it, recomputed only when Sensors.cached_config() changes.
+    _sensorsconfig: Optional[Tuple[int, List[str], List[str]]] = None
+
     @classmethod
     def sensorsconfig(cls) -> Tuple[List[str], List[str]]:
-        sensors = Sensors.load_config()
-        categoricals = sensors.categoricals
-        numericals = sensors.numericals
+        categoricals, numericals = cls._cached_sensorsconfig()
+        return list(categoricals), list(numericals)
+
+    @classmethod
+    def _cached_sensorsconfig(cls) -> Tuple[List[str], List[str]]:
+        # Shared lists, must not be changed by the caller.
+        generation, sensors = Sensors.cached_config()
 
-        categoricals.append("month_of_year")
-        numericals.append("day_of_month")
-        categoricals.append("day_of_week")
-        numericals.append("hour_of_day")
-        numericals.append("minute_of_hour")
+        cached = cls._sensorsconfig
+        if cached is None or cached[0] != generation:
+            cached = (
+                generation,
+                sensors.categoricals + cls.TIME_CATEGORICALS,
+                sensors.numericals + cls.TIME_NUMERICALS,
+            )
+            cls._sensorsconfig = cached
+
+        return cached[1], cached[2]
+
+    @classmethod
+    def training_columns(cls, name: str) -> List[str]:
+        """Columns of the training data the brain `name` is trained on."""
+        categoricals, numericals = cls._cached_sensorsconfig()
+        return categoricals + numericals + [name]
 
-        return categoricals, numericals
+    @classmethod
+    def feature_sources(cls, features: List[str]) -> Set[str]:
+        """
+        The sensors the features of a brain are derived from: numerical
+        sensors are features themselves, categorical sensors by their one-hot
+        columns. The time columns are derived from `timestamp`.
+        """
+        categoricals, numericals = cls._cached_sensorsconfig()
+        time_columns = cls.TIME_CATEGORICALS + cls.TIME_NUMERICALS
+
+        sources: Set[str] = set()
+        for feature in features:
+            columns = [
+                categorical
+                for categorical in categoricals
+                if feature.startswith(categorical + "_")
+            ]
+            if feature in numericals:
+                columns.append(feature)
+
+            for column in columns:
+                sources.add("timestamp" if column in time_columns else column)
+
+        return sources
 
     @staticmethod
     def add_time_information(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -146,7 +192,7 @@ class DatasetPreprocessing:
         )
 
         for missing_column in missing_columns:
-            x_vector.insert(0, missing_column, [np.nan])
+            x_vector.insert(0, missing_column, np.nan)
 
         x_vector = x_vector.reindex(columns=brain.dataset.columns, fill_value=0)
         x_vector = cls.sort_columns(x_vector)
@@ -157,6 +203,110 @@ class DatasetPreprocessing:
 
         return cls.sort_columns(x_vector)
 
+    @classmethod
+    def prepare_incremental(
+        cls, brain: Brain, data: pd.DataFrame
+    ) -> Tuple[np.ndarray, np.ndarray, Any, Any]:
+        """
+        Training and test split of recent data points for new trees of an
+        already trained brain. The data points are prepared like data points
+        to predict, with the columns and the fitted imputer of the brain.
+        Raises ValueError for a value of the dependent variable the encoder
+        of the brain does not know.
+        """
+        x_vector = cls.prepare_prediction(brain, data).to_numpy(dtype=np.float64)
+
+        y_vector = data[brain.configuration.name]
+
+        dependent_encoder = brain.dataset.dependent_encoder
+        if brain.configuration.dependent_encode and dependent_encoder is not None:
+            y_vector = dependent_encoder.transform(y_vector)
+
+        return cast(
+            Tuple[np.ndarray, np.ndarray, Any, Any],
+            tuple(
+                train_test_split(
+                    x_vector,
+                    np.asarray(y_vector),
+                    test_size=brain.configuration.test_size,
+                    random_state=0,
+                )
+            ),
+        )
+
+    @classmethod
+    def prepare_prediction_rows(
+        cls, brain: Brain, rows: List[Dict[str, Any]]
+    ) -> Tuple[Union[np.ndarray, pd.DataFrame], List[Dict[str, Any]]]:
+        """
+        The prepared input for the estimator of the brain together with the
+        values of each row by column. Uses the compiled FeaturePlan of the
+        brain where possible, otherwise prepare_prediction.
+        """
+        plan = brain.dataset.plan
+        if plan is not None and plan.compiled_for(*cls._cached_sensorsconfig()):
+            matrix = plan.transform(rows)
+            if matrix is not None:
+                return matrix, [plan.preprocessed(row) for row in matrix]
+
+        prepared_data = cls.prepare_prediction(brain, pd.DataFrame(rows))
+        preprocessed = prepared_data.to_dict("records")
+
+        if brain.uses_feature_names:
+            return prepared_data, preprocessed
+
+        return prepared_data.to_numpy(dtype=np.float64), preprocessed
+
+    @classmethod
+    def compile_plan(cls, brain: Brain, columns: List[str]) -> Optional[FeaturePlan]:
+        """
+        Compile the FeaturePlan for a brain trained on `columns`, after its
+        imputer was fitted. None if the columns cannot be mapped back to
+        their sensors unambiguously.
+        """
+        categoricals, numericals = cls.sensorsconfig()
+
+        imputer = brain.dataset.imputer
+        means = dict(
+            zip(
+                getattr(imputer, "feature_names_in_", []),
+                getattr(imputer, "statistics_", []),
+            )
+        )
+
+        defaults = np.zeros(len(columns), dtype=np.float64)
+        numerical_index: Dict[str, int] = {}
+        one_hot_index: Dict[str, Dict[str, int]] = {}
+
+        for index, column in enumerate(columns):
+            sources = [
+                categorical
+                for categorical in categoricals
+                if column.startswith(categorical + "_")
+            ]
+
+            if column in numericals and not sources:
+                mean = means.get(column)
+                if mean is None or np.isnan(mean):
+                    return None
+
+                defaults[index] = mean
+                numerical_index[column] = index
+            elif len(sources) == 1 and column not in numericals:
+                value = column[len(sources[0]) + 1 :]
+                one_hot_index.setdefault(sources[0], {})[value] = index
+            else:
+                return None
+
+        return FeaturePlan(
+            columns,
+            categoricals,
+            numericals,
+            numerical_index,
+            one_hot_index,
+            defaults,
+        )
+
     @staticmethod
     def transform_columns(
         func: Callable, data: pd.DataFrame, columns: List[str]
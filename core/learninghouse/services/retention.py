@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from datetime import datetime
+from functools import lru_cache
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple, cast
+
+import pandas as pd
+
+from learninghouse.core.logger import logger
+from learninghouse.core.settings import service_settings
+from learninghouse.models.brain import BrainRetentionConfiguration
+from learninghouse.services.executor import background_executor
+from learninghouse.services.training_data import TrainingData
+
+DAY_SECONDS = 24 * 60 * 60
+
+# New data points of a brain after which its training data is compacted.
+COMPACT_EVERY_SAMPLES = 100
+
+
+class TrainingDataRetention:
+    """
+    Applies the BrainRetentionConfiguration of a brain to its training data:
+    `load` reads the data points the brain is trained on, `compact` removes
+    the data points the brain keeps no longer.
+    """
+
+    @staticmethod
+    def load(
+        training_data: TrainingData,
+        retention: BrainRetentionConfiguration,
+        columns: Optional[List[str]] = None,
+        now: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """
+        The data points within the window and the limits of the retention,
+        read from the end of the training data where the store allows it.
+        """
+        if now is None:
+            now = datetime.now().timestamp()
+
+        days = [
+            value
+            for value in (retention.window_days, retention.max_age_days)
+            if value is not None
+        ]
+        rows = [
+            value
+            for value in (retention.window_rows, retention.max_rows)
+            if value is not None
+        ]
+
+        if days and "timestamp" in training_data.columns():
+            data = training_data.window(
+                since=now - min(days) * DAY_SECONDS, columns=columns
+            )
+            if rows:
+                data = data.iloc[-min(rows) :].reset_index(drop=True)
+            return data
+
+        if rows:
+            return training_data.tail(min(rows), columns)
+
+        return training_data.load(columns)
+
+    @staticmethod
+    def apply(
+        data: pd.DataFrame,
+        retention: BrainRetentionConfiguration,
+        now: Optional[float] = None,
+    ) -> pd.DataFrame:
+        """The data points of `data` the retention keeps."""
+        if now is None:
+            now = datetime.now().timestamp()
+
+        if "timestamp" in data.columns:
+            timestamps = data["timestamp"]
+
+            if retention.max_age_days is not None:
+                since = now - retention.max_age_days * DAY_SECONDS
+                data = cast(
+                    pd.DataFrame, data[timestamps.isna() | (timestamps >= since)]
+                )
+                timestamps = data["timestamp"]
+
+            if retention.downsample_seconds is not None:
+                periods = timestamps // retention.downsample_seconds
+                data = cast(
+                    pd.DataFrame,
+                    data[timestamps.isna() | ~periods.duplicated(keep="last")],
+                )
+
+        if retention.max_rows is not None:
+            data = data.iloc[-retention.max_rows :]
+
+        return data.reset_index(drop=True)
+
+    @classmethod
+    def compact(
+        cls,
+        training_data: TrainingData,
+        retention: BrainRetentionConfiguration,
+        now: Optional[float] = None,
+    ) -> int:
+        """
+        Remove the data points the retention does not keep. Returns the
+        number of removed data points. The training data is locked from
+        loading to replacing it, data points stored meanwhile wait for the
+        compaction instead of being lost.
+        """
+        with training_data.lock:
+            if not training_data.exists():
+                return 0
+
+            data = training_data.load()
+            kept = cls.apply(data, retention, now)
+
+            removed = len(data.index) - len(kept.index)
+            if removed > 0:
+                training_data.write(kept)
+
+        return removed
+
+
+class CompactionScheduler:
+    """
+    Compacts the training data of brains with a retention removing data
+    points, on the background thread pool after every COMPACT_EVERY_SAMPLES
+    new data points of a brain - never during the request which stored
+    them. At most one compaction of a brain runs at a time.
+    """
+
+    def __init__(self, executor: Callable[[], Executor]):
+        self.executor = executor
+        self._pending: Dict[Tuple[str, str], int] = {}
+        self._running: Set[Tuple[str, str]] = set()
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(name: str) -> Tuple[str, str]:
+        return (str(service_settings().brains_directory), name)
+
+    def notify(
+        self, name: str, retention: BrainRetentionConfiguration, samples: int = 1
+    ) -> None:
+        if not retention.removes_data:
+            return
+
+        key = self._key(name)
+        with self._lock:
+            pending = self._pending.get(key, 0) + samples
+            if pending < COMPACT_EVERY_SAMPLES or key in self._running:
+                self._pending[key] = pending
+                return
+
+            self._pending[key] = 0
+            self._running.add(key)
+
+        self.executor().submit(self._run, key, name, retention)
+
+    def _run(
+        self, key: Tuple[str, str], name: str, retention: BrainRetentionConfiguration
+    ) -> None:
+        try:
+            removed = TrainingDataRetention.compact(TrainingData.open(name), retention)
+            if removed > 0:
+                logger.info(f"Removed {removed} data points of brain {name}")
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception(exc)
+        finally:
+            with self._lock:
+                self._running.discard(key)
+
+
+@lru_cache()
+def compaction_scheduler() -> CompactionScheduler:
+    return CompactionScheduler(background_executor)
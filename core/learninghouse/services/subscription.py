@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from learninghouse.core.logger import logger
+from learninghouse.core.settings import service_settings
+from learninghouse.errors import LearningHouseException
+from learninghouse.models.brain import BrainPredictionResult
+from learninghouse.models.sensor import SensorStateResult
+from learninghouse.services.brain import BrainService
+from learninghouse.services.executor import run_prediction
+from learninghouse.services.preprocessing import DatasetPreprocessing
+
+
+class PredictionSubscriptions:
+    """
+    Pushes the predictions of brains to their subscribers when the sensors
+    they depend on change, instead of clients polling the prediction.
+
+    The values of all sensors are kept in one state, updated with `update`.
+    A subscribed brain predicts again on the whole state only if one of the
+    changed sensors is a source of its `features` (see
+    DatasetPreprocessing.feature_sources), once for all of its subscribers.
+    Until a brain predicted successfully its sources are unknown and every
+    change makes it predict. Each subscriber gets the serialized prediction
+    result or error in its queue, the oldest one is dropped if it does not
+    keep up.
+
+    The time features of a brain have `timestamp` as source. Without a
+    timestamp in the state the time is taken when the brain predicts, so
+    these brains also predict again every `sensors_state_time_seconds` while
+    they are subscribed (see `tick`). A timestamp in the state is the time
+    of the clients, which change it with `update`.
+
+    State and subscriptions are kept per worker process, an update only
+    reaches the subscribers of the worker which received it.
+    """
+
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[Tuple[str, str], List[asyncio.Queue]] = {}
+        self._sources: Dict[Tuple[str, str], Optional[Set[str]]] = {}
+        self._evaluations: Dict[Tuple[str, str], int] = {}
+        self._pushed: Dict[Tuple[str, str], int] = {}
+        self._timer: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _directory() -> str:
+        return str(service_settings().brains_directory)
+
+    def state(self) -> Dict[str, Any]:
+        return dict(self._states.get(self._directory(), {}))
+
+    async def update(self, values: Dict[str, Any]) -> SensorStateResult:
+        directory = self._directory()
+        state = self._states.setdefault(directory, {})
+
+        changed = {
+            sensor
+            for sensor, value in values.items()
+            if sensor not in state or state[sensor] != value
+        }
+        state.update(values)
+        snapshot = dict(state)
+
+        keys = [
+            key
+            for key in self._subscribers
+            if key[0] == directory and self._affected(key, changed)
+        ]
+        await asyncio.gather(
+            *(self._evaluate(key, snapshot, self._subscribers[key]) for key in keys)
+        )
+
+        return SensorStateResult(
+            changed=sorted(changed), predicted=sorted(key[1] for key in keys)
+        )
+
+    async def tick(self) -> List[str]:
+        """
+        Predict again with the subscribed brains depending on the time, if
+        the state holds no timestamp. Returns the names of these brains.
+        """
+        keys = [
+            key
+            for key, sources in self._sources.items()
+            if sources is not None
+            and "timestamp" in sources
+            and "timestamp" not in self._states.get(key[0], {})
+            and key in self._subscribers
+        ]
+        await asyncio.gather(
+            *(
+                self._evaluate(key, dict(self._states[key[0]]), self._subscribers[key])
+                for key in keys
+            )
+        )
+
+        return sorted(key[1] for key in keys)
+
+    @asynccontextmanager
+    async def subscribe(self, name: str) -> AsyncIterator[asyncio.Queue]:
+        """
+        A queue of the predictions of the brain `name`, starting with one on
+        the current state if there is any.
+        """
+        key = (self._directory(), name)
+        queue: asyncio.Queue = asyncio.Queue(self.QUEUE_SIZE)
+        self._subscribers.setdefault(key, []).append(queue)
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._tick_periodically())
+
+        try:
+            state = self._states.get(key[0])
+            if state:
+                await self._evaluate(key, dict(state), [queue])
+
+            yield queue
+        finally:
+            queues = self._subscribers[key]
+            queues.remove(queue)
+            if not queues:
+                del self._subscribers[key]
+                self._sources.pop(key, None)
+                self._evaluations.pop(key, None)
+                self._pushed.pop(key, None)
+
+            if not self._subscribers and self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    async def _tick_periodically(self) -> None:
+        interval = service_settings().sensors_state_time_seconds
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.tick()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception(exc)
+
+    def _affected(self, key: Tuple[str, str], changed: Set[str]) -> bool:
+        if not changed:
+            return False
+
+        sources = self._sources.get(key)
+        return sources is None or not sources.isdisjoint(changed)
+
+    async def _evaluate(
+        self, key: Tuple[str, str], state: Dict[str, Any], queues: List[asyncio.Queue]
+    ) -> None:
+        evaluation = self._evaluations.get(key, 0) + 1
+        self._evaluations[key] = evaluation
+
+        try:
+            result, sources = await run_prediction(self._predict, key[1], state)
+            message = result.model_dump_json()
+        except LearningHouseException as exc:
+            sources = None
+            message = exc.error.model_dump_json()
+
+        # Predictions of the same brain may finish out of order, a later
+        # state which was pushed already must not be replaced.
+        if evaluation < self._pushed.get(key, 0):
+            return
+
+        self._pushed[key] = evaluation
+        self._sources[key] = sources
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    @staticmethod
+    def _predict(
+        name: str, state: Dict[str, Any]
+    ) -> Tuple[BrainPredictionResult, Optional[Set[str]]]:
+        # The prediction adds the time information to the data it is given.
+        result = BrainService.prediction(name, dict(state))
+        features = result.brain.features
+        sources = DatasetPreprocessing.feature_sources(features) if features else None
+
+        return result, sources
+
+
+@lru_cache()
+def prediction_subscriptions() -> PredictionSubscriptions:
+    return PredictionSubscriptions()
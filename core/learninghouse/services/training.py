@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from datetime import datetime
+from functools import lru_cache
+from threading import Lock, Timer
+from time import monotonic
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from learninghouse.core.logger import logger
+from learninghouse.core.settings import service_settings
+from learninghouse.errors import LearningHouseException
+from learninghouse.models.brain import (
+    BrainTrainingConfiguration,
+    BrainTrainingState,
+    BrainTrainingStatus,
+)
+from learninghouse.services.executor import background_executor
+
+
+class BrainTrainingJob:
+    """Scheduling state of one brain inside the TrainingScheduler."""
+
+    def __init__(self, name: str):
+        self.name: str = name
+        self.configuration: BrainTrainingConfiguration = BrainTrainingConfiguration()
+        self.train: Optional[Callable[[], Any]] = None
+
+        self.pending_samples: int = 0
+        self.importing_samples: Optional[int] = None
+        self.last_sample: float = 0.0
+        self.last_start: Optional[float] = None
+
+        self.queued: bool = False
+        self.running: bool = False
+        self.timer: Optional[Timer] = None
+
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    @property
+    def state(self) -> BrainTrainingState:
+        if self.running:
+            return BrainTrainingState.RUNNING
+
+        if self.queued or self.pending_samples > 0:
+            return BrainTrainingState.PENDING
+
+        return BrainTrainingState.IDLE
+
+    @property
+    def status(self) -> BrainTrainingStatus:
+        return BrainTrainingStatus(
+            name=self.name,
+            state=self.state,
+            pending_samples=self.pending_samples,
+            importing_samples=self.importing_samples,
+            started_at=self.started_at,
+            finished_at=self.finished_at,
+            error=self.error,
+        )
+
+    def delay(self) -> float:
+        due = self.last_sample + self.configuration.debounce
+        if self.last_start is not None:
+            due = max(due, self.last_start + self.configuration.min_interval)
+
+        return due - monotonic()
+
+
+class TrainingScheduler:
+    """
+    Trains brains in the background, decoupled from the request which stored
+    the data point.
+
+    Every stored data point is announced with `notify`. Data points arriving
+    while a training of the same brain is queued, running or waiting for its
+    debounce are coalesced into one further training, so a brain is never
+    trained more than once at a time and never more often than its
+    BrainTrainingConfiguration allows. The trainings themselves run on the
+    background thread pool (see services/executor.py), so they never delay
+    storing data points or the trainings requested synchronously.
+    """
+
+    def __init__(self, executor: Callable[[], Executor]):
+        self.executor = executor
+        self._jobs: Dict[Tuple[str, str], BrainTrainingJob] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(name: str) -> Tuple[str, str]:
+        return (str(service_settings().brains_directory), name)
+
+    def notify(
+        self,
+        name: str,
+        configuration: BrainTrainingConfiguration,
+        train: Callable[[], Any],
+        samples: int = 1,
+    ) -> BrainTrainingStatus:
+        key = self._key(name)
+
+        with self._lock:
+            job = self._job(key, name)
+            job.configuration = configuration
+            job.train = train
+            job.pending_samples += samples
+            job.last_sample = monotonic()
+
+            self._schedule(job)
+
+            return job.status
+
+    def importing(self, name: str, samples: Optional[int]) -> None:
+        """Progress of a bulk import of the brain, None when it is over."""
+        key = self._key(name)
+
+        with self._lock:
+            self._job(key, name).importing_samples = samples
+
+    def status(self, name: str) -> BrainTrainingStatus:
+        with self._lock:
+            job = self._jobs.get(self._key(name))
+            if job is None:
+                return BrainTrainingStatus(name=name, state=BrainTrainingState.IDLE)
+
+            return job.status
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.timer is not None:
+                    job.timer.cancel()
+                    job.timer = None
+
+    def _job(self, key: Tuple[str, str], name: str) -> BrainTrainingJob:
+        # Called with self._lock held.
+        job = self._jobs.get(key)
+        if job is None:
+            job = BrainTrainingJob(name)
+            self._jobs[key] = job
+
+        return job
+
+    def _schedule(self, job: BrainTrainingJob) -> None:
+        # Called with self._lock held.
+        if job.timer is not None:
+            job.timer.cancel()
+            job.timer = None
+
+        if job.queued or job.running:
+            return
+
+        if job.pending_samples < job.configuration.every_samples:
+            return
+
+        delay = job.delay()
+        if delay > 0:
+            job.timer = Timer(delay, self._due, (job,))
+            job.timer.daemon = True
+            job.timer.start()
+        else:
+            job.queued = True
+            self.executor().submit(self._run, job)
+
+    def _due(self, job: BrainTrainingJob) -> None:
+        with self._lock:
+            job.timer = None
+            self._schedule(job)
+
+    def _run(self, job: BrainTrainingJob) -> None:
+        with self._lock:
+            job.queued = False
+            job.running = True
+            job.pending_samples = 0
+            job.last_start = monotonic()
+            job.started_at = datetime.now()
+            train = job.train
+
+        error = None
+        try:
+            if train is not None:
+                train()
+        except LearningHouseException as exc:
+            error = exc.error.description
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception(exc)
+            error = str(exc)
+
+        with self._lock:
+            job.running = False
+            job.finished_at = datetime.now()
+            job.error = error
+            self._schedule(job)
+
+
+@lru_cache()
+def training_scheduler() -> TrainingScheduler:
+    return TrainingScheduler(background_executor)
+
+
+def shutdown_training_scheduler() -> None:
+    if training_scheduler.cache_info().currsize > 0:
+        training_scheduler().shutdown()
+        training_scheduler.cache_clear()
@@ -0,0 +1,896 @@
+from __future__ import annotations
+
+import csv
+import json
+import math
+import sqlite3
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from io import SEEK_END, BytesIO
+from os import makedirs, path, remove, replace
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
+
+import numpy as np
+import pandas as pd
+
+from learninghouse.core.logger import logger
+from learninghouse.core.settings import service_settings
+from learninghouse.core.settings.models import TrainingDataStore
+from learninghouse.models.brain import Brain, BrainFileType
+from learninghouse.services.coordination import FileLock
+
+TAIL_BLOCK_SIZE = 65536
+
+
+class TrainingData(ABC):
+    """
+    Training data of one brain. `open` returns the store configured by
+    LEARNINGHOUSE_TRAINING_DATA_STORE, the stores share the methods below.
+    """
+
+    def __init__(self, name: str, brains_directory: Optional[Path] = None):
+        self.name: str = name
+        self.brains_directory: Optional[Path] = brains_directory
+        self.directory: str = Brain.sanitize_directory(name, brains_directory)
+        self.csv_filename: str = Brain.sanitize_filename(
+            name, BrainFileType.TRAINING_DATA_FILE, brains_directory
+        )
+
+    @staticmethod
+    def open(name: str, brains_directory: Optional[Path] = None) -> TrainingData:
+        store = service_settings().training_data_store
+        if store == TrainingDataStore.CSV:
+            return CsvTrainingData(name, brains_directory)
+
+        training_data: TrainingData
+        if store == TrainingDataStore.SQLITE:
+            training_data = SqliteTrainingData(name, brains_directory)
+        else:
+            training_data = ColumnarTrainingData(name, brains_directory)
+
+        training_data.migrate()
+        return training_data
+
+    @property
+    def lock(self) -> FileLock:
+        # One lock per brain, whichever store is used, shared by all worker
+        # processes. Reentrant, so the methods taking it can be called by a
+        # holder of the lock.
+        return FileLock.of(
+            Brain.sanitize_filename(
+                self.name, BrainFileType.TRAINING_DATA_LOCK_FILE, self.brains_directory
+            )
+        )
+
+    @abstractmethod
+    def exists(self) -> bool:
+        pass
+
+    @abstractmethod
+    def columns(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def rows(self) -> int:
+        """Number of stored samples, without reading the samples."""
+
+    @abstractmethod
+    def append(self, row: Dict[str, Any]) -> None:
+        pass
+
+    def append_many(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.append(row)
+
+    @abstractmethod
+    def load(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """All samples, only the given `columns` of them if not None."""
+
+    @abstractmethod
+    def tail(self, rows: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """The last `rows` samples, only the given `columns` if not None."""
+
+    def window(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        The samples with a `timestamp` from `since` to `until`, both
+        included, only the given `columns` of them if not None.
+        """
+        data = self.load(None if columns is None else [*columns, "timestamp"])
+        if "timestamp" not in data.columns:
+            return data.iloc[0:0]
+
+        selected = pd.Series(True, index=data.index)
+        if since is not None:
+            selected &= data["timestamp"] >= since
+        if until is not None:
+            selected &= data["timestamp"] <= until
+
+        data = cast(pd.DataFrame, data[selected]).reset_index(drop=True)
+        if columns is not None and "timestamp" not in columns:
+            data = data.drop(columns=["timestamp"])
+
+        return data
+
+    @abstractmethod
+    def write(self, data: pd.DataFrame) -> None:
+        """Replace all stored samples by `data`. Called with self.lock held."""
+
+    def migrate(self) -> None:
+        """
+        Import the `training_data.csv` of the brain once, if this store holds
+        no training data of the brain yet. The CSV is kept as
+        `training_data.csv.migrated`.
+        """
+        if self.exists() or not path.exists(self.csv_filename):
+            return
+
+        with self.lock:
+            if self.exists() or not path.exists(self.csv_filename):
+                return
+
+            self.write(pd.read_csv(self.csv_filename))
+
+            replace(self.csv_filename, self.csv_filename + ".migrated")
+            rows_filename = Brain.sanitize_filename(
+                self.name, BrainFileType.TRAINING_DATA_ROWS_FILE, self.brains_directory
+            )
+            if path.exists(rows_filename):
+                remove(rows_filename)
+
+        logger.info(
+            f"Migrated training data of brain {self.name} to {type(self).__name__}"
+        )
+
+    @staticmethod
+    def _format(value: Any) -> Any:
+        # Written the way DataFrame.to_csv wrote the file before: missing
+        # values and NaN as empty field, everything else through str().
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return ""
+
+        return value
+
+    @staticmethod
+    def _usecols(columns: Optional[List[str]]) -> Any:
+        if columns is None:
+            return None
+
+        wanted = set(columns)
+        return lambda column: column in wanted
+
+    @staticmethod
+    def _value(value: Any) -> Any:
+        """Plain Python value, None for missing values."""
+        if isinstance(value, np.generic):
+            value = value.item()
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+
+        return value
+
+    @staticmethod
+    def _kind(value: Any) -> Optional[str]:
+        if value is None:
+            return None
+        if isinstance(value, bool):
+            return "bool"
+        if isinstance(value, int):
+            return "int"
+        if isinstance(value, float):
+            return "float"
+
+        return "string"
+
+    @staticmethod
+    def _combined_kind(kind: str, value_kind: Optional[str], rows: int) -> str:
+        """Kind of a column of `rows` values of `kind` and one more value."""
+        if kind == "empty":
+            if value_kind is None or rows == 0:
+                return value_kind or "empty"
+            kind = value_kind
+            value_kind = None
+
+        if value_kind is None:
+            return "float" if kind == "int" else kind
+
+        if kind == value_kind:
+            return kind
+
+        if {kind, value_kind} == {"int", "float"}:
+            return "float"
+
+        return "string"
+
+    @staticmethod
+    def _text(value: Any) -> Optional[str]:
+        """Value of a column which became a `string` column, as in the CSV."""
+        if value is None:
+            return None
+
+        # Whole numbers of a float column were ints turned into floats by
+        # a missing value, the CSV holds them without decimals.
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+
+        return str(value)
+
+
+class CsvTrainingData(TrainingData):
+    """
+    Training data of one brain, stored in its `training_data.csv`.
+
+    New samples are appended as a single line, so ingesting a sample costs
+    the same no matter how many rows are already stored. Only when a sample
+    brings a column the file has not seen yet, the file is rewritten once
+    with the extended header and empty values for the existing rows -
+    the same result `pd.concat` of the old rows and the new one used to give.
+    """
+
+    def __init__(self, name: str, brains_directory: Optional[Path] = None):
+        super().__init__(name, brains_directory)
+        self.filename: str = self.csv_filename
+        self.rows_filename: str = Brain.sanitize_filename(
+            name, BrainFileType.TRAINING_DATA_ROWS_FILE, brains_directory
+        )
+
+    def exists(self) -> bool:
+        return path.exists(self.filename)
+
+    def columns(self) -> List[str]:
+        with (
+            self.lock,
+            open(self.filename, "r", encoding="utf-8", newline="") as data_file,
+        ):
+            return next(csv.reader(data_file), [])
+
+    def rows(self) -> int:
+        """
+        Number of stored samples. Kept in a counter file next to the training
+        data, so it can be read without reading the training data.
+        """
+        with self.lock:
+            return self._rows()
+
+    def append(self, row: Dict[str, Any]) -> None:
+        self.append_many([row])
+
+    def append_many(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+
+        with self.lock:
+            stored = self._rows()
+            row_columns = list(dict.fromkeys(column for row in rows for column in row))
+
+            if not self.exists():
+                self._write_header(row_columns)
+                columns = row_columns
+            else:
+                columns = self.columns()
+                new_columns = [
+                    column for column in row_columns if column not in columns
+                ]
+                if new_columns:
+                    columns = columns + new_columns
+                    self._evolve_schema(columns, len(new_columns))
+
+            with open(self.filename, "a", encoding="utf-8", newline="") as data_file:
+                writer = csv.writer(data_file, lineterminator="\n")
+                writer.writerows(
+                    [self._format(row.get(column)) for column in columns]
+                    for row in rows
+                )
+
+            self._write_rows(stored + len(rows))
+
+    def load(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        # Locked, so a sample appended meanwhile is never read half written.
+        with self.lock:
+            return pd.read_csv(self.filename, usecols=self._usecols(columns))
+
+    def tail(self, rows: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        The last `rows` samples. The file is read backwards from its end in
+        blocks, so the cost depends on `rows` only and not on the number of
+        samples stored before them. Samples are single lines, values holding
+        a line break are not supported here.
+        """
+        with self.lock, open(self.filename, "rb") as data_file:
+            header = data_file.readline()
+            start = len(header)
+            position = data_file.seek(0, SEEK_END)
+
+            block = b""
+            while position > start and block.count(b"\n") <= rows:
+                size = min(TAIL_BLOCK_SIZE, position - start)
+                position -= size
+                data_file.seek(position)
+                block = data_file.read(size) + block
+
+        lines = block.splitlines(keepends=True)[-rows:] if rows > 0 else []
+        return pd.read_csv(
+            BytesIO(header + b"".join(lines)), usecols=self._usecols(columns)
+        )
+
+    def write(self, data: pd.DataFrame) -> None:
+        temporary_filename = self.filename + ".tmp"
+        data.to_csv(temporary_filename, sep=",", index=False, lineterminator="\n")
+        replace(temporary_filename, self.filename)
+
+        self._write_rows(len(data.index))
+
+    def _rows(self) -> int:
+        # Called with self.lock held.
+        try:
+            with open(self.rows_filename, "r", encoding="utf-8") as rows_file:
+                return int(rows_file.read())
+        except (FileNotFoundError, ValueError):
+            pass
+
+        if not self.exists():
+            return 0
+
+        # Training data stored before the counter existed is counted once.
+        with open(self.filename, "r", encoding="utf-8", newline="") as data_file:
+            rows = max(sum(1 for _ in csv.reader(data_file)) - 1, 0)
+
+        self._write_rows(rows)
+        return rows
+
+    def _write_rows(self, rows: int) -> None:
+        temporary_filename = self.rows_filename + ".tmp"
+        with open(temporary_filename, "w", encoding="utf-8") as rows_file:
+            rows_file.write(str(rows))
+
+        replace(temporary_filename, self.rows_filename)
+
+    def _write_header(self, columns: List[str]) -> None:
+        with open(self.filename, "w", encoding="utf-8", newline="") as data_file:
+            csv.writer(data_file, lineterminator="\n").writerow(columns)
+
+    def _evolve_schema(self, columns: List[str], added: int) -> None:
+        temporary_filename = self.filename + ".tmp"
+
+        with (
+            open(self.filename, "r", encoding="utf-8", newline="") as source,
+            open(temporary_filename, "w", encoding="utf-8", newline="") as target,
+        ):
+            reader = csv.reader(source)
+            writer = csv.writer(target, lineterminator="\n")
+
+            next(reader, None)
+            writer.writerow(columns)
+            for existing_row in reader:
+                writer.writerow(existing_row + [""] * added)
+
+        replace(temporary_filename, self.filename)
+
+
+# Kind of a column of the columnar store and the fixed width type its values
+# are stored with. Missing values are NaN for `float`, -1 for `bool` and for
+# the category codes of `string`. An `int` column has no missing values, a
+# missing value turns it into a `float` column like pd.read_csv does. An
+# `empty` column holds missing values only and has no file.
+COLUMN_DTYPES: Dict[str, Any] = {
+    "float": np.float64,
+    "int": np.int64,
+    "bool": np.int8,
+    "string": np.int32,
+}
+
+
+# Kind of the columns pd.read_csv gives a type without missing values to.
+PANDAS_KINDS: Dict[str, str] = {"float64": "float", "int64": "int", "bool": "bool"}
+
+
+class ColumnarTrainingData(TrainingData):
+    """
+    Training data of one brain, stored column by column in the directory
+    `training_data` of the brain: one file of fixed width binary values per
+    column and a `schema.json` with the number of rows and the kind of each
+    column. Strings are stored as codes of their distinct values.
+
+    Nothing is parsed from text and no types are guessed when loading. Only
+    the requested columns are read, memory mapped from their files. A new
+    sample appends one value to every column file. The loaded DataFrame
+    equals the one pd.read_csv gives for the same samples stored as CSV.
+    """
+
+    def __init__(self, name: str, brains_directory: Optional[Path] = None):
+        super().__init__(name, brains_directory)
+        self.columns_directory: str = Brain.sanitize_filename(
+            name, BrainFileType.TRAINING_DATA_COLUMNS, brains_directory
+        )
+        self.schema_filename: str = path.join(self.columns_directory, "schema.json")
+
+    def exists(self) -> bool:
+        return path.exists(self.schema_filename)
+
+    def columns(self) -> List[str]:
+        return [column["name"] for column in self._schema()["columns"]]
+
+    def rows(self) -> int:
+        with self.lock:
+            return self._schema()["rows"]
+
+    def append(self, row: Dict[str, Any]) -> None:
+        self.append_many([row])
+
+    def append_many(self, rows: List[Dict[str, Any]]) -> None:
+        """All samples are appended with one write per column file."""
+        if not rows:
+            return
+
+        with self.lock:
+            makedirs(self.columns_directory, exist_ok=True)
+            schema = self._schema()
+            stored = schema["rows"]
+
+            known = {column["name"] for column in schema["columns"]}
+            for row in rows:
+                for name in row:
+                    if name not in known:
+                        known.add(name)
+                        schema["columns"].append(
+                            {
+                                "name": name,
+                                "kind": "empty",
+                                "file": f"{len(schema['columns'])}.bin",
+                            }
+                        )
+
+            for column in schema["columns"]:
+                values = [self._value(row.get(column["name"])) for row in rows]
+                kind = column["kind"]
+                for position, value in enumerate(values):
+                    kind = self._combined_kind(
+                        kind, self._kind(value), stored + position
+                    )
+
+                if kind != column["kind"]:
+                    self._convert(column, kind, stored)
+                    if kind == "string" and len(values) > 1:
+                        values = [self._text(value) for value in values]
+
+                if kind != "empty":
+                    self._append_values(column, values, stored)
+
+            schema["rows"] = stored + len(rows)
+            self._write_schema(schema)
+
+    def load(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        with self.lock:
+            schema = self._schema()
+            return self._frame(schema, columns, 0, schema["rows"])
+
+    def tail(self, rows: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        with self.lock:
+            schema = self._schema()
+            stored = schema["rows"]
+            return self._frame(schema, columns, max(stored - rows, 0), stored)
+
+    def write(self, data: pd.DataFrame) -> None:
+        makedirs(self.columns_directory, exist_ok=True)
+        rows = len(data.index)
+
+        schema: Dict[str, Any] = {"rows": rows, "columns": []}
+        for index, name in enumerate(data.columns):
+            column: Dict[str, Any] = {
+                "name": name,
+                "kind": "empty",
+                "file": f"{index}.bin",
+            }
+            schema["columns"].append(column)
+
+            series = data[name]
+            if bool(series.isna().all()):
+                continue
+
+            kind = PANDAS_KINDS.get(str(series.dtype))
+            if kind is not None:
+                column["kind"] = kind
+                self._store(column, series.to_numpy(dtype=COLUMN_DTYPES[kind]))
+                continue
+
+            values = [self._value(value) for value in series.tolist()]
+            for position, value in enumerate(values):
+                column["kind"] = self._combined_kind(
+                    column["kind"], self._kind(value), position
+                )
+            self._write_values(column, values)
+
+        self._write_schema(schema)
+
+    def _schema(self) -> Dict[str, Any]:
+        try:
+            with open(self.schema_filename, "r", encoding="utf-8") as schema_file:
+                return json.load(schema_file)
+        except FileNotFoundError:
+            return {"rows": 0, "columns": []}
+
+    def _write_schema(self, schema: Dict[str, Any]) -> None:
+        temporary_filename = self.schema_filename + ".tmp"
+        with open(temporary_filename, "w", encoding="utf-8") as schema_file:
+            json.dump(schema, schema_file)
+
+        replace(temporary_filename, self.schema_filename)
+
+    def _filename(self, column: Dict[str, Any]) -> str:
+        return path.join(self.columns_directory, column["file"])
+
+    def _frame(
+        self,
+        schema: Dict[str, Any],
+        columns: Optional[List[str]],
+        start: int,
+        stop: int,
+    ) -> pd.DataFrame:
+        wanted = None if columns is None else set(columns)
+        return pd.DataFrame(
+            {
+                column["name"]: self._series(column, start, stop)
+                for column in schema["columns"]
+                if wanted is None or column["name"] in wanted
+            },
+            index=pd.RangeIndex(stop - start),
+        )
+
+    def _series(self, column: Dict[str, Any], start: int, stop: int) -> pd.Series:
+        kind = column["kind"]
+        if kind == "empty" or stop <= start:
+            values = np.full(stop - start, np.nan)
+            if kind == "string":
+                return pd.Series(values, dtype="str")
+            return pd.Series(values)
+
+        stored = np.memmap(
+            self._filename(column), dtype=COLUMN_DTYPES[kind], mode="r", shape=(stop,)
+        )[start:stop]
+
+        if kind == "bool":
+            if (stored < 0).any():
+                return pd.Series(
+                    np.array([True, False, np.nan], dtype=object)[
+                        np.where(stored < 0, 2, 1 - stored)
+                    ]
+                )
+            return pd.Series(stored.astype(bool))
+
+        if kind == "string":
+            categories = np.array(column["categories"] + [np.nan], dtype=object)
+            return pd.Series(categories[stored], dtype="str")
+
+        return pd.Series(stored)
+
+    def _append_values(self, column: Dict[str, Any], values: List[Any], rows: int):
+        filename = self._filename(column)
+        encoded = self._encode(column, values)
+
+        expected_size = rows * encoded.itemsize
+        with open(filename, "ab") as column_file:
+            # Values of an interrupted append, not counted in the schema.
+            if path.getsize(filename) != expected_size:
+                column_file.truncate(expected_size)
+            column_file.write(encoded.tobytes())
+
+    def _write_values(self, column: Dict[str, Any], values: List[Any]) -> None:
+        column.pop("categories", None)
+        self._store(column, self._encode(column, values))
+
+    def _store(self, column: Dict[str, Any], encoded: np.ndarray) -> None:
+        temporary_filename = self._filename(column) + ".tmp"
+        encoded.tofile(temporary_filename)
+        replace(temporary_filename, self._filename(column))
+
+    def _convert(self, column: Dict[str, Any], kind: str, rows: int) -> None:
+        values = [self._value(value) for value in self._series(column, 0, rows)]
+        if kind == "string":
+            values = [self._text(value) for value in values]
+
+        column["kind"] = kind
+        if rows > 0:
+            self._write_values(column, values)
+
+    @staticmethod
+    def _encode(column: Dict[str, Any], values: List[Any]) -> np.ndarray:
+        kind = column["kind"]
+        if kind == "bool":
+            return np.array(
+                [-1 if value is None else int(bool(value)) for value in values],
+                dtype=np.int8,
+            )
+
+        if kind == "string":
+            categories: List[str] = column.setdefault("categories", [])
+            codes = {category: code for code, category in enumerate(categories)}
+            encoded = np.empty(len(values), dtype=np.int32)
+            for position, value in enumerate(values):
+                if value is None:
+                    encoded[position] = -1
+                    continue
+
+                value = str(value)
+                if value not in codes:
+                    codes[value] = len(categories)
+                    categories.append(value)
+                encoded[position] = codes[value]
+
+            return encoded
+
+        return np.array(
+            [np.nan if value is None else value for value in values],
+            dtype=COLUMN_DTYPES[kind],
+        )
+
+
+class SqliteTrainingData(TrainingData):
+    """
+    Training data of one brain, stored in the SQLite database
+    `training_data.sqlite` of the brain. Every sample is a row of the table
+    `samples`, indexed by its `timestamp`, so the last samples and the
+    samples of a time range are read through the index instead of reading
+    all samples. The database runs in WAL mode, reading never waits for
+    writing. append_many stores many samples with a single commit.
+
+    Columns are added to `samples` when a sample brings a new one. Their
+    kind is kept in the table `columns`, so loading gives the same DataFrame
+    as pd.read_csv of the same samples stored as CSV.
+    """
+
+    def __init__(self, name: str, brains_directory: Optional[Path] = None):
+        super().__init__(name, brains_directory)
+        self.filename: str = Brain.sanitize_filename(
+            name, BrainFileType.TRAINING_DATA_SQLITE_FILE, brains_directory
+        )
+
+    def exists(self) -> bool:
+        return path.exists(self.filename)
+
+    def columns(self) -> List[str]:
+        if not self.exists():
+            return []
+
+        with self._connect() as connection:
+            return [column["name"] for column in self._columns(connection)]
+
+    def rows(self) -> int:
+        if not self.exists():
+            return 0
+
+        with self._connect() as connection:
+            return self._rows(connection)
+
+    def append(self, row: Dict[str, Any]) -> None:
+        self.append_many([row])
+
+    def append_many(self, rows: List[Dict[str, Any]]) -> None:
+        with self.lock, self._connect(create=True) as connection:
+            self._insert(connection, rows)
+
+    def load(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return self._frame(columns, "SELECT {} FROM samples ORDER BY id")
+
+    def tail(self, rows: int, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return self._frame(
+            columns,
+            "SELECT {} FROM "
+            "(SELECT * FROM samples ORDER BY id DESC LIMIT ?) ORDER BY id",
+            (max(rows, 0),),
+        )
+
+    def window(
+        self,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        if since is None and until is None:
+            return self.load(columns)
+
+        # Without INDEXED BY SQLite prefers to walk all samples in the order
+        # of their id over sorting the few samples the index finds.
+        return self._frame(
+            columns,
+            "SELECT {} FROM samples INDEXED BY samples_timestamp "
+            "WHERE timestamp >= ? AND timestamp <= ? ORDER BY id",
+            (
+                -SQLITE_MAX_REAL if since is None else since,
+                SQLITE_MAX_REAL if until is None else until,
+            ),
+        )
+
+    def write(self, data: pd.DataFrame) -> None:
+        with self._connect(create=True) as connection:
+            connection.execute("DELETE FROM samples")
+            connection.execute("UPDATE columns SET kind = 'empty'")
+            self._write_rows(connection, 0)
+            self._insert(connection, data.to_dict("records"))
+
+    def _insert(
+        self, connection: sqlite3.Connection, rows: List[Dict[str, Any]]
+    ) -> None:
+        # Called with self.lock held, in the transaction of `connection`.
+        if not rows:
+            return
+
+        columns = self._columns(connection)
+        by_name = {column["name"]: column for column in columns}
+        kinds = {column["name"]: column["kind"] for column in columns}
+        stored = self._rows(connection)
+
+        values = []
+        for row in rows:
+            for name in row:
+                if name not in by_name:
+                    column = self._add_column(connection, name, len(columns))
+                    columns.append(column)
+                    by_name[name] = column
+
+            sample: List[Any] = [self._timestamp(row)]
+            for column in columns:
+                value = self._value(row.get(column["name"]))
+                column["kind"] = self._combined_kind(
+                    column["kind"], self._kind(value), stored
+                )
+                sample.append(value)
+
+            values.append(sample)
+            stored += 1
+
+        names = ", ".join(f"c{column['position']}" for column in columns)
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        connection.executemany(
+            f"INSERT INTO samples (timestamp, {names}) VALUES ({placeholders})",
+            values,
+        )
+        connection.executemany(
+            "UPDATE columns SET kind = ? WHERE position = ?",
+            [
+                (column["kind"], column["position"])
+                for column in columns
+                if kinds.get(column["name"]) != column["kind"]
+            ],
+        )
+        self._write_rows(connection, stored)
+
+    @contextmanager
+    def _connect(self, create: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        A connection in a transaction. Readers only open the database, the
+        writers (`create`, called with self.lock held) create its tables
+        and switch it to WAL mode once, when it has no tables yet.
+        """
+        connection = sqlite3.connect(self.filename, timeout=30)
+        try:
+            if create:
+                connection.execute("PRAGMA synchronous=NORMAL")
+                if not self._created(connection):
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(SQLITE_SCHEMA)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _created(connection: sqlite3.Connection) -> bool:
+        return (
+            connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'samples'"
+            ).fetchone()
+            is not None
+        )
+
+    @staticmethod
+    def _columns(connection: sqlite3.Connection) -> List[Dict[str, Any]]:
+        return [
+            {"position": position, "name": name, "kind": kind}
+            for position, name, kind in connection.execute(
+                "SELECT position, name, kind FROM columns ORDER BY position"
+            )
+        ]
+
+    @staticmethod
+    def _add_column(
+        connection: sqlite3.Connection, name: str, position: int
+    ) -> Dict[str, Any]:
+        connection.execute(f"ALTER TABLE samples ADD COLUMN c{position}")
+        connection.execute(
+            "INSERT INTO columns (position, name, kind) VALUES (?, ?, 'empty')",
+            (position, name),
+        )
+        return {"position": position, "name": name, "kind": "empty"}
+
+    @staticmethod
+    def _rows(connection: sqlite3.Connection) -> int:
+        row = connection.execute(
+            "SELECT value FROM counters WHERE name = 'rows'"
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    @staticmethod
+    def _write_rows(connection: sqlite3.Connection, rows: int) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO counters (name, value) VALUES ('rows', ?)",
+            (rows,),
+        )
+
+    @staticmethod
+    def _timestamp(row: Dict[str, Any]) -> Optional[float]:
+        timestamp = row.get("timestamp")
+        if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+            return float(timestamp)
+
+        return None
+
+    def _frame(
+        self, columns: Optional[List[str]], query: str, parameters: Tuple = ()
+    ) -> pd.DataFrame:
+        if not self.exists():
+            raise FileNotFoundError(self.filename)
+
+        with self._connect() as connection:
+            selected = [
+                column
+                for column in self._columns(connection)
+                if columns is None or column["name"] in columns
+            ]
+            names = ", ".join(
+                ["id", *(f"c{column['position']}" for column in selected)]
+            )
+            samples = connection.execute(query.format(names), parameters).fetchall()
+
+        values = list(zip(*samples)) if samples else [()] * (len(selected) + 1)
+        return pd.DataFrame(
+            {
+                column["name"]: self._series(column["kind"], list(column_values))
+                for column, column_values in zip(selected, values[1:])
+            },
+            index=pd.RangeIndex(len(samples)),
+        )
+
+    def _series(self, kind: str, values: List[Any]) -> pd.Series:
+        # pandas turns None into NaN itself where the dtype allows it.
+        if kind == "bool":
+            if None in values:
+                return pd.Series(
+                    [np.nan if value is None else bool(value) for value in values],
+                    dtype=object,
+                )
+            return pd.Series(values, dtype=bool)
+
+        if kind == "string":
+            if not all(value is None or isinstance(value, str) for value in values):
+                values = [self._text(value) for value in values]
+            return pd.Series(values, dtype="str")
+
+        if kind == "int":
+            return pd.Series(values, dtype=np.int64)
+
+        return pd.Series(values, dtype=np.float64)
+
+
+SQLITE_MAX_REAL = 1.7976931348623157e308
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS columns (
+    position INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL
+);
+CREATE INDEX IF NOT EXISTS samples_timestamp ON samples (timestamp);
+"""
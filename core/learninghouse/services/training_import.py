@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import math
+from threading import Lock
+from time import monotonic
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from learninghouse.errors.brain import BrainBadRequest
+from learninghouse.models.brain import (
+    BrainImportFormat,
+    BrainInfo,
+    BrainStreamResult,
+)
+from learninghouse.models.sensor import Sensors, SensorType
+from learninghouse.services.brain import BrainService
+from learninghouse.services.executor import run_prediction, run_training
+from learninghouse.services.preprocessing import DatasetPreprocessing
+
+TIMESTAMP = "timestamp"
+
+CSV_TRUE = ("true", "on", "yes")
+CSV_FALSE = ("false", "off", "no")
+
+
+class TrainingDataImport:
+    """
+    Bulk import of data points of one brain from a request body in one of
+    the BrainImportFormat. The body is `feed` in chunks as it arrives, each
+    complete line is parsed and validated against sensors.json at once, so
+    an invalid body is rejected before it is read completely. The data
+    points are kept until `samples` hands all of them over for a single
+    write.
+
+    `csv` has a header line with the names of the sensors, of the brain for
+    the dependent variable and optionally `timestamp`. `ndjson` has one JSON
+    object per line, shaped like the body of a training request.
+    """
+
+    def __init__(self, name: str, import_format: BrainImportFormat):
+        self.name: str = name
+        self.format: BrainImportFormat = import_format
+        self.line: int = 0
+        self._samples: List[Dict[str, Any]] = []
+        # A stream takes batches while the next chunk is fed on a thread.
+        self._samples_lock = Lock()
+        self._rest: bytes = b""
+        self._header: Optional[List[str]] = None
+
+        _, sensors = Sensors.cached_config()
+        self._sensors: Dict[str, SensorType] = {
+            sensor.name: sensor.typed for sensor in sensors
+        }
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def feed(self, chunk: bytes) -> int:
+        """Parse the complete lines of the body read so far."""
+        lines = (self._rest + chunk).split(b"\n")
+        self._rest = lines.pop()
+        for line in lines:
+            self._parse(line)
+
+        return self.count
+
+    def take(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        The data points parsed since the last `take`, at most `limit` of
+        them, for storing a batch.
+        """
+        with self._samples_lock:
+            if limit is None or limit >= len(self._samples):
+                samples, self._samples = self._samples, []
+            else:
+                samples = self._samples[:limit]
+                self._samples = self._samples[limit:]
+
+        return samples
+
+    def samples(self) -> List[Dict[str, Any]]:
+        """
+        The data points not taken yet, with time information, after the
+        whole body was fed.
+        """
+        if self._rest:
+            self._parse(self._rest)
+            self._rest = b""
+
+        if self.format == BrainImportFormat.CSV and self._header is None:
+            raise BrainBadRequest("Missing header line of the CSV data")
+
+        return self._samples
+
+    def _parse(self, raw: bytes) -> None:
+        self.line += 1
+        try:
+            text = raw.decode("utf-8").strip()
+        except UnicodeDecodeError as exc:
+            raise self._error("is not UTF-8") from exc
+
+        if not text:
+            return
+
+        if self.format == BrainImportFormat.CSV:
+            row = self._csv_row(text)
+        else:
+            row = self._ndjson_row(text)
+
+        if row is not None:
+            row = DatasetPreprocessing.add_time_information(row)
+            with self._samples_lock:
+                self._samples.append(row)
+
+    def _csv_row(self, text: str) -> Optional[Dict[str, Any]]:
+        values = next(csv.reader([text]))
+
+        if self._header is None:
+            if self.name not in values:
+                raise self._error(f"misses the dependent variable {self.name}")
+            for column in values:
+                self._validate_column(column)
+            self._header = values
+            return None
+
+        if len(values) != len(self._header):
+            raise self._error(
+                f"has {len(values)} values, but the header {len(self._header)}"
+            )
+
+        row: Dict[str, Any] = {}
+        for column, value in zip(self._header, values):
+            if column == self.name:
+                row[column] = self._csv_dependent(value)
+            elif value == "":
+                row[column] = None
+            elif self._is_numerical(column):
+                row[column] = self._csv_number(column, value)
+            else:
+                row[column] = value
+
+        if row[self.name] is None:
+            raise self._error(f"misses the dependent variable {self.name}")
+        if row.get(TIMESTAMP, 0) is None:
+            del row[TIMESTAMP]
+
+        return row
+
+    def _csv_dependent(self, value: str) -> Any:
+        if value.lower() in CSV_TRUE:
+            return True
+        if value.lower() in CSV_FALSE:
+            return False
+        if value == "":
+            return None
+
+        return self._csv_number(self.name, value)
+
+    def _csv_number(self, column: str, value: str) -> float:
+        try:
+            number = float(value)
+        except ValueError as exc:
+            raise self._error(f"has no number for {column}: {value}") from exc
+
+        if not math.isfinite(number):
+            raise self._error(f"has no finite number for {column}: {value}")
+
+        return number
+
+    def _ndjson_row(self, text: str) -> Dict[str, Any]:
+        try:
+            data = json.loads(text)
+        except ValueError as exc:
+            raise self._error("is no JSON") from exc
+
+        sensors_data = data.get("sensors_data") if isinstance(data, dict) else None
+        if not isinstance(sensors_data, dict):
+            raise self._error("has no object with sensors_data")
+
+        dependent_value = data.get("dependent_value")
+        if isinstance(dependent_value, bool):
+            pass
+        elif not self._is_number(dependent_value):
+            raise self._error("has no boolean or number as dependent_value")
+
+        row: Dict[str, Any] = {}
+        for column, value in sensors_data.items():
+            self._validate_column(column)
+            if column == self.name:
+                raise self._error(f"has the dependent variable {column} as sensor")
+
+            if self._is_numerical(column):
+                if value is not None and not self._is_number(value):
+                    raise self._error(f"has no number for {column}: {value}")
+            elif value is not None and not isinstance(value, (str, bool, int, float)):
+                raise self._error(f"has no value for {column}: {value}")
+
+            row[column] = value
+
+        if row.get(TIMESTAMP, 0) is None:
+            del row[TIMESTAMP]
+        row[self.name] = dependent_value
+
+        return row
+
+    def _validate_column(self, column: str) -> None:
+        if column not in self._sensors and column not in (self.name, TIMESTAMP):
+            raise self._error(f"has the unknown sensor {column}")
+
+    def _is_numerical(self, column: str) -> bool:
+        return column == TIMESTAMP or self._sensors[column] != SensorType.CATEGORICAL
+
+    @staticmethod
+    def _is_number(value: Any) -> bool:
+        return (
+            isinstance(value, (int, float))
+            and not isinstance(value, bool)
+            and math.isfinite(value)
+        )
+
+    def _error(self, message: str) -> BrainBadRequest:
+        return BrainBadRequest(f"Line {self.line} {message}")
+
+
+class TrainingDataStream:
+    """
+    Data points of one brain streamed as NDJSON in the body of one long
+    running request, e.g. by a sensor reporting every few seconds. The
+    request is authenticated once, the lines are parsed on the training
+    thread pool as they arrive and stored in batches: of `batch_size` data
+    points, or of the data points received within `batch_seconds`. Each
+    batch is written at once and announced to the background training at
+    once (see BrainService.store_streamed), so the stream never waits for a
+    training.
+
+    A batch is stored while the next lines are parsed. If storing falls
+    behind, reading the body waits for it. An invalid line ends the stream,
+    the data points before it are stored.
+    """
+
+    def __init__(
+        self, importer: TrainingDataImport, batch_size: int, batch_seconds: float
+    ):
+        self.name: str = importer.name
+        self.importer: TrainingDataImport = importer
+        self.batch_size: int = max(batch_size, 1)
+        self.batch_seconds: float = batch_seconds
+        self.stored_samples: int = 0
+        self.batches: int = 0
+        self.info: Optional[BrainInfo] = None
+        self._pending_since: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def open(
+        cls, name: str, batch_size: int, batch_seconds: float
+    ) -> TrainingDataStream:
+        importer = await run_training(
+            TrainingDataImport, name, BrainImportFormat.NDJSON
+        )
+        return cls(importer, batch_size, batch_seconds)
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> BrainStreamResult:
+        flusher = asyncio.create_task(self._flush_periodically())
+        try:
+            async for chunk in chunks:
+                await run_training(self.importer.feed, chunk)
+                self._received()
+                if self.importer.count >= self.batch_size:
+                    await self.flush(full_batches=True)
+                elif self._due():
+                    await self.flush()
+
+            await run_training(self.importer.samples)
+            await self.flush()
+        except BrainBadRequest:
+            await self.flush()
+            raise
+        finally:
+            flusher.cancel()
+
+        if self.info is None:
+            self.info = await run_prediction(BrainService.get_info, self.name)
+
+        return BrainStreamResult(
+            brain=self.info, stored_samples=self.stored_samples, batches=self.batches
+        )
+
+    async def flush(self, full_batches: bool = False) -> None:
+        """
+        Store the parsed data points in batches of at most `batch_size`. With
+        `full_batches` fewer than `batch_size` data points are left for the
+        next batch.
+        """
+        async with self._lock:
+            while self.importer.count >= self.batch_size or (
+                not full_batches and self.importer.count > 0
+            ):
+                samples = self.importer.take(self.batch_size)
+                self.info = await run_training(
+                    BrainService.store_streamed, self.name, samples
+                )
+                self.stored_samples += len(samples)
+                self.batches += 1
+
+            if self.importer.count == 0:
+                self._pending_since = None
+
+    def _received(self) -> None:
+        if self._pending_since is None and self.importer.count > 0:
+            self._pending_since = monotonic()
+
+    def _due(self) -> bool:
+        if self.importer.count >= self.batch_size:
+            return True
+
+        return (
+            self._pending_since is not None
+            and monotonic() - self._pending_since >= self.batch_seconds
+        )
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.batch_seconds)
+            if self._due():
+                await self.flush()
@@ -297,3 +297,105 @@ class TestInitialPasswordGate:
         )
 
         assert isolated_client.get("/api/mode").json() == "production"
+
+
+def _create_api_key(client, headers, description: str = "app_as_user") -> str:
+    response = client.post(
+        "/api/auth/apikey",
+        json={"description": description, "role": "user"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()["key"]
+
+
+class TestApiKeyCache:
+    """AuthServiceInternal remembers API keys which already passed the
+    sha512_crypt verification, so protect_user/protect_trainer only pay for
+    the hash once per key and TTL instead of on every request.
+    """
+
+    def test_repeated_requests_verify_the_key_only_once(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from learninghouse.models.auth import SecurityDatabase
+
+        key = _create_api_key(isolated_client, unlocked_admin_headers)
+
+        calls = []
+        original = SecurityDatabase.find_apikey_by_key
+
+        def counting_find_apikey_by_key(database, raw_key):
+            calls.append(raw_key)
+            return original(database, raw_key)
+
+        monkeypatch.setattr(
+            SecurityDatabase, "find_apikey_by_key", counting_find_apikey_by_key
+        )
+
+        for _ in range(3):
+            response = isolated_client.get(
+                "/api/auth/role", headers={"X-LEARNINGHOUSE-API-KEY": key}
+            )
+            assert response.status_code == 200
+            assert response.json() == "user"
+
+        assert calls == [key]
+
+    def test_deleted_key_is_rejected_at_once(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        key = _create_api_key(isolated_client, unlocked_admin_headers)
+        headers = {"X-LEARNINGHOUSE-API-KEY": key}
+
+        assert isolated_client.get("/api/auth/role", headers=headers).status_code == 200
+
+        isolated_client.delete(
+            "/api/auth/apikey/app_as_user", headers=unlocked_admin_headers
+        )
+
+        response = isolated_client.get("/api/auth/role", headers=headers)
+        assert response.status_code == 401
+
+    def test_unknown_key_is_not_cached(self, isolated_client, unlocked_admin_headers):
+        from learninghouse.services.auth import auth_service_cached
+
+        response = isolated_client.get(
+            "/api/auth/role", headers={"X-LEARNINGHOUSE-API-KEY": "not-a-key"}
+        )
+
+        assert response.status_code == 401
+        assert len(auth_service_cached().apikey_cache) == 0
+
+
+class TestApiKeyCacheEviction:
+    def _info(self, description: str):
+        from learninghouse.models.auth import APIKeyInfo, APIKeyRole
+
+        return APIKeyInfo(description=description, role=APIKeyRole.USER)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        from learninghouse.services.auth import APIKeyCache
+
+        cache = APIKeyCache(max_entries=2, ttl=60)
+        cache.put("first", self._info("first"))
+        cache.put("second", self._info("second"))
+        assert cache.get("first") is not None
+
+        cache.put("third", self._info("third"))
+
+        assert cache.get("second") is None
+        assert cache.get("first") is not None
+        assert cache.get("third") is not None
+
+    def test_expired_entry_is_dropped(self, monkeypatch):
+        import learninghouse.services.auth as auth_module
+
+        cache = auth_module.APIKeyCache(max_entries=2, ttl=60)
+        cache.put("first", self._info("first"))
+
+        now = auth_module.monotonic()
+        monkeypatch.setattr(auth_module, "monotonic", lambda: now + 61)
+
+        assert cache.get("first") is None
+        assert len(cache) == 0
@@ -9,6 +9,11 @@ estimator has a real signal to find. This is throwaway fixture data for
 exercising the endpoints, not the pinned baseline dataset from Task 9.
 """
 
+import time
+
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
 from tests.conftest import unlock
 
 BRAIN_NAME = "darkness"
@@ -91,6 +96,34 @@ class TestInfosGet:
         assert response.status_code == 200
         assert BRAIN_NAME in response.json()
 
+    def test_reads_neither_trained_brains_nor_training_data(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers, "shutter")
+        _push_training_rows(isolated_client, unlocked_admin_headers, "shutter", 3)
+
+        import learninghouse.models.brain as brain_module
+        import learninghouse.services.training_data as training_data_module
+
+        def fail(*args, **kwargs):
+            raise AssertionError("brain info read a trained brain or training data")
+
+        monkeypatch.setattr(brain_module.BrainArtifact, "load", fail)
+        monkeypatch.setattr(training_data_module.pd, "read_csv", fail)
+
+        response = isolated_client.get(
+            "/api/brains/info", headers=unlocked_admin_headers
+        )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body[BRAIN_NAME]["training_data_size"] == 10
+        assert body[BRAIN_NAME]["trained_at"] is not None
+        assert body[BRAIN_NAME]["actual_versions"] is True
+        assert body["shutter"]["training_data_size"] == 3
+        assert body["shutter"]["trained_at"] is None
+
     def test_missing_credentials_are_rejected(self, isolated_client):
         unlock(isolated_client)
 
@@ -116,6 +149,25 @@ class TestInfoGet:
         assert body["score"] == 0.0
         assert body["trained_at"] is None
 
+    def test_trained_brain_reports_outdated_versions(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        import learninghouse.models.brain as brain_module
+
+        upgraded_versions = brain_module.versions.model_copy(
+            update={"sklearn": "0.0.0-test-upgrade"}
+        )
+        monkeypatch.setattr(brain_module, "versions", upgraded_versions)
+
+        response = isolated_client.get(
+            f"/api/brain/{BRAIN_NAME}/info", headers=unlocked_admin_headers
+        )
+
+        assert response.status_code == 200
+        assert response.json()["actual_versions"] is False
+
     def test_unknown_brain_is_rejected(self, isolated_client, unlocked_admin_headers):
         response = isolated_client.get(
             "/api/brain/does-not-exist/info", headers=unlocked_admin_headers
@@ -239,6 +291,539 @@ class TestPredictionPost:
         assert response.json()["error"] == "NOT_ACTUAL"
 
 
+class TestPredictionsPost:
+    REQUESTS = [
+        {"azimuth": 150, "elevation": -10, "pressure_trend_1h": "falling"},
+        {"azimuth": 300, "elevation": 40, "pressure_trend_1h": "rising"},
+        {"azimuth": 200.5, "pressure_trend_1h": None},
+    ]
+
+    def test_returns_the_single_predictions_in_request_order(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        requests = [{**request, "timestamp": 1700000000} for request in self.REQUESTS]
+
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/predictions",
+            json=requests,
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["brain"]["name"] == BRAIN_NAME
+        for request, result in zip(requests, body["predictions"], strict=True):
+            single = isolated_client.post(
+                f"/api/brain/{BRAIN_NAME}/prediction",
+                json=request,
+                headers=unlocked_admin_headers,
+            ).json()
+            assert result == {
+                "preprocessed": single["preprocessed"],
+                "prediction": single["prediction"],
+            }
+
+    def test_empty_batch_returns_no_predictions(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/predictions",
+            json=[],
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.status_code == 200
+        assert response.json()["predictions"] == []
+
+    def test_untrained_brain_is_rejected(self, isolated_client, unlocked_admin_headers):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/predictions",
+            json=self.REQUESTS,
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.status_code == 404
+        assert response.json()["error"] == "NOT_TRAINED"
+
+
+class TestBrainsPredictionPost:
+    SENSORS_DATA = {
+        "timestamp": 1700000000,
+        "azimuth": 150,
+        "elevation": -10,
+        "pressure_trend_1h": "falling",
+    }
+
+    def _set_up_two_trained_brains(self, client, headers) -> None:
+        _set_up_trained_brain(client, headers)
+        _create_brain_configuration(client, headers, "shutter")
+        response = _push_training_rows(client, headers, "shutter")
+        assert response is not None
+        assert response.status_code == 200, response.json()
+
+    def test_predicts_with_all_trained_brains(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        self._set_up_two_trained_brains(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers, "heat")
+
+        response = isolated_client.post(
+            "/api/brains/prediction",
+            json={"sensors_data": self.SENSORS_DATA},
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert sorted(body["predictions"]) == [BRAIN_NAME, "shutter"]
+        assert body["errors"] == {}
+        for name, result in body["predictions"].items():
+            single = isolated_client.post(
+                f"/api/brain/{name}/prediction",
+                json=self.SENSORS_DATA,
+                headers=unlocked_admin_headers,
+            ).json()
+            assert result["preprocessed"] == single["preprocessed"]
+            assert result["prediction"] == single["prediction"]
+
+    def test_untrained_brains_are_reported_as_errors(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.post(
+            "/api/brains/prediction",
+            json={
+                "sensors_data": self.SENSORS_DATA,
+                "brains": [BRAIN_NAME, "does-not-exist"],
+            },
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.status_code == 200
+        body = response.json()
+        assert list(body["predictions"]) == [BRAIN_NAME]
+        assert body["errors"]["does-not-exist"]["error"] == "NOT_TRAINED"
+
+
+class TestPredictionWebSocket:
+    REQUEST = {
+        "azimuth": 150,
+        "elevation": -10,
+        "pressure_trend_1h": "falling",
+        "timestamp": 1700000000,
+    }
+
+    def test_frames_are_answered_like_prediction_requests(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        expected = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/prediction",
+            json=self.REQUEST,
+            headers=unlocked_admin_headers,
+        ).json()
+
+        with isolated_client.websocket_connect(
+            f"/api/brain/{BRAIN_NAME}/prediction/ws", headers=unlocked_admin_headers
+        ) as websocket:
+            for _ in range(3):
+                websocket.send_json(self.REQUEST)
+                body = websocket.receive_json()
+
+                assert body["prediction"] == expected["prediction"]
+                assert body["preprocessed"] == expected["preprocessed"]
+                assert body["brain"]["name"] == BRAIN_NAME
+
+    def test_api_key_as_query_parameter(self, isolated_client, unlocked_admin_headers):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        key = isolated_client.post(
+            "/api/auth/apikey",
+            json={"description": "controller", "role": "user"},
+            headers=unlocked_admin_headers,
+        ).json()["key"]
+
+        with isolated_client.websocket_connect(
+            f"/api/brain/{BRAIN_NAME}/prediction/ws?api_key={key}"
+        ) as websocket:
+            websocket.send_json(self.REQUEST)
+
+            assert isinstance(websocket.receive_json()["prediction"], bool)
+
+    def test_errors_are_answered_without_closing(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+
+        with isolated_client.websocket_connect(
+            f"/api/brain/{BRAIN_NAME}/prediction/ws", headers=unlocked_admin_headers
+        ) as websocket:
+            websocket.send_text("no json")
+            assert websocket.receive_json()["error"] == "BAD_REQUEST"
+
+            websocket.send_json(self.REQUEST)
+            assert websocket.receive_json()["error"] == "NOT_TRAINED"
+
+    def test_invalid_api_key_is_rejected(self, unlocked_client):
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with unlocked_client.websocket_connect(
+                f"/api/brain/{BRAIN_NAME}/prediction/ws?api_key=invalid"
+            ):
+                pass
+
+        assert exc_info.value.code == 1008
+
+
+class TestPredictionSubscribe:
+    STATE = {"azimuth": 150, "elevation": -10, "pressure_trend_1h": "falling"}
+
+    def test_predictions_are_pushed_when_a_feature_changes(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        with isolated_client.websocket_connect(
+            f"/api/brain/{BRAIN_NAME}/prediction/subscribe",
+            headers=unlocked_admin_headers,
+        ) as websocket:
+            response = isolated_client.put(
+                "/api/sensors/state", json=self.STATE, headers=unlocked_admin_headers
+            )
+            assert response.status_code == 200
+            assert response.json()["predicted"] == [BRAIN_NAME]
+            assert isinstance(websocket.receive_json()["prediction"], bool)
+
+            response = isolated_client.put(
+                "/api/sensors/state", json={"rain": 1}, headers=unlocked_admin_headers
+            )
+            assert response.json() == {"changed": ["rain"], "predicted": []}
+
+            response = isolated_client.put(
+                "/api/sensors/state",
+                json={"elevation": 40},
+                headers=unlocked_admin_headers,
+            )
+            assert response.json()["predicted"] == [BRAIN_NAME]
+            assert websocket.receive_json()["preprocessed"]["elevation"] == 40
+
+        response = isolated_client.get(
+            "/api/sensors/state", headers=unlocked_admin_headers
+        )
+        assert response.json() == {**self.STATE, "rain": 1, "elevation": 40}
+
+
+class TestMetricsGet:
+    def test_predictions_of_a_loaded_brain_are_cache_hits(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        def metrics() -> dict:
+            response = isolated_client.get(
+                "/api/brains/metrics", headers=unlocked_admin_headers
+            )
+            assert response.status_code == 200
+            return response.json()["model_cache"]
+
+        before = metrics()
+        for _ in range(3):
+            isolated_client.post(
+                f"/api/brain/{BRAIN_NAME}/prediction",
+                json={"azimuth": 150, "elevation": -10},
+                headers=unlocked_admin_headers,
+            )
+        after = metrics()
+
+        assert after["misses"] - before["misses"] <= 1
+        assert after["hits"] - before["hits"] >= 2
+        assert after["size_bytes"] > 0
+
+    def test_memory_of_a_brain_predicting_on_its_mapped_forest(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/prediction",
+            json={"azimuth": 150, "elevation": -10},
+            headers=unlocked_admin_headers,
+        )
+
+        response = isolated_client.get(
+            "/api/brains/metrics", headers=unlocked_admin_headers
+        )
+
+        assert response.status_code == 200
+        memory = response.json()["memory"][BRAIN_NAME]
+        assert memory["mapped_bytes"] > 0
+        # At most the pages of the mapped file, no copy of the trees.
+        pages = -(-memory["mapped_bytes"] // 4096) + 1
+        assert memory["shared_bytes"] + memory["private_bytes"] <= pages * 4096
+
+    def test_preload_loads_all_trained_brains(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.model_cache import model_cache
+
+        model_cache().remove(BrainService.cache_key(BRAIN_NAME))
+        BrainService.preload(["*"])
+
+        assert BrainService.cache_key(BRAIN_NAME) in model_cache()
+
+
+class TestPredictionCache:
+    REQUEST = {
+        "azimuth": 150,
+        "elevation": -10,
+        "pressure_trend_1h": "falling",
+        "timestamp": 1700000000,
+    }
+
+    def test_predictions_of_the_same_quantized_features_are_cache_hits(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        configuration = {
+            **BRAIN_CONFIGURATION,
+            "prediction_cache": {"size": 10, "quantization": {"azimuth": 10.0}},
+        }
+        response = isolated_client.post(
+            "/api/brain/configuration",
+            json=configuration,
+            headers=unlocked_admin_headers,
+        )
+        assert response.status_code == 201, response.json()
+        _push_training_rows(isolated_client, unlocked_admin_headers)
+
+        def predict(azimuth: float) -> dict:
+            response = isolated_client.post(
+                f"/api/brain/{BRAIN_NAME}/prediction",
+                json={**self.REQUEST, "azimuth": azimuth},
+                headers=unlocked_admin_headers,
+            )
+            assert response.status_code == 200, response.json()
+            return response.json()
+
+        def metrics() -> dict:
+            response = isolated_client.get(
+                "/api/brains/metrics", headers=unlocked_admin_headers
+            )
+            return response.json()["prediction_cache"][BRAIN_NAME]
+
+        first = predict(150)
+        second = predict(151)
+
+        assert second["prediction"] == first["prediction"]
+        assert metrics()["hits"] == 1
+        assert metrics()["misses"] == 1
+
+        _push_training_rows(isolated_client, unlocked_admin_headers, rows=1)
+        predict(150)
+
+        assert metrics()["misses"] == 2
+        assert metrics()["entries"] == 1
+
+    def test_brain_loaded_again_keeps_its_predictions(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.model_cache import model_cache
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        configuration = {**BRAIN_CONFIGURATION, "prediction_cache": {"size": 10}}
+        response = isolated_client.post(
+            "/api/brain/configuration",
+            json=configuration,
+            headers=unlocked_admin_headers,
+        )
+        assert response.status_code == 201, response.json()
+        _push_training_rows(isolated_client, unlocked_admin_headers)
+
+        for _ in range(2):
+            model_cache().remove(BrainService.cache_key(BRAIN_NAME))
+            response = isolated_client.post(
+                f"/api/brain/{BRAIN_NAME}/prediction",
+                json=self.REQUEST,
+                headers=unlocked_admin_headers,
+            )
+            assert response.status_code == 200, response.json()
+
+        response = isolated_client.get(
+            "/api/brains/metrics", headers=unlocked_admin_headers
+        )
+        assert response.json()["prediction_cache"][BRAIN_NAME]["hits"] == 1
+
+    def test_disabled_by_default(self, isolated_client, unlocked_admin_headers):
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/prediction",
+            json=self.REQUEST,
+            headers=unlocked_admin_headers,
+        )
+
+        response = isolated_client.get(
+            "/api/brains/metrics", headers=unlocked_admin_headers
+        )
+
+        assert BRAIN_NAME not in response.json()["prediction_cache"]
+
+
+class TestFeatureSelection:
+    def _train(
+        self, client, headers, feature_selection: str, rows: int = 10, **training
+    ) -> dict:
+        configuration = {
+            **BRAIN_CONFIGURATION,
+            "training": {"feature_selection": feature_selection, **training},
+        }
+        response = client.post(
+            "/api/brain/configuration", json=configuration, headers=headers
+        )
+        assert response.status_code in (201, 409), response.json()
+
+        response = _push_training_rows(client, headers, rows=rows)
+        assert response is not None
+        assert response.status_code == 200, response.json()
+        return response.json()
+
+    def test_none_uses_all_columns(self, isolated_client, unlocked_admin_headers):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+
+        info = self._train(isolated_client, unlocked_admin_headers, "none")
+
+        assert "azimuth" in info["features"]
+        assert "pressure_trend_1h_falling" in info["features"]
+        assert "hour_of_day" in info["features"]
+
+    def test_previous_reuses_the_importances_of_the_last_training(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        first = self._train(isolated_client, unlocked_admin_headers, "previous")
+
+        import learninghouse.services.brain as brain_service_module
+
+        def fail(*args, **kwargs):
+            raise AssertionError("SelectFromModel fitted again")
+
+        monkeypatch.setattr(brain_service_module.SelectFromModel, "fit", fail)
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/training", headers=unlocked_admin_headers
+        )
+
+        assert response.status_code == 200, response.json()
+        assert response.json()["features"] == first["features"]
+
+    def test_previous_refits_the_importances_every_rebuild(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        self._train(
+            isolated_client, unlocked_admin_headers, "previous", rebuild_every=2
+        )
+
+        import learninghouse.services.brain as brain_service_module
+
+        fit = brain_service_module.SelectFromModel.fit
+        fitted = []
+
+        def counting_fit(selector, *args, **kwargs):
+            fitted.append(selector)
+            return fit(selector, *args, **kwargs)
+
+        monkeypatch.setattr(brain_service_module.SelectFromModel, "fit", counting_fit)
+        for _ in range(3):
+            response = isolated_client.post(
+                f"/api/brain/{BRAIN_NAME}/training", headers=unlocked_admin_headers
+            )
+            assert response.status_code == 200, response.json()
+
+        assert len(fitted) == 1
+
+    def test_surrogate_selects_from_a_smaller_forest(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+
+        import learninghouse.services.brain as brain_service_module
+
+        def fail(*args, **kwargs):
+            raise AssertionError("SelectFromModel fitted")
+
+        monkeypatch.setattr(brain_service_module.SelectFromModel, "fit", fail)
+        info = self._train(isolated_client, unlocked_admin_headers, "surrogate")
+
+        assert 0 < len(info["features"]) < 12
+
+
+class TestWatchedModelCache:
+    def test_cached_brain_is_predicted_without_file_system_access(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from learninghouse.core.settings import service_settings
+        from learninghouse.core.settings.models import ModelCacheValidation
+        from learninghouse.services import model_cache as model_cache_module
+
+        monkeypatch.setattr(
+            service_settings(), "model_cache_validation", ModelCacheValidation.WATCH
+        )
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        def predict() -> dict:
+            response = isolated_client.post(
+                f"/api/brain/{BRAIN_NAME}/prediction",
+                json={"azimuth": 150, "elevation": -10},
+                headers=unlocked_admin_headers,
+            )
+            assert response.status_code == 200, response.json()
+            return response.json()
+
+        first = predict()
+
+        def failing_stat(_):
+            raise AssertionError("stat of a cached brain")
+
+        monkeypatch.setattr(model_cache_module, "stat", failing_stat)
+        hits = model_cache_module.model_cache().metrics.hits
+
+        assert predict() == first
+        assert model_cache_module.model_cache().metrics.hits == hits + 1
+
+    def test_retraining_in_this_process_replaces_the_cached_brain(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from learninghouse.core.settings import service_settings
+        from learninghouse.core.settings.models import ModelCacheValidation
+
+        monkeypatch.setattr(
+            service_settings(), "model_cache_validation", ModelCacheValidation.WATCH
+        )
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/prediction",
+            json={"azimuth": 150},
+            headers=unlocked_admin_headers,
+        )
+
+        _push_training_rows(isolated_client, unlocked_admin_headers, rows=2)
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/prediction",
+            json={"azimuth": 150},
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.json()["brain"]["training_data_size"] == 12
+
+
 class TestConfigurationGet:
     def test_existing_brain_configuration_is_returned(
         self, isolated_client, unlocked_admin_headers
@@ -332,3 +917,438 @@ class TestConfigurationDelete:
 
         assert response.status_code == 404
         assert response.json()["error"] == "NO_CONFIGURATION"
+
+
+def _wait_for_training(client, headers, name: str = BRAIN_NAME) -> dict:
+    deadline = time.monotonic() + 30
+    while True:
+        response = client.get(f"/api/brain/{name}/training", headers=headers)
+        assert response.status_code == 200
+        status = response.json()
+        if status["state"] == "idle":
+            return status
+        assert time.monotonic() < deadline, status
+        time.sleep(0.05)
+
+
+class TestTrainingBackground:
+    def test_samples_are_accepted_and_trained_in_the_background(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        configuration = {
+            **BRAIN_CONFIGURATION,
+            "training": {"background": True, "debounce": 0.1},
+        }
+        response = isolated_client.post(
+            "/api/brain/configuration",
+            json=configuration,
+            headers=unlocked_admin_headers,
+        )
+        assert response.status_code == 201
+
+        response = _push_training_rows(isolated_client, unlocked_admin_headers)
+
+        assert response is not None
+        assert response.status_code == 200
+        assert response.json()["trained_at"] is None
+
+        status = _wait_for_training(isolated_client, unlocked_admin_headers)
+        assert status["error"] is None
+        assert status["finished_at"] is not None
+
+        info = isolated_client.get(
+            f"/api/brain/{BRAIN_NAME}/info", headers=unlocked_admin_headers
+        ).json()
+        assert info["training_data_size"] == 10
+        assert info["trained_at"] is not None
+
+    def test_state_of_an_unknown_brain_is_rejected(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        response = isolated_client.get(
+            "/api/brain/does-not-exist/training", headers=unlocked_admin_headers
+        )
+
+        assert response.status_code == 404
+        assert response.json()["error"] == "NO_CONFIGURATION"
+
+
+def _import_csv(rows: int) -> str:
+    lines = ["azimuth,elevation,pressure_trend_1h," + BRAIN_NAME]
+    for index in range(rows):
+        sensors_data, dependent_value = _training_row(index)
+        lines.append(
+            ",".join(str(value) for value in sensors_data.values())
+            + f",{str(dependent_value).lower()}"
+        )
+
+    return "\n".join(lines) + "\n"
+
+
+class TestTrainingImport:
+    def test_data_points_are_stored_and_trained_once(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from learninghouse.services.brain import BrainService
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+        trainings = []
+        train = BrainService.train
+
+        def spy(name, data):
+            trainings.append(len(data.index))
+            return train(name, data)
+
+        monkeypatch.setattr(BrainService, "train", staticmethod(spy))
+
+        response = isolated_client.put(
+            f"/api/brain/{BRAIN_NAME}/training/import",
+            content=_import_csv(12),
+            headers={**unlocked_admin_headers, "Content-Type": "text/csv"},
+        )
+
+        assert response.status_code == 200, response.json()
+        assert response.json()["imported_samples"] == 12
+        assert response.json()["brain"]["training_data_size"] == 12
+        assert trainings == [12]
+
+    def test_ndjson_data_points(self, isolated_client, unlocked_admin_headers):
+        import json
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+        lines = []
+        for index in range(10):
+            sensors_data, dependent_value = _training_row(index)
+            lines.append(
+                json.dumps(
+                    {"dependent_value": dependent_value, "sensors_data": sensors_data}
+                )
+            )
+
+        response = isolated_client.put(
+            f"/api/brain/{BRAIN_NAME}/training/import",
+            content="\n".join(lines),
+            headers={**unlocked_admin_headers, "Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.status_code == 200, response.json()
+        assert response.json()["brain"]["trained_at"] is not None
+
+    def test_unknown_sensor_stores_nothing(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.put(
+            f"/api/brain/{BRAIN_NAME}/training/import",
+            content=_import_csv(12).replace("elevation", "altitude"),
+            headers={**unlocked_admin_headers, "Content-Type": "text/csv"},
+        )
+
+        assert response.status_code == 400
+        assert "altitude" in response.json()["description"]
+        info = isolated_client.get(
+            f"/api/brain/{BRAIN_NAME}/info", headers=unlocked_admin_headers
+        ).json()
+        assert info["training_data_size"] == 0
+
+    def test_unsupported_content_type_is_rejected(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.put(
+            f"/api/brain/{BRAIN_NAME}/training/import",
+            json=[],
+            headers=unlocked_admin_headers,
+        )
+
+        assert response.status_code == 400
+
+
+class TestTrainingStream:
+    def test_streamed_data_points_are_stored_in_batches(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        import json
+
+        from learninghouse.core.settings import service_settings
+
+        monkeypatch.setattr(service_settings(), "training_stream_batch_size", 5)
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+
+        def lines():
+            for index in range(12):
+                sensors_data, dependent_value = _training_row(index % 10)
+                line = json.dumps(
+                    {"dependent_value": dependent_value, "sensors_data": sensors_data}
+                )
+                yield line.encode("utf-8") + b"\n"
+
+        response = isolated_client.put(
+            f"/api/brain/{BRAIN_NAME}/training/stream",
+            content=lines(),
+            headers={**unlocked_admin_headers, "Content-Type": "application/x-ndjson"},
+        )
+
+        assert response.status_code == 200, response.json()
+        assert response.json()["stored_samples"] == 12
+        assert response.json()["batches"] == 3
+
+        status = _wait_for_training(isolated_client, unlocked_admin_headers)
+        assert status["error"] is None
+        info = isolated_client.get(
+            f"/api/brain/{BRAIN_NAME}/info", headers=unlocked_admin_headers
+        ).json()
+        assert info["training_data_size"] == 12
+
+    def test_csv_is_rejected(self, isolated_client, unlocked_admin_headers):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        _create_brain_configuration(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.put(
+            f"/api/brain/{BRAIN_NAME}/training/stream",
+            content=_import_csv(12),
+            headers={**unlocked_admin_headers, "Content-Type": "text/csv"},
+        )
+
+        assert response.status_code == 400
+
+
+class TestIncrementalTraining:
+    def _configure(self, client, headers, **training) -> None:
+        configuration = {
+            **BRAIN_CONFIGURATION,
+            "training": {"incremental": True, **training},
+        }
+        response = client.post(
+            "/api/brain/configuration", json=configuration, headers=headers
+        )
+        assert response.status_code == 201, response.json()
+
+    def _push(self, client, headers, index: int) -> dict:
+        sensors_data, dependent_value = _training_row(index)
+        response = client.put(
+            f"/api/brain/{BRAIN_NAME}/training",
+            json={"dependent_value": dependent_value, "sensors_data": sensors_data},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.json()
+        return response.json()
+
+    def test_new_data_point_replaces_the_oldest_trees(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        from learninghouse.models.brain import Brain
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        self._configure(isolated_client, unlocked_admin_headers, incremental_trees=0.1)
+        _push_training_rows(isolated_client, unlocked_admin_headers, rows=10)
+        before = Brain.load_trained(BRAIN_NAME)
+
+        info = self._push(isolated_client, unlocked_admin_headers, 10)
+        after = Brain.load_trained(BRAIN_NAME)
+
+        assert info["training_data_size"] == 11
+        assert after.incremental_trainings == 1
+        assert after.dataset.features == before.dataset.features
+        kept = before.estimator().estimators_[10:]
+        assert len(after.estimator().estimators_) == 100
+        for old, new in zip(kept, after.estimator().estimators_[:90]):
+            assert (old.tree_.threshold == new.tree_.threshold).all()
+
+    def test_complete_rebuild_after_rebuild_every_trainings(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        from learninghouse.models.brain import Brain
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        self._configure(isolated_client, unlocked_admin_headers, rebuild_every=2)
+        _push_training_rows(isolated_client, unlocked_admin_headers, rows=10)
+
+        self._push(isolated_client, unlocked_admin_headers, 10)
+        assert Brain.load_trained(BRAIN_NAME).incremental_trainings == 1
+
+        self._push(isolated_client, unlocked_admin_headers, 11)
+        assert Brain.load_trained(BRAIN_NAME).incremental_trainings == 0
+
+    def test_recent_data_points_missing_a_class_rebuild_completely(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        from learninghouse.models.brain import Brain
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        self._configure(isolated_client, unlocked_admin_headers, incremental_window=10)
+        _push_training_rows(isolated_client, unlocked_admin_headers, rows=10)
+
+        # From index 7 on every data point is light, the last ten are light
+        # only and cannot train trees for both classes.
+        infos = [
+            self._push(isolated_client, unlocked_admin_headers, index)
+            for index in range(10, 20)
+        ]
+
+        assert infos[-1]["training_data_size"] == 20
+        assert Brain.load_trained(BRAIN_NAME).incremental_trainings == 0
+
+
+class TestParallelTraining:
+    def test_forest_is_fitted_with_the_reserved_cores(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from sklearn.ensemble import RandomForestClassifier
+
+        from learninghouse.models.brain import Brain
+
+        fitted_jobs = []
+        fit = RandomForestClassifier.fit
+
+        def spy(self, *args, **kwargs):
+            fitted_jobs.append(self.n_jobs)
+            return fit(self, *args, **kwargs)
+
+        monkeypatch.setattr(RandomForestClassifier, "fit", spy)
+
+        import learninghouse.services.brain as brain_service_module
+        from learninghouse.services.executor import CpuBudget
+
+        budget = CpuBudget(4)
+        monkeypatch.setattr(brain_service_module, "cpu_budget", lambda: budget)
+
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        configuration = {
+            **BRAIN_CONFIGURATION,
+            "estimator": {**BRAIN_CONFIGURATION["estimator"], "jobs": 2},
+        }
+        response = isolated_client.post(
+            "/api/brain/configuration",
+            json=configuration,
+            headers=unlocked_admin_headers,
+        )
+        assert response.status_code == 201, response.json()
+        response = _push_training_rows(isolated_client, unlocked_admin_headers)
+        assert response is not None
+        assert response.status_code == 200, response.json()
+
+        # SelectFromModel and the forest of the brain
+        assert fitted_jobs == [2, 2]
+        assert budget.available == 4
+        assert Brain.load_trained(BRAIN_NAME).estimator().n_jobs is None
+
+
+class TestTrainingCoordination:
+    def test_data_point_trained_by_another_worker_is_not_trained_again(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.coordination import TrainingLock
+
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        stored = TrainingLock.now()
+        # Another worker starts a training after the data point was stored.
+        with TrainingLock(TrainingLock.of_brain(BRAIN_NAME).filename) as lock:
+            lock.finished(TrainingLock.now())
+
+        def train(*_):
+            raise AssertionError("trained again")
+
+        monkeypatch.setattr(BrainService, "train", train)
+        monkeypatch.setattr(BrainService, "train_incremental", train)
+
+        info = BrainService.train_new_data(BRAIN_NAME, stored)
+
+        assert info.name == BRAIN_NAME
+        assert info.score is not None
+
+    def test_data_point_stored_after_the_last_training_is_trained(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.coordination import TrainingLock
+
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        before = BrainService.get_info(BRAIN_NAME).trained_at
+
+        BrainService.train_new_data(BRAIN_NAME, TrainingLock.now())
+
+        after = BrainService.get_info(BRAIN_NAME).trained_at
+        assert before is not None
+        assert after is not None
+        assert after > before
+
+
+class TestColumnarTrainingData:
+    store = "columnar"
+
+    def _use_store(self, monkeypatch) -> None:
+        from learninghouse.core.settings import service_settings
+        from learninghouse.core.settings.models import TrainingDataStore
+
+        monkeypatch.setattr(
+            service_settings(), "training_data_store", TrainingDataStore(self.store)
+        )
+
+    def test_brain_is_trained_from_the_columnar_store(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        self._use_store(monkeypatch)
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+
+        response = isolated_client.get(
+            f"/api/brain/{BRAIN_NAME}/info", headers=unlocked_admin_headers
+        )
+        assert response.status_code == 200, response.json()
+        assert response.json()["training_data_size"] == 10
+
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/prediction",
+            json={"azimuth": 150, "elevation": -10},
+            headers=unlocked_admin_headers,
+        )
+        assert response.status_code == 200, response.json()
+
+    def test_csv_training_data_is_migrated_on_first_use(
+        self, isolated_client, unlocked_admin_headers, monkeypatch
+    ):
+        from learninghouse.services.training_data import CsvTrainingData
+
+        _set_up_trained_brain(isolated_client, unlocked_admin_headers)
+        self._use_store(monkeypatch)
+
+        response = isolated_client.post(
+            f"/api/brain/{BRAIN_NAME}/training", headers=unlocked_admin_headers
+        )
+
+        assert response.status_code == 200, response.json()
+        assert response.json()["training_data_size"] == 10
+        assert not CsvTrainingData(BRAIN_NAME).exists()
+
+
+class TestSqliteTrainingData(TestColumnarTrainingData):
+    store = "sqlite"
+
+
+class TestRetention:
+    def test_brain_is_trained_on_the_window(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        _create_sensors(isolated_client, unlocked_admin_headers)
+        configuration = {**BRAIN_CONFIGURATION, "retention": {"window_rows": 10}}
+        response = isolated_client.post(
+            "/api/brain/configuration",
+            json=configuration,
+            headers=unlocked_admin_headers,
+        )
+        assert response.status_code == 201, response.json()
+
+        response = _push_training_rows(isolated_client, unlocked_admin_headers, rows=12)
+
+        assert response is not None
+        assert response.status_code == 200, response.json()
+        assert response.json()["training_data_size"] == 10
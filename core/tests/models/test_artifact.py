@@ -0,0 +1,147 @@
+"""Tests for the artifact format of trained brains in
+learninghouse.models.artifact.
+
+A stored brain has to predict exactly like the brain it was stored from,
+brains stored as a single joblib dump before the format existed have to be
+read still, and a forest file replaced after its header was read has to be
+noticed instead of combining two trainings.
+"""
+
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+from learninghouse.models import artifact as artifact_module
+from learninghouse.models.artifact import BrainArtifact, ForestMismatch
+
+
+class _Brain:
+    # Like Brain, the trees of a mapped forest are built on first access.
+    _forest = None
+
+    def __init__(self, estimator):
+        self.name = "darkness"
+        self._estimator = estimator
+
+    def estimator(self):
+        if self._forest is not None:
+            self._forest.materialize(self._estimator)
+        return self._estimator
+
+
+@pytest.fixture()
+def samples():
+    rng = np.random.default_rng(0)
+    return rng.random((200, 4)), rng.random(200)
+
+
+@pytest.fixture()
+def filenames(tmp_path):
+    return str(tmp_path / "trained.pkl"), str(tmp_path / "trained.forest")
+
+
+@pytest.mark.parametrize(
+    "estimator_class", [RandomForestClassifier, RandomForestRegressor]
+)
+def test_stored_brain_predicts_like_the_trained_one(
+    samples, filenames, estimator_class
+):
+    x, y = samples
+    target = y > 0.5 if estimator_class is RandomForestClassifier else y
+    estimator = estimator_class(n_estimators=10, random_state=0).fit(x, target)
+
+    BrainArtifact.dump(_Brain(estimator), *filenames)
+    loaded = BrainArtifact.load(*filenames)
+
+    assert loaded.name == "darkness"
+    np.testing.assert_array_equal(loaded.estimator().predict(x), estimator.predict(x))
+
+
+def test_stored_brain_keeps_the_trained_estimator(samples, filenames):
+    x, y = samples
+    estimator = RandomForestRegressor(n_estimators=3, random_state=0).fit(x, y)
+    brain = _Brain(estimator)
+
+    BrainArtifact.dump(brain, *filenames)
+
+    assert brain.estimator() is estimator
+    assert all(hasattr(tree, "tree_") for tree in estimator.estimators_)
+
+
+def test_brain_stored_as_joblib_dump_is_read(samples, filenames):
+    x, y = samples
+    estimator = RandomForestRegressor(n_estimators=3, random_state=0).fit(x, y)
+    joblib.dump(_Brain(estimator), filenames[0])
+
+    loaded = BrainArtifact.load(*filenames)
+
+    np.testing.assert_array_equal(loaded.estimator().predict(x), estimator.predict(x))
+
+
+def test_forest_of_another_header_is_noticed(samples, filenames, tmp_path):
+    x, y = samples
+    estimator = RandomForestRegressor(n_estimators=3, random_state=0).fit(x, y)
+    BrainArtifact.dump(_Brain(estimator), *filenames)
+    header = Path(filenames[0]).read_bytes()
+
+    BrainArtifact.dump(_Brain(estimator), *filenames)
+    with open(filenames[0], "wb") as header_file:
+        header_file.write(header)
+
+    with pytest.raises(ForestMismatch):
+        BrainArtifact.load(*filenames)
+
+
+class TestMappedForest:
+    @pytest.fixture()
+    def unseen(self):
+        unseen = np.random.default_rng(1).random((500, 4))
+        unseen[::7, 2] = np.nan
+        return unseen
+
+    @pytest.mark.parametrize(
+        "estimator_class", [RandomForestClassifier, RandomForestRegressor]
+    )
+    def test_predicts_like_sklearn(self, samples, filenames, unseen, estimator_class):
+        x, y = samples
+        target = y > 0.5 if estimator_class is RandomForestClassifier else y
+        estimator = estimator_class(n_estimators=20, random_state=0).fit(x, target)
+        BrainArtifact.dump(_Brain(estimator), *filenames)
+
+        loaded = BrainArtifact.load(*filenames, mapped=True)
+
+        np.testing.assert_array_equal(
+            loaded._forest.predict(loaded._estimator, unseen), estimator.predict(unseen)
+        )
+        assert not loaded._forest.materialized
+
+    def test_predicts_in_chunks(self, samples, filenames, unseen, monkeypatch):
+        monkeypatch.setattr(artifact_module, "PREDICTION_CHUNK_SIZE", 64)
+        x, y = samples
+        estimator = RandomForestClassifier(n_estimators=5, random_state=0).fit(
+            x, y > 0.5
+        )
+        BrainArtifact.dump(_Brain(estimator), *filenames)
+
+        loaded = BrainArtifact.load(*filenames, mapped=True)
+
+        np.testing.assert_array_equal(
+            loaded._forest.predict(loaded._estimator, unseen), estimator.predict(unseen)
+        )
+
+    def test_trees_are_built_when_the_estimator_is_needed(self, samples, filenames):
+        x, y = samples
+        estimator = RandomForestRegressor(n_estimators=3, random_state=0).fit(x, y)
+        BrainArtifact.dump(_Brain(estimator), *filenames)
+
+        loaded = BrainArtifact.load(*filenames, mapped=True)
+        trees = loaded.estimator().estimators_
+
+        assert loaded._forest.materialized
+        assert all(hasattr(tree, "tree_") for tree in trees)
+        np.testing.assert_array_equal(
+            loaded.estimator().predict(x), estimator.predict(x)
+        )
@@ -0,0 +1,109 @@
+"""Tests for the SensorsCache in learninghouse.models.sensor.
+
+The cache has to hand out the configuration from memory as long as
+sensors.json is unchanged, and still notice a changed file - whether it was
+written through Sensors.write_config or by someone else.
+"""
+
+import json
+import os
+
+import pytest
+
+from learninghouse.models import sensor as sensor_module
+from learninghouse.models.sensor import Sensors, SensorsCache
+
+AZIMUTH = {"name": "azimuth", "typed": "numerical"}
+LIGHT_STATE = {"name": "light_state", "typed": "categorical"}
+
+
+def _write(filename, sensors: list) -> None:
+    with open(filename, "w", encoding="utf-8") as sensorfile:
+        json.dump(sensors, sensorfile)
+
+
+@pytest.fixture()
+def filename(tmp_path):
+    sensors_file = tmp_path / "sensors.json"
+    _write(sensors_file, [AZIMUTH])
+    return sensors_file
+
+
+@pytest.fixture()
+def reads(monkeypatch) -> list:
+    calls = []
+    read_config = Sensors.read_config
+
+    def counting_read_config(filename):
+        calls.append(filename)
+        return read_config(filename)
+
+    monkeypatch.setattr(Sensors, "read_config", counting_read_config)
+    return calls
+
+
+class TestSensorsCache:
+    def test_unchanged_file_is_read_once(self, filename, reads):
+        cache = SensorsCache(check_interval=0)
+
+        first_generation, first = cache.get(filename)
+        second_generation, second = cache.get(filename)
+
+        assert len(reads) == 1
+        assert first is second
+        assert first_generation == second_generation
+        assert first.numericals == ["azimuth"]
+
+    def test_no_stat_within_the_check_interval(self, filename, monkeypatch):
+        cache = SensorsCache(check_interval=60)
+        cache.get(filename)
+
+        def failing_stat(_):
+            raise AssertionError("stat called within the check interval")
+
+        monkeypatch.setattr(sensor_module, "stat", failing_stat)
+
+        assert cache.get(filename)[1].numericals == ["azimuth"]
+
+    def test_changed_file_is_read_again(self, filename, reads):
+        cache = SensorsCache(check_interval=0)
+        first_generation, _ = cache.get(filename)
+
+        _write(filename, [AZIMUTH, LIGHT_STATE])
+        stat_result = os.stat(filename)
+        os.utime(filename, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1))
+        generation, sensors = cache.get(filename)
+
+        assert len(reads) == 2
+        assert generation != first_generation
+        assert sensors.categoricals == ["light_state"]
+
+    def test_put_replaces_the_configuration_without_reading(self, filename, reads):
+        cache = SensorsCache(check_interval=0)
+        first_generation, _ = cache.get(filename)
+
+        sensors = Sensors.model_validate([AZIMUTH, LIGHT_STATE])
+        sensors.write_to_file(filename, indent=4)
+        cache.put(filename, sensors)
+        generation, cached = cache.get(filename)
+
+        assert len(reads) == 1
+        assert generation != first_generation
+        assert cached is sensors
+
+    def test_missing_file_is_an_empty_configuration(self, tmp_path):
+        cache = SensorsCache(check_interval=0)
+
+        assert cache.get(tmp_path / "sensors.json")[1].root == []
+
+
+class TestLoadConfig:
+    def test_returns_a_copy_of_the_cached_configuration(self, isolated_client):
+        # pylint: disable=unused-argument
+        Sensors.model_validate([AZIMUTH]).write_config()
+
+        sensors = Sensors.load_config()
+        sensors.root.clear()
+
+        assert Sensors.load_config().numericals == ["azimuth"]
+        assert Sensors.cached_config()[1].numericals == ["azimuth"]
@@ -0,0 +1,81 @@
+"""Tests for learninghouse.services.coordination.
+
+Two FileLock instances of the same lock file hold separate open files, so
+they exclude each other like the locks of two worker processes do.
+"""
+
+import time
+from threading import Event, Thread
+
+import pytest
+
+from learninghouse.services.coordination import FileLock, TrainingLock
+
+
+@pytest.fixture()
+def filename(tmp_path) -> str:
+    return str(tmp_path / "training.lock")
+
+
+class TestFileLock:
+    def test_excludes_the_holder_of_another_open_lock_file(self, filename):
+        first, second = FileLock(filename), FileLock(filename)
+        acquired = Event()
+
+        def acquire_second():
+            with second:
+                acquired.set()
+
+        with first:
+            thread = Thread(target=acquire_second)
+            thread.start()
+            time.sleep(0.1)
+            assert not acquired.is_set()
+
+        thread.join(5)
+        assert acquired.is_set()
+
+    def test_is_reentrant(self, filename):
+        lock = FileLock(filename)
+
+        with lock, lock:
+            pass
+
+        with FileLock(filename):
+            pass
+
+    def test_one_lock_per_file_and_process(self, filename, tmp_path):
+        assert FileLock.of(filename) is FileLock.of(filename)
+        assert FileLock.of(filename) is not FileLock.of(str(tmp_path / "other.lock"))
+
+    def test_one_lock_per_lock_class(self, filename):
+        FileLock.of(filename)
+
+        assert isinstance(TrainingLock.of(filename), TrainingLock)
+
+    def test_only_threads_are_serialized_without_directory(self, tmp_path):
+        lock = FileLock(str(tmp_path / "deleted" / "training.lock"))
+
+        with lock:
+            pass
+
+
+class TestTrainingLock:
+    def test_records_the_start_of_the_last_stored_training(self, filename):
+        stored = TrainingLock.now()
+
+        with TrainingLock(filename) as lock:
+            assert not lock.trained_since(stored)
+            lock.finished(TrainingLock.now())
+
+        with TrainingLock(filename) as lock:
+            assert lock.trained_since(stored)
+            assert not lock.trained_since(TrainingLock.now())
+
+    def test_training_started_before_the_data_point_does_not_count(self, filename):
+        started = TrainingLock.now()
+        stored = TrainingLock.now()
+
+        with TrainingLock(filename) as lock:
+            lock.finished(started)
+            assert not lock.trained_since(stored)
@@ -0,0 +1,97 @@
+"""Tests for learninghouse.services.executor."""
+
+import asyncio
+import threading
+
+from learninghouse.services.executor import (
+    CpuBudget,
+    background_executor,
+    run_background,
+    run_prediction,
+    run_training,
+)
+
+
+def _thread_name() -> str:
+    return threading.current_thread().name
+
+
+class TestExecutors:
+    async def test_calls_run_on_their_own_thread_pools(self):
+        assert (await run_training(_thread_name)).startswith("training")
+        assert (await run_prediction(_thread_name)).startswith("prediction")
+        assert (await run_background(_thread_name)).startswith("background")
+
+    async def test_a_blocked_training_does_not_delay_predictions(self):
+        release = threading.Event()
+
+        training = asyncio.ensure_future(run_training(release.wait, 5))
+        try:
+            prediction = await asyncio.wait_for(run_prediction(lambda: 42), 2)
+
+            assert prediction == 42
+            assert not training.done()
+        finally:
+            release.set()
+            await training
+
+    async def test_a_background_training_does_not_delay_training_requests(self):
+        release = threading.Event()
+
+        background = background_executor().submit(release.wait, 5)
+        try:
+            stored = await asyncio.wait_for(run_training(lambda: 42), 2)
+
+            assert stored == 42
+            assert not background.done()
+        finally:
+            release.set()
+            background.result()
+
+
+class TestCpuBudget:
+    def test_reserves_the_requested_cores(self):
+        budget = CpuBudget(4)
+
+        with budget.reserve(3) as cores:
+            assert cores == 3
+            assert budget.available == 1
+
+        assert budget.available == 4
+
+    def test_zero_reserves_all_cores(self):
+        with CpuBudget(4).reserve(0) as cores:
+            assert cores == 4
+
+    def test_concurrent_trainings_share_the_budget(self):
+        budget = CpuBudget(4)
+
+        with budget.reserve(3) as first, budget.reserve(3) as second:
+            assert (first, second) == (3, 1)
+
+    def test_worker_processes_share_the_budget(self, tmp_path):
+        # Two budgets on the same directory, like the ones of two workers.
+        first_worker = CpuBudget(4, str(tmp_path))
+        second_worker = CpuBudget(4, str(tmp_path))
+
+        with first_worker.reserve(3) as first, second_worker.reserve(3) as second:
+            assert (first, second) == (3, 1)
+
+        with second_worker.reserve(0) as cores:
+            assert cores == 4
+
+    def test_waits_while_every_core_is_reserved(self):
+        budget = CpuBudget(1)
+        reserved = threading.Event()
+
+        def train() -> None:
+            with budget.reserve(1):
+                reserved.set()
+
+        with budget.reserve(1):
+            thread = threading.Thread(target=train)
+            thread.start()
+            assert not reserved.wait(0.2)
+
+        thread.join(2)
+        assert reserved.is_set()
@@ -0,0 +1,260 @@
+"""Tests for learninghouse.services.model_cache.
+
+The cache is exercised with stand-in brains of a given size, apart from
+the size accounting itself which needs real trees.
+"""
+
+import os
+from typing import Optional, cast
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from learninghouse.models.brain import Brain
+from learninghouse.services import model_cache as model_cache_module
+from learninghouse.services.model_cache import (
+    TREE_NODE_ARRAYS,
+    ModelCache,
+    ModelWatcher,
+    file_signature,
+)
+
+KEY = ("brains", "darkness")
+SHUTTER = ("brains", "shutter")
+HEATING = ("brains", "heating")
+
+
+class _Tree:
+    def __init__(self, size: int):
+        self.value = np.zeros(size, dtype=np.uint8)
+
+
+class _Estimator:
+    def __init__(self, size: int):
+        self.estimators_ = [type("Tree", (), {"tree_": _Tree(size)})()]
+
+
+class _Forest:
+    def __init__(self, nbytes: int, inode: int = 0):
+        self.nbytes = nbytes
+        self.inode = inode
+        self.materialized = False
+
+
+class _Brain:
+    def __init__(self, size: int, forest: Optional[_Forest]):
+        self._estimator = _Estimator(size)
+        self.forest = forest
+
+    def estimator(self):
+        return self._estimator
+
+
+def _brain(size: int = 100, forest: Optional[_Forest] = None) -> Brain:
+    return cast(Brain, _Brain(size, forest))
+
+
+@pytest.fixture()
+def cache() -> ModelCache:
+    return ModelCache(max_entries=2, max_bytes=1000)
+
+
+class TestModelCache:
+    def test_hit_after_put(self, cache):
+        brain = _brain()
+        cache.put(KEY, 1.0, brain)
+
+        assert cache.get(KEY, 1.0) is brain
+        assert cache.metrics.hits == 1
+        assert cache.metrics.misses == 0
+
+    def test_other_stamp_is_a_miss_and_drops_the_entry(self, cache):
+        cache.put(KEY, 1.0, _brain())
+
+        assert cache.get(KEY, 2.0) is None
+        assert KEY not in cache
+        assert cache.metrics.misses == 1
+        assert cache.metrics.size_bytes == 0
+
+    def test_least_recently_used_brain_is_evicted_beyond_max_entries(self, cache):
+        cache.put(KEY, 1.0, _brain())
+        cache.put(SHUTTER, 1.0, _brain())
+        cache.get(KEY, 1.0)
+
+        cache.put(HEATING, 1.0, _brain())
+
+        assert KEY in cache
+        assert SHUTTER not in cache
+        assert cache.metrics.evictions == 1
+
+    def test_brains_are_evicted_beyond_max_bytes(self, cache):
+        cache.put(KEY, 1.0, _brain(600))
+        cache.put(SHUTTER, 1.0, _brain(600))
+
+        assert KEY not in cache
+        assert cache.metrics.size_bytes == 600
+        assert cache.metrics.evictions == 1
+
+    def test_brain_larger_than_max_bytes_is_kept_alone(self, cache):
+        cache.put(KEY, 1.0, _brain())
+        cache.put(SHUTTER, 1.0, _brain(5000))
+
+        assert len(cache) == 1
+        assert SHUTTER in cache
+
+    def test_zero_entries_disables_the_cache(self):
+        cache = ModelCache(max_entries=0, max_bytes=1000)
+        cache.put(KEY, 1.0, _brain())
+
+        assert cache.get(KEY, 1.0) is None
+
+
+class TestSizeOf:
+    def test_counts_the_node_arrays_of_all_trees(self):
+        estimator = RandomForestClassifier(n_estimators=3, random_state=0)
+        estimator.fit(np.arange(40).reshape(20, 2), np.arange(20) % 2)
+        brain = cast(Brain, type("Brain", (), {"estimator": lambda self: estimator})())
+
+        expected = sum(
+            getattr(tree.tree_, array).nbytes
+            for tree in estimator.estimators_
+            for array in TREE_NODE_ARRAYS
+            if hasattr(tree.tree_, array)
+        )
+
+        assert ModelCache.size_of(brain) == expected
+        assert expected > sum(tree.tree_.value.nbytes for tree in estimator.estimators_)
+
+    def test_counts_the_mapped_forest_until_its_trees_are_built(self):
+        forest = _Forest(4096)
+        brain = _brain(100, forest)
+
+        assert ModelCache.size_of(brain) == 4096
+
+        forest.materialized = True
+        assert ModelCache.size_of(brain) == 100
+
+
+SMAPS = """\
+7f0000000000-7f0000001000 r--s 00000000 fd:01 4242 /brains/darkness/trained.forest
+Size:                  8 kB
+Rss:                   8 kB
+Shared_Clean:          4 kB
+Private_Clean:         4 kB
+VmFlags: rd sh mr mw me ms sd
+7f0000002000-7f0000003000 r--s 00000000 fd:01 4242 /brains/darkness/trained.forest
+Rss:                   4 kB
+Shared_Clean:          4 kB
+7f0000004000-7f0000005000 rw-p 00000000 00:00 0
+Rss:                  12 kB
+Private_Dirty:        12 kB
+"""
+
+
+class TestMemory:
+    @pytest.fixture(autouse=True)
+    def smaps(self, tmp_path, monkeypatch):
+        smaps_file = tmp_path / "smaps"
+        smaps_file.write_text(SMAPS)
+        monkeypatch.setattr(model_cache_module, "SMAPS_FILE", str(smaps_file))
+
+    def test_mapped_files_are_summed_up_by_inode(self):
+        assert model_cache_module.mapped_files() == {
+            4242: {
+                "Size": 8192,
+                "Rss": 12288,
+                "Shared_Clean": 8192,
+                "Private_Clean": 4096,
+            }
+        }
+
+    def test_shared_and_private_memory_of_mapped_brains(self, cache):
+        cache.put(KEY, 1.0, _brain(100, _Forest(16384, inode=4242)))
+
+        memory = cache.memory()[KEY]
+
+        assert memory.mapped_bytes == 16384
+        assert memory.shared_bytes == 8192
+        assert memory.private_bytes == 4096
+
+    def test_trees_in_memory_of_the_process_are_private(self, cache):
+        cache.put(KEY, 1.0, _brain(100))
+
+        memory = cache.memory()[KEY]
+
+        assert memory.mapped_bytes == 0
+        assert memory.shared_bytes == 0
+        assert memory.private_bytes == 100
+
+
+@pytest.fixture()
+def trained_file(tmp_path) -> str:
+    filename = tmp_path / "trained.pkl"
+    filename.write_bytes(b"first training")
+    return str(filename)
+
+
+def _rewrite(filename: str, content: bytes) -> None:
+    stat_result = os.stat(filename)
+    with open(filename, "wb") as trained:
+        trained.write(content)
+    os.utime(filename, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1))
+
+
+class TestModelWatcher:
+    def test_training_in_this_process_bumps_the_generation(self):
+        watcher = ModelWatcher(60, lambda key: True)
+        before = watcher.generation(KEY)
+
+        watcher.bump(KEY)
+
+        assert watcher.generation(KEY) != before
+
+    def test_changed_trained_file_bumps_the_generation(self, trained_file):
+        watcher = ModelWatcher(60, lambda key: True)
+        watcher.watch(KEY, trained_file, file_signature(trained_file))
+        before = watcher.generation(KEY)
+
+        watcher.check()
+        assert watcher.generation(KEY) == before
+
+        _rewrite(trained_file, b"training of another worker")
+        watcher.check()
+        assert watcher.generation(KEY) != before
+        watcher.shutdown()
+
+    def test_training_during_the_load_bumps_the_generation(self, trained_file):
+        watcher = ModelWatcher(60, lambda key: True)
+        signature = file_signature(trained_file)
+        _rewrite(trained_file, b"training of another worker")
+        watcher.watch(KEY, trained_file, signature)
+        before = watcher.generation(KEY)
+
+        watcher.check()
+
+        assert watcher.generation(KEY) != before
+        watcher.shutdown()
+
+    def test_removed_trained_file_bumps_the_generation(self, trained_file):
+        watcher = ModelWatcher(60, lambda key: True)
+        watcher.watch(KEY, trained_file, file_signature(trained_file))
+        before = watcher.generation(KEY)
+
+        os.remove(trained_file)
+        watcher.check()
+
+        assert watcher.generation(KEY) != before
+        watcher.shutdown()
+
+    def test_brains_no_longer_cached_are_not_watched(self, trained_file, monkeypatch):
+        watcher = ModelWatcher(60, lambda key: False)
+        watcher.watch(KEY, trained_file, file_signature(trained_file))
+        watcher.check()
+
+        def failing_stat(_):
+            raise AssertionError("stat of a brain which is not cached")
+
+        monkeypatch.setattr(model_cache_module, "stat", failing_stat)
+        watcher.check()
+        watcher.shutdown()
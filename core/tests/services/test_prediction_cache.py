@@ -0,0 +1,109 @@
+"""Tests for learninghouse.services.prediction_cache.
+
+The memos are exercised with stand-in brains holding only a configuration
+and features - tests/api/test_brain.py covers the predictions of a trained
+brain served from the cache.
+"""
+
+from typing import cast
+
+import pytest
+
+from learninghouse.models.brain import Brain, BrainPredictionCacheConfiguration
+from learninghouse.services.prediction_cache import PredictionCache, PredictionMemo
+
+
+class _Dataset:
+    features = ["azimuth", "pressure_trend_1h_falling"]
+    columns = None
+
+
+class _Configuration:
+    def __init__(self, **prediction_cache):
+        self.prediction_cache = BrainPredictionCacheConfiguration(**prediction_cache)
+
+
+class _Brain:
+    def __init__(self, **prediction_cache):
+        self.configuration = _Configuration(**prediction_cache)
+        self.dataset = _Dataset()
+
+
+def _brain(**prediction_cache) -> Brain:
+    return cast(Brain, _Brain(**prediction_cache))
+
+
+KEY = ("brains", "darkness")
+
+
+@pytest.fixture()
+def cache() -> PredictionCache:
+    return PredictionCache()
+
+
+class TestPredictionMemo:
+    def test_key_holds_the_features_only(self):
+        configuration = BrainPredictionCacheConfiguration(size=10)
+        memo = PredictionMemo(_brain(), configuration)
+
+        key = memo.key(
+            {"azimuth": 150.25, "elevation": -10.0, "pressure_trend_1h_falling": True}
+        )
+
+        assert key == (150.25, True)
+
+    def test_numerical_features_are_quantized(self):
+        configuration = BrainPredictionCacheConfiguration(
+            size=10, quantization={"azimuth": 0.5}
+        )
+        memo = PredictionMemo(_brain(), configuration)
+
+        first = memo.key({"azimuth": 150.1, "pressure_trend_1h_falling": 0})
+        second = memo.key({"azimuth": 149.9, "pressure_trend_1h_falling": 0})
+        third = memo.key({"azimuth": 150.4, "pressure_trend_1h_falling": 0})
+
+        assert first == second
+        assert first != third
+
+    def test_least_recently_used_prediction_is_dropped(self):
+        memo = PredictionMemo(_brain(), BrainPredictionCacheConfiguration(size=2))
+        memo.put((1,), True)
+        memo.put((2,), False)
+        memo.get((1,))
+
+        memo.put((3,), True)
+
+        assert memo.get((2,)) is None
+        assert memo.get((1,)) is True
+        assert memo.metrics.entries == 2
+        assert memo.metrics.hits == 2
+        assert memo.metrics.misses == 1
+
+
+class TestPredictionCache:
+    def test_disabled_without_size(self, cache):
+        assert cache.memo(KEY, 1, _brain()) is None
+        assert not cache.metrics()
+        assert KEY not in cache
+
+    def test_same_memo_for_the_same_stamp(self, cache):
+        memo = cache.memo(KEY, 1, _brain(size=10))
+
+        assert cache.memo(KEY, 1, _brain(size=10)) is memo
+        assert KEY in cache
+
+    def test_new_generation_starts_empty_and_counts_on(self, cache):
+        memo = cache.memo(KEY, 1, _brain(size=10))
+        assert memo is not None
+        memo.put((1,), True)
+        memo.get((1,))
+        memo.get((2,))
+
+        retrained = cache.memo(KEY, 2, _brain(size=10))
+
+        assert retrained is not None
+        assert retrained is not memo
+        assert retrained.get((1,)) is None
+        assert cache.metrics()[KEY].hits == 1
+        assert cache.metrics()[KEY].misses == 2
+        assert cache.metrics()[KEY].hit_rate == pytest.approx(1 / 3)
@@ -24,6 +24,7 @@ from datetime import datetime
 import pandas as pd
 
 from learninghouse.models.brain import Brain
+from learninghouse.models.sensor import Sensors
 from learninghouse.services.preprocessing import DatasetPreprocessing
 
 FIXED_TIMESTAMP = 1700000000
@@ -263,3 +264,58 @@ class TestPreparePredictionAlignment:
         # request failing or the column staying empty.
         assert response.status_code == 200
         assert "elevation" in response.json()["preprocessed"]
+
+
+class TestSensorsConfig:
+    def test_includes_the_time_columns(self, isolated_client):
+        # pylint: disable=unused-argument
+        Sensors.model_validate(
+            [
+                {"name": "azimuth", "typed": "numerical"},
+                {"name": "light_state", "typed": "categorical"},
+            ]
+        ).write_config()
+
+        categoricals, numericals = DatasetPreprocessing.sensorsconfig()
+
+        assert categoricals == ["light_state", "month_of_year", "day_of_week"]
+        assert numericals == [
+            "azimuth",
+            "day_of_month",
+            "hour_of_day",
+            "minute_of_hour",
+        ]
+
+    def test_follows_a_changed_configuration(self, isolated_client):
+        # pylint: disable=unused-argument
+        Sensors.model_validate(
+            [{"name": "azimuth", "typed": "numerical"}]
+        ).write_config()
+        categoricals, _ = DatasetPreprocessing.sensorsconfig()
+        categoricals.append("changed by the caller")
+
+        Sensors.model_validate(
+            [{"name": "azimuth", "typed": "categorical"}]
+        ).write_config()
+
+        categoricals, numericals = DatasetPreprocessing.sensorsconfig()
+        assert categoricals == ["azimuth", "month_of_year", "day_of_week"]
+        assert "azimuth" not in numericals
+
+
+class TestFeatureSources:
+    def test_maps_features_back_to_their_sensors(self, isolated_client):
+        # pylint: disable=unused-argument
+        Sensors.model_validate(
+            [
+                {"name": "azimuth", "typed": "numerical"},
+                {"name": "elevation", "typed": "numerical"},
+                {"name": "light_state", "typed": "categorical"},
+            ]
+        ).write_config()
+
+        sources = DatasetPreprocessing.feature_sources(
+            ["azimuth", "light_state_on", "hour_of_day", "day_of_week_Monday"]
+        )
+
+        assert sources == {"azimuth", "light_state", "timestamp"}
@@ -0,0 +1,168 @@
+"""Tests for learninghouse.services.retention."""
+
+from concurrent.futures import Executor, Future
+from threading import Thread
+
+import pandas as pd
+import pytest
+
+from learninghouse.models.brain import BrainRetentionConfiguration
+from learninghouse.services import retention as retention_module
+from learninghouse.services.retention import (
+    DAY_SECONDS,
+    CompactionScheduler,
+    TrainingDataRetention,
+)
+from learninghouse.services.training_data import CsvTrainingData
+
+NOW = 1700000000 + 100 * 60
+
+
+def _rows(rows: int) -> list[dict]:
+    return [
+        {"timestamp": 1700000000 + index * 60, "azimuth": index, "darkness": True}
+        for index in range(rows)
+    ]
+
+
+@pytest.fixture()
+def training_data(tmp_path) -> CsvTrainingData:
+    (tmp_path / "darkness").mkdir()
+    training_data = CsvTrainingData("darkness", tmp_path)
+    for row in _rows(100):
+        training_data.append(row)
+    return training_data
+
+
+class TestApply:
+    def test_max_rows_keeps_the_most_recent(self):
+        kept = TrainingDataRetention.apply(
+            pd.DataFrame(_rows(100)), BrainRetentionConfiguration(max_rows=10), NOW
+        )
+
+        assert kept["azimuth"].tolist() == list(range(90, 100))
+
+    def test_max_age_removes_old_data_points(self):
+        data = pd.DataFrame(_rows(3))
+        data.loc[0, "timestamp"] = NOW - 2 * DAY_SECONDS
+
+        kept = TrainingDataRetention.apply(
+            data, BrainRetentionConfiguration(max_age_days=1), NOW
+        )
+
+        assert kept["azimuth"].tolist() == [1, 2]
+
+    def test_downsampling_keeps_the_last_data_point_per_period(self):
+        kept = TrainingDataRetention.apply(
+            pd.DataFrame(_rows(10)),
+            BrainRetentionConfiguration(downsample_seconds=300),
+            NOW,
+        )
+
+        # Periods of five minutes start at 1699999800, 1700000100, 1700000400
+        assert kept["azimuth"].tolist() == [1, 6, 9]
+
+
+class TestLoad:
+    def test_window_rows_reads_the_most_recent(self, training_data):
+        data = TrainingDataRetention.load(
+            training_data, BrainRetentionConfiguration(window_rows=10), ["azimuth"]
+        )
+
+        assert data["azimuth"].tolist() == list(range(90, 100))
+
+    def test_window_days_reads_the_most_recent_days(self, training_data):
+        data = TrainingDataRetention.load(
+            training_data,
+            BrainRetentionConfiguration(window_days=5 * 60 / DAY_SECONDS),
+            ["azimuth"],
+            NOW,
+        )
+
+        assert data.columns.tolist() == ["azimuth"]
+        assert data["azimuth"].tolist() == [95, 96, 97, 98, 99]
+
+    def test_without_retention_all_data_points_are_read(self, training_data):
+        data = TrainingDataRetention.load(training_data, BrainRetentionConfiguration())
+
+        assert len(data.index) == 100
+
+
+class TestCompact:
+    def test_removes_the_data_points_not_kept(self, training_data):
+        removed = TrainingDataRetention.compact(
+            training_data, BrainRetentionConfiguration(max_rows=10)
+        )
+
+        assert removed == 90
+        assert training_data.rows() == 10
+        assert training_data.load()["azimuth"].tolist() == list(range(90, 100))
+
+    def test_data_points_appended_meanwhile_wait_for_it(
+        self, training_data, monkeypatch
+    ):
+        load = training_data.load
+        append = Thread(
+            target=training_data.append, args=({**_rows(101)[100], "elevation": 5.0},)
+        )
+
+        def load_while_appending(*args, **kwargs):
+            append.start()
+            append.join(0.2)
+            assert append.is_alive()
+            return load(*args, **kwargs)
+
+        monkeypatch.setattr(training_data, "load", load_while_appending)
+        TrainingDataRetention.compact(
+            training_data, BrainRetentionConfiguration(max_rows=10)
+        )
+        append.join(5)
+
+        monkeypatch.undo()
+        data = training_data.load()
+        assert data["azimuth"].tolist() == list(range(90, 101))
+        assert data["elevation"].isna().sum() == 10
+        assert training_data.rows() == 11
+
+
+class _Executor(Executor):
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, /, *args, **kwargs):
+        self.submitted.append((fn, args))
+        return Future()
+
+
+class TestCompactionScheduler:
+    def test_compacts_after_every_hundred_data_points(self, monkeypatch):
+        monkeypatch.setattr(retention_module, "COMPACT_EVERY_SAMPLES", 3)
+        executor = _Executor()
+        scheduler = CompactionScheduler(lambda: executor)
+        retention = BrainRetentionConfiguration(max_rows=10)
+
+        for _ in range(7):
+            scheduler.notify("darkness", retention)
+
+        assert len(executor.submitted) == 1
+
+    def test_one_compaction_of_a_brain_at_a_time(self, monkeypatch):
+        monkeypatch.setattr(retention_module, "COMPACT_EVERY_SAMPLES", 1)
+        executor = _Executor()
+        scheduler = CompactionScheduler(lambda: executor)
+        retention = BrainRetentionConfiguration(max_rows=10)
+
+        scheduler.notify("darkness", retention)
+        scheduler.notify("darkness", retention)
+        scheduler.notify("other", retention)
+
+        assert [args[1] for _, args in executor.submitted] == ["darkness", "other"]
+
+    def test_window_only_never_compacts(self, monkeypatch):
+        monkeypatch.setattr(retention_module, "COMPACT_EVERY_SAMPLES", 1)
+        executor = _Executor()
+        scheduler = CompactionScheduler(lambda: executor)
+
+        scheduler.notify("darkness", BrainRetentionConfiguration(window_rows=10))
+
+        assert executor.submitted == []
@@ -0,0 +1,124 @@
+"""Tests for learninghouse.services.subscription.
+
+The prediction is replaced by a stand-in which counts its calls and depends
+on the sensors given by the test, so these tests are about when a brain
+predicts and who gets its result - tests/api/test_brain.py covers the
+predictions of a trained brain over the WebSocket.
+"""
+
+import json
+
+import pytest
+
+from learninghouse.errors.brain import BrainNotTrained
+from learninghouse.services.subscription import PredictionSubscriptions
+
+
+class StandInResult:
+    def __init__(self, state: dict):
+        self.state = state
+
+    def model_dump_json(self) -> str:
+        return json.dumps(self.state)
+
+
+@pytest.fixture()
+def predictions(monkeypatch):
+    """Names of the predicted brains. `sources` of a brain are set by the
+    test, a brain without sources is not trained."""
+    predicted = []
+    sources = {}
+
+    def predict(name, state):
+        predicted.append(name)
+        if name not in sources:
+            raise BrainNotTrained(name)
+        return StandInResult(state), sources[name]
+
+    monkeypatch.setattr(PredictionSubscriptions, "_predict", staticmethod(predict))
+    return predicted, sources
+
+
+class TestSubscriptions:
+    async def test_brain_predicts_only_when_a_source_changed(self, predictions):
+        predicted, sources = predictions
+        sources["darkness"] = {"elevation"}
+        subscriptions = PredictionSubscriptions()
+
+        async with subscriptions.subscribe("darkness") as queue:
+            await subscriptions.update({"elevation": -10, "rain": 0})
+            unrelated = await subscriptions.update({"elevation": -10, "rain": 1})
+            related = await subscriptions.update({"elevation": -9})
+
+            assert predicted == ["darkness", "darkness"]
+            assert unrelated.changed == ["rain"]
+            assert unrelated.predicted == []
+            assert related.predicted == ["darkness"]
+            assert json.loads(queue.get_nowait()) == {"elevation": -10, "rain": 0}
+            assert json.loads(queue.get_nowait()) == {"elevation": -9, "rain": 1}
+            assert queue.empty()
+
+    async def test_brain_without_sources_predicts_on_every_change(self, predictions):
+        predicted, _ = predictions
+        subscriptions = PredictionSubscriptions()
+
+        async with subscriptions.subscribe("darkness") as queue:
+            await subscriptions.update({"rain": 0})
+            await subscriptions.update({"rain": 1})
+
+            assert predicted == ["darkness", "darkness"]
+            assert json.loads(queue.get_nowait())["error"] == "NOT_TRAINED"
+
+    async def test_subscription_starts_with_a_prediction_on_the_state(
+        self, predictions
+    ):
+        predicted, sources = predictions
+        sources["darkness"] = {"elevation"}
+        subscriptions = PredictionSubscriptions()
+        await subscriptions.update({"elevation": -10})
+
+        async with subscriptions.subscribe("darkness") as queue:
+            assert json.loads(queue.get_nowait()) == {"elevation": -10}
+
+        await subscriptions.update({"elevation": -9})
+
+        assert predicted == ["darkness"]
+
+    async def test_one_prediction_for_all_subscribers(self, predictions):
+        predicted, sources = predictions
+        sources["darkness"] = {"elevation"}
+        subscriptions = PredictionSubscriptions()
+
+        async with subscriptions.subscribe("darkness") as first:
+            async with subscriptions.subscribe("darkness") as second:
+                await subscriptions.update({"elevation": -10})
+
+                assert predicted == ["darkness"]
+                assert first.get_nowait() == second.get_nowait()
+
+    async def test_time_dependent_brains_predict_again_on_tick(self, predictions):
+        predicted, sources = predictions
+        sources["darkness"] = {"timestamp", "elevation"}
+        sources["rain"] = {"elevation"}
+        subscriptions = PredictionSubscriptions()
+        await subscriptions.update({"elevation": -10})
+
+        async with subscriptions.subscribe("darkness") as queue:
+            async with subscriptions.subscribe("rain"):
+                ticked = await subscriptions.tick()
+
+                assert ticked == ["darkness"]
+                assert predicted == ["darkness", "rain", "darkness"]
+                assert queue.qsize() == 2
+
+    async def test_timestamp_in_the_state_is_the_time(self, predictions):
+        predicted, sources = predictions
+        sources["darkness"] = {"timestamp"}
+        subscriptions = PredictionSubscriptions()
+        await subscriptions.update({"timestamp": 1700000000})
+
+        async with subscriptions.subscribe("darkness"):
+            assert await subscriptions.tick() == []
+            await subscriptions.update({"timestamp": 1700000060})
+
+        assert predicted == ["darkness", "darkness"]
@@ -0,0 +1,124 @@
+"""Tests for learninghouse.services.training.
+
+The TrainingScheduler is exercised with a stand-in training callable, so
+these tests are about *when* and *how often* a brain gets trained, not about
+the training itself - tests/api/test_brain.py covers the background mode
+end-to-end.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pytest
+
+from learninghouse.models.brain import BrainTrainingConfiguration, BrainTrainingState
+from learninghouse.services.training import TrainingScheduler
+
+
+class _Training:
+    def __init__(self, block: bool = False):
+        self.calls = 0
+        self.release = Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+
+
+@pytest.fixture()
+def scheduler():
+    executor = ThreadPoolExecutor(max_workers=1)
+    training_scheduler = TrainingScheduler(lambda: executor)
+    yield training_scheduler
+    training_scheduler.shutdown()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _wait_for_idle(scheduler: TrainingScheduler, name: str, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while scheduler.status(name).state != BrainTrainingState.IDLE:
+        assert time.monotonic() < deadline, scheduler.status(name)
+        time.sleep(0.01)
+
+
+class TestTrainingScheduler:
+    def test_unknown_brain_is_idle(self, scheduler):
+        status = scheduler.status("darkness")
+
+        assert status.state == BrainTrainingState.IDLE
+        assert status.pending_samples == 0
+
+    def test_samples_within_the_debounce_are_coalesced(self, scheduler):
+        training = _Training()
+        configuration = BrainTrainingConfiguration(background=True, debounce=0.2)
+
+        for _ in range(5):
+            status = scheduler.notify("darkness", configuration, training)
+            assert status.state == BrainTrainingState.PENDING
+
+        _wait_for_idle(scheduler, "darkness")
+
+        assert training.calls == 1
+        assert scheduler.status("darkness").finished_at is not None
+
+    def test_training_waits_for_every_samples(self, scheduler):
+        training = _Training()
+        configuration = BrainTrainingConfiguration(background=True, every_samples=3)
+
+        scheduler.notify("darkness", configuration, training)
+        scheduler.notify("darkness", configuration, training)
+        time.sleep(0.1)
+
+        assert training.calls == 0
+        assert scheduler.status("darkness").pending_samples == 2
+
+        scheduler.notify("darkness", configuration, training)
+        _wait_for_idle(scheduler, "darkness")
+
+        assert training.calls == 1
+
+    def test_samples_during_a_training_lead_to_one_further_training(self, scheduler):
+        training = _Training(block=True)
+        configuration = BrainTrainingConfiguration(background=True)
+
+        scheduler.notify("darkness", configuration, training)
+        deadline = time.monotonic() + 5
+        while scheduler.status("darkness").state != BrainTrainingState.RUNNING:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+        for _ in range(3):
+            scheduler.notify("darkness", configuration, training)
+        training.release.set()
+
+        _wait_for_idle(scheduler, "darkness")
+
+        assert training.calls == 2
+
+    def test_min_interval_delays_the_next_training(self, scheduler):
+        training = _Training()
+        configuration = BrainTrainingConfiguration(background=True, min_interval=0.3)
+
+        scheduler.notify("darkness", configuration, training)
+        _wait_for_idle(scheduler, "darkness")
+        scheduler.notify("darkness", configuration, training)
+        time.sleep(0.1)
+
+        assert training.calls == 1
+        assert scheduler.status("darkness").state == BrainTrainingState.PENDING
+
+        _wait_for_idle(scheduler, "darkness")
+
+        assert training.calls == 2
+
+    def test_failed_training_reports_its_error(self, scheduler):
+        def failing_training():
+            raise ValueError("broken")
+
+        scheduler.notify("darkness", BrainTrainingConfiguration(), failing_training)
+        _wait_for_idle(scheduler, "darkness")
+
+        assert scheduler.status("darkness").error == "broken"
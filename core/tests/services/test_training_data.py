@@ -0,0 +1,342 @@
+"""Tests for learninghouse.services.training_data.
+
+TrainingData replaced BrainService.request's read-concat-rewrite of the
+whole training_data.csv with a single appended line per sample. The file it
+produces has to read back exactly like the one `pd.concat` + `to_csv` used to
+write, otherwise every brain's training input would silently change.
+"""
+
+import os
+import sqlite3
+from threading import Thread
+
+import pandas as pd
+import pytest
+
+from learninghouse.services.training_data import (
+    ColumnarTrainingData,
+    CsvTrainingData,
+    SqliteTrainingData,
+)
+
+ROWS = [
+    {"azimuth": 100.5, "pressure_trend_1h": "rising", "darkness": True},
+    {"azimuth": 110, "pressure_trend_1h": None, "darkness": False},
+    {"azimuth": None, "pressure_trend_1h": "falling, fast", "darkness": True},
+]
+
+
+@pytest.fixture()
+def training_data(tmp_path) -> CsvTrainingData:
+    (tmp_path / "darkness").mkdir()
+    return CsvTrainingData("darkness", tmp_path)
+
+
+def _concatenated(rows: list[dict]) -> pd.DataFrame:
+    data = pd.DataFrame([rows[0]])
+    for row in rows[1:]:
+        data = pd.concat([data, pd.DataFrame([row])], ignore_index=True)
+
+    return data
+
+
+class TestAppend:
+    def test_first_sample_writes_the_header(self, training_data):
+        training_data.append(ROWS[0])
+
+        assert training_data.columns() == list(ROWS[0].keys())
+
+    def test_further_samples_only_append_a_line(self, training_data):
+        training_data.append(ROWS[0])
+        with open(training_data.filename, "rb") as data_file:
+            before = data_file.read()
+
+        training_data.append(ROWS[1])
+
+        with open(training_data.filename, "rb") as data_file:
+            after = data_file.read()
+        assert after.startswith(before)
+        assert after[len(before) :].count(b"\n") == 1
+
+    def test_reads_back_like_concatenated_rows(self, training_data, tmp_path):
+        for row in ROWS:
+            training_data.append(dict(row))
+
+        expected_file = tmp_path / "expected.csv"
+        _concatenated(ROWS).to_csv(expected_file, sep=",", index=False)
+
+        pd.testing.assert_frame_equal(training_data.load(), pd.read_csv(expected_file))
+
+    def test_many_samples_read_back_like_single_samples(self, training_data, tmp_path):
+        (tmp_path / "single").mkdir()
+        single = CsvTrainingData("single", tmp_path)
+        for row in MIXED_ROWS:
+            single.append(dict(row))
+
+        training_data.append_many([dict(row) for row in MIXED_ROWS])
+
+        pd.testing.assert_frame_equal(training_data.load(), single.load())
+        assert training_data.rows() == len(MIXED_ROWS)
+
+
+class TestLoad:
+    def test_waits_for_a_sample_being_appended(self, training_data):
+        training_data.append(ROWS[0])
+        loaded = []
+        load = Thread(target=lambda: loaded.append(training_data.load()))
+
+        with training_data.lock:
+            load.start()
+            load.join(0.2)
+            assert load.is_alive()
+            training_data.append(ROWS[1])
+        load.join(5)
+
+        assert len(loaded[0].index) == 2
+
+
+class TestSchemaEvolution:
+    def test_new_column_extends_the_header(self, training_data):
+        training_data.append(ROWS[0])
+
+        training_data.append({**ROWS[1], "elevation": -5.0})
+
+        assert training_data.columns() == list(ROWS[0].keys()) + ["elevation"]
+
+    def test_existing_rows_get_an_empty_value_for_the_new_column(
+        self, training_data, tmp_path
+    ):
+        rows = [ROWS[0], {**ROWS[1], "elevation": -5.0}, ROWS[2]]
+        for row in rows:
+            training_data.append(dict(row))
+
+        expected_file = tmp_path / "expected.csv"
+        _concatenated(rows).to_csv(expected_file, sep=",", index=False)
+
+        loaded = training_data.load()
+        pd.testing.assert_frame_equal(loaded, pd.read_csv(expected_file))
+        assert loaded["elevation"].isna().tolist() == [True, False, True]
+
+
+class TestRows:
+    def test_no_training_data_has_no_rows(self, training_data):
+        assert training_data.rows() == 0
+
+    def test_counter_follows_appended_samples(self, training_data):
+        for row in ROWS:
+            training_data.append(dict(row))
+
+        with open(training_data.rows_filename, "r", encoding="utf-8") as rows_file:
+            assert rows_file.read() == "3"
+        assert training_data.rows() == len(training_data.load().index)
+
+    def test_training_data_without_counter_is_counted_once(
+        self, training_data, tmp_path
+    ):
+        _concatenated(ROWS).to_csv(training_data.filename, sep=",", index=False)
+
+        assert training_data.rows() == 3
+
+        training_data.append(dict(ROWS[0]))
+        assert training_data.rows() == 4
+
+
+class TestTail:
+    def test_last_rows_read_like_the_end_of_the_loaded_data(self, training_data):
+        for row in ROWS:
+            training_data.append(dict(row))
+
+        pd.testing.assert_frame_equal(
+            training_data.tail(2),
+            training_data.load().iloc[1:].reset_index(drop=True),
+        )
+
+    def test_more_rows_than_stored_returns_all(self, training_data):
+        for row in ROWS:
+            training_data.append(dict(row))
+
+        pd.testing.assert_frame_equal(training_data.tail(10), training_data.load())
+
+    def test_rows_spanning_several_blocks(self, training_data, monkeypatch):
+        import learninghouse.services.training_data as training_data_module
+
+        monkeypatch.setattr(training_data_module, "TAIL_BLOCK_SIZE", 7)
+        for index in range(20):
+            training_data.append({"azimuth": index, "darkness": index % 2 == 0})
+
+        assert training_data.tail(5)["azimuth"].tolist() == [15, 16, 17, 18, 19]
+
+
+# Samples changing the kind of their columns on the way: ints becoming
+# floats, booleans and strings with missing values, a column of numbers
+# receiving a string and columns appearing after the first sample.
+MIXED_ROWS = [
+    {"azimuth": 100, "pressure_trend_1h": "rising", "darkness": True},
+    {"azimuth": 110.5, "pressure_trend_1h": None, "darkness": False, "rain": 3},
+    {"azimuth": None, "pressure_trend_1h": "falling", "darkness": None, "rain": 4},
+    {"azimuth": 120, "darkness": True, "rain": "heavy", "state": False},
+]
+
+
+@pytest.fixture()
+def columnar(tmp_path) -> ColumnarTrainingData:
+    (tmp_path / "darkness").mkdir(exist_ok=True)
+    return ColumnarTrainingData("darkness", tmp_path)
+
+
+class TestColumnar:
+    @pytest.mark.parametrize("rows", [ROWS, MIXED_ROWS])
+    def test_loads_like_the_csv_of_the_same_samples(
+        self, training_data, columnar, rows
+    ):
+        for row in rows:
+            training_data.append(dict(row))
+            columnar.append(dict(row))
+
+        pd.testing.assert_frame_equal(columnar.load(), training_data.load())
+        pd.testing.assert_frame_equal(columnar.tail(2), training_data.tail(2))
+        assert columnar.columns() == training_data.columns()
+        assert columnar.rows() == training_data.rows()
+
+    @pytest.mark.parametrize("rows", [ROWS, MIXED_ROWS])
+    def test_many_samples_load_like_single_samples(self, training_data, columnar, rows):
+        columnar.append(dict(rows[0]))
+        columnar.append_many([dict(row) for row in rows[1:]])
+        for row in rows:
+            training_data.append(dict(row))
+
+        pd.testing.assert_frame_equal(columnar.load(), training_data.load())
+        assert columnar.rows() == len(rows)
+
+    def test_loads_only_the_requested_columns(self, columnar):
+        for row in MIXED_ROWS:
+            columnar.append(dict(row))
+
+        loaded = columnar.load(["rain", "azimuth", "unknown"])
+
+        assert loaded.columns.tolist() == ["azimuth", "rain"]
+
+    def test_new_sample_appends_one_value_per_column(self, columnar):
+        columnar.append(dict(ROWS[0]))
+        columnar.append(dict(ROWS[1]))
+
+        azimuth = os.path.join(columnar.columns_directory, "0.bin")
+        assert os.path.getsize(azimuth) == 2 * 8
+
+    def test_csv_is_migrated_once(self, training_data, columnar):
+        for row in MIXED_ROWS:
+            training_data.append(dict(row))
+        expected = training_data.load()
+
+        columnar.migrate()
+
+        pd.testing.assert_frame_equal(columnar.load(), expected)
+        assert not training_data.exists()
+        assert columnar.rows() == len(MIXED_ROWS)
+
+
+@pytest.fixture()
+def sqlite(tmp_path) -> SqliteTrainingData:
+    (tmp_path / "darkness").mkdir(exist_ok=True)
+    return SqliteTrainingData("darkness", tmp_path)
+
+
+def _timed_rows(rows: int) -> list[dict]:
+    return [
+        {"timestamp": 1700000000 + index * 60, "azimuth": index, "darkness": True}
+        for index in range(rows)
+    ]
+
+
+class TestSqlite:
+    @pytest.mark.parametrize("rows", [ROWS, MIXED_ROWS])
+    def test_loads_like_the_csv_of_the_same_samples(self, training_data, sqlite, rows):
+        for row in rows:
+            training_data.append(dict(row))
+            sqlite.append(dict(row))
+
+        pd.testing.assert_frame_equal(sqlite.load(), training_data.load())
+        pd.testing.assert_frame_equal(sqlite.tail(2), training_data.tail(2))
+        pd.testing.assert_frame_equal(
+            sqlite.load(["azimuth", "darkness"]),
+            training_data.load(["azimuth", "darkness"]),
+        )
+        assert sqlite.columns() == training_data.columns()
+        assert sqlite.rows() == training_data.rows()
+
+    def test_no_samples_create_no_database(self, sqlite):
+        assert sqlite.rows() == 0
+        assert sqlite.columns() == []
+        assert not sqlite.exists()
+
+    def test_reading_runs_no_schema_statements(self, sqlite, monkeypatch):
+        sqlite.append_many(_timed_rows(10))
+        statements = []
+        connect = sqlite3.connect
+
+        def tracing_connect(*args, **kwargs):
+            connection = connect(*args, **kwargs)
+            connection.set_trace_callback(statements.append)
+            return connection
+
+        monkeypatch.setattr(sqlite3, "connect", tracing_connect)
+        sqlite.load()
+        sqlite.tail(3)
+        sqlite.rows()
+
+        assert statements
+        assert not [
+            statement
+            for statement in statements
+            if statement.startswith(("CREATE", "PRAGMA"))
+        ]
+
+    def test_many_samples_are_stored_at_once(self, sqlite):
+        sqlite.append_many(_timed_rows(100))
+
+        assert sqlite.rows() == 100
+        assert sqlite.tail(3)["azimuth"].tolist() == [97, 98, 99]
+
+    def test_window_reads_a_time_range(self, sqlite):
+        sqlite.append_many(_timed_rows(10))
+
+        window = sqlite.window(1700000000 + 3 * 60, 1700000000 + 5 * 60, ["azimuth"])
+
+        assert window.columns.tolist() == ["azimuth"]
+        assert window["azimuth"].tolist() == [3, 4, 5]
+        assert sqlite.window(since=1700000000 + 8 * 60)["azimuth"].tolist() == [8, 9]
+
+    def test_window_is_read_through_the_index(self, sqlite):
+        import sqlite3
+
+        sqlite.append_many(_timed_rows(10))
+
+        with sqlite3.connect(sqlite.filename) as connection:
+            plan = connection.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM samples WHERE timestamp >= ?",
+                (0,),
+            ).fetchall()
+
+        assert "samples_timestamp" in str(plan)
+
+    def test_csv_is_migrated_once(self, training_data, sqlite):
+        for row in MIXED_ROWS:
+            training_data.append(dict(row))
+        expected = training_data.load()
+
+        sqlite.migrate()
+
+        pd.testing.assert_frame_equal(sqlite.load(), expected)
+        assert not training_data.exists()
+        assert sqlite.rows() == len(MIXED_ROWS)
+
+
+class TestWindow:
+    def test_csv_window_filters_by_timestamp(self, training_data):
+        for row in _timed_rows(10):
+            training_data.append(row)
+
+        window = training_data.window(until=1700000000 + 60, columns=["azimuth"])
+
+        assert window.columns.tolist() == ["azimuth"]
+        assert window["azimuth"].tolist() == [0, 1]
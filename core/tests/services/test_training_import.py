@@ -0,0 +1,208 @@
+"""Tests for learninghouse.services.training_import.
+
+The sensors configuration is replaced by a fixed one, and storing a batch
+of a stream by a stand-in, so these tests are about parsing, validating and
+batching the body only - tests/api/test_brain.py covers storing and training
+the imported data points.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from learninghouse.errors.brain import BrainBadRequest
+from learninghouse.models.brain import BrainImportFormat, BrainInfo
+from learninghouse.models.sensor import Sensor, Sensors, SensorType
+from learninghouse.services.brain import BrainService
+from learninghouse.services.training_import import (
+    TrainingDataImport,
+    TrainingDataStream,
+)
+
+SENSORS = Sensors(
+    [
+        Sensor(name="azimuth", typed=SensorType.NUMERICAL),
+        Sensor(name="pressure_trend_1h", typed=SensorType.CATEGORICAL),
+    ]
+)
+
+CSV = (
+    b"timestamp,azimuth,pressure_trend_1h,darkness\n"
+    b"1700000000,100.5,rising,true\n"
+    b"1700000060,,falling,False\n"
+)
+
+
+@pytest.fixture(autouse=True)
+def sensors(monkeypatch):
+    monkeypatch.setattr(Sensors, "cached_config", classmethod(lambda cls: (1, SENSORS)))
+
+
+def _csv_import() -> TrainingDataImport:
+    return TrainingDataImport("darkness", BrainImportFormat.CSV)
+
+
+class TestCsv:
+    def test_rows_are_typed_by_the_sensors(self):
+        importer = _csv_import()
+        importer.feed(CSV)
+
+        samples = importer.samples()
+
+        assert len(samples) == 2
+        assert samples[0]["azimuth"] == 100.5
+        assert samples[0]["pressure_trend_1h"] == "rising"
+        assert samples[0]["darkness"] is True
+        assert samples[1]["azimuth"] is None
+        assert samples[1]["darkness"] is False
+        assert samples[1]["timestamp"] == 1700000060
+        assert "hour_of_day" in samples[1]
+
+    def test_lines_split_across_chunks(self):
+        importer = _csv_import()
+        for position in range(0, len(CSV), 7):
+            importer.feed(CSV[position : position + 7])
+
+        assert importer.samples() == _parsed(CSV)
+
+    def test_last_line_without_line_break(self):
+        importer = _csv_import()
+        importer.feed(CSV.rstrip(b"\n"))
+
+        assert len(importer.samples()) == 2
+
+    @pytest.mark.parametrize(
+        "body, message",
+        [
+            (b"azimuth,rain,darkness\n", "Line 1 has the unknown sensor rain"),
+            (b"azimuth\n", "Line 1 misses the dependent variable darkness"),
+            (b"azimuth,darkness\nsunny,true\n", "Line 2 has no number for azimuth"),
+            (b"azimuth,darkness\n100,true,1\n", "Line 2 has 3 values"),
+            (b"azimuth,darkness\n100,\n", "Line 2 misses the dependent variable"),
+        ],
+    )
+    def test_invalid_body_is_rejected_with_its_line(self, body, message):
+        importer = _csv_import()
+
+        with pytest.raises(BrainBadRequest) as exc_info:
+            importer.feed(body)
+
+        assert exc_info.value.error.description.startswith(message)
+
+    def test_missing_header_is_rejected(self):
+        with pytest.raises(BrainBadRequest):
+            _csv_import().samples()
+
+
+class TestNdjson:
+    def test_lines_are_training_requests(self):
+        importer = TrainingDataImport("darkness", BrainImportFormat.NDJSON)
+        lines = [
+            {
+                "dependent_value": True,
+                "sensors_data": {"azimuth": 100.5, "pressure_trend_1h": "rising"},
+            },
+            {"dependent_value": False, "sensors_data": {"azimuth": None}},
+        ]
+
+        count = importer.feed(
+            b"\n".join(json.dumps(line).encode("utf-8") for line in lines) + b"\n"
+        )
+        samples = importer.samples()
+
+        assert count == 2
+        assert samples[0]["darkness"] is True
+        assert samples[0]["azimuth"] == 100.5
+        assert samples[1]["azimuth"] is None
+        assert "timestamp" in samples[1]
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            {"dependent_value": True, "sensors_data": {"rain": 1}},
+            {"dependent_value": "yes", "sensors_data": {"azimuth": 1}},
+            {"dependent_value": True, "sensors_data": {"azimuth": "north"}},
+            {"dependent_value": True},
+        ],
+    )
+    def test_invalid_line_is_rejected(self, line):
+        importer = TrainingDataImport("darkness", BrainImportFormat.NDJSON)
+
+        with pytest.raises(BrainBadRequest):
+            importer.feed(json.dumps(line).encode("utf-8") + b"\n")
+
+
+class TestFormat:
+    @pytest.mark.parametrize(
+        "content_type, expected",
+        [
+            ("text/csv", BrainImportFormat.CSV),
+            ("text/csv; charset=utf-8", BrainImportFormat.CSV),
+            ("application/x-ndjson", BrainImportFormat.NDJSON),
+            ("application/json", None),
+        ],
+    )
+    def test_format_by_content_type(self, content_type, expected):
+        assert BrainImportFormat.from_content_type(content_type) == expected
+
+
+def _parsed(body: bytes) -> list:
+    importer = _csv_import()
+    importer.feed(body)
+    return importer.samples()
+
+
+def _line(index: int) -> bytes:
+    line = {"dependent_value": index % 2 == 0, "sensors_data": {"azimuth": index}}
+    return json.dumps(line).encode("utf-8") + b"\n"
+
+
+async def _chunks(*chunks: bytes, pause: float = 0.0):
+    for chunk in chunks:
+        if pause:
+            await asyncio.sleep(pause)
+        yield chunk
+
+
+class TestStream:
+    @pytest.fixture()
+    def batches(self, monkeypatch):
+        batches = []
+
+        def store_streamed(name, samples):
+            batches.append([sample["azimuth"] for sample in samples])
+            return BrainInfo.model_construct(name=name)
+
+        monkeypatch.setattr(BrainService, "store_streamed", store_streamed)
+        return batches
+
+    def _stream(self, batch_size: int, batch_seconds: float) -> TrainingDataStream:
+        importer = TrainingDataImport("darkness", BrainImportFormat.NDJSON)
+        return TrainingDataStream(importer, batch_size, batch_seconds)
+
+    async def test_samples_are_stored_in_batches(self, batches):
+        stream = self._stream(batch_size=2, batch_seconds=60)
+
+        result = await stream.run(_chunks(*(_line(index) for index in range(5))))
+
+        assert batches == [[0, 1], [2, 3], [4]]
+        assert result.stored_samples == 5
+        assert result.batches == 3
+
+    async def test_samples_of_a_slow_feed_are_stored_after_the_batch_seconds(
+        self, batches
+    ):
+        stream = self._stream(batch_size=100, batch_seconds=0.05)
+
+        await stream.run(_chunks(_line(0), _line(1), pause=0.1))
+
+        assert batches == [[0], [1]]
+
+    async def test_samples_before_an_invalid_line_are_stored(self, batches):
+        stream = self._stream(batch_size=100, batch_seconds=60)
+
+        with pytest.raises(BrainBadRequest):
+            await stream.run(_chunks(_line(0) + _line(1) + b"{}\n" + _line(3)))
+
+        assert batches == [[0, 1]]
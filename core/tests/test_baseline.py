@@ -125,3 +125,92 @@ class TestBaseline:
             "elevation": -5.0,
             "hour_of_day": expected_hour,
         }
+
+
+PLAN_REQUESTS = [
+    {"timestamp": 1700072000, "azimuth": 200.0, "elevation": -5.0},
+    {"timestamp": 1700072000, "azimuth": 200, "pressure_trend_1h": "falling"},
+    {"timestamp": 1700000000, "elevation": None, "pressure_trend_1h": "unknown"},
+    {"timestamp": 1700100000, "azimuth": float("nan"), "pressure_trend_1h": None},
+]
+
+
+class TestFeaturePlan:
+    """The compiled FeaturePlan has to prepare exactly the row the pandas path
+    of DatasetPreprocessing.prepare_prediction prepares - here for a brain on
+    all columns of the fixture, so one-hot columns are covered as well."""
+
+    def test_plan_matches_the_pandas_path(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        import numpy as np
+        import pandas as pd
+
+        from learninghouse.models.brain import Brain
+        from learninghouse.services.preprocessing import DatasetPreprocessing
+        from learninghouse.services.training_data import TrainingData
+
+        _train_baseline_brain(isolated_client, unlocked_admin_headers)
+        data = TrainingData.open("darkness").load()
+
+        brain = Brain("darkness")
+        _, x_train, *_ = DatasetPreprocessing.prepare_training(brain, data, False)
+        brain.dataset.features = x_train.columns.tolist()
+        _, x_train, *_ = DatasetPreprocessing.prepare_training(brain, data, True)
+        brain.dataset.columns = x_train.columns.tolist()
+
+        plan = DatasetPreprocessing.compile_plan(brain, brain.dataset.columns)
+        assert plan is not None
+        assert plan.one_hot_index["pressure_trend_1h"]
+
+        for request in PLAN_REQUESTS:
+            request = DatasetPreprocessing.add_time_information(dict(request))
+            expected = DatasetPreprocessing.prepare_prediction(
+                brain, pd.DataFrame([request])
+            )
+
+            row = plan.transform([request])
+
+            assert row is not None
+            assert np.array_equal(row, expected.to_numpy(dtype=np.float64))
+            assert plan.preprocessed(row[0]) == expected.to_dict("records")[0]
+            assert list(map(type, plan.preprocessed(row[0]).values())) == list(
+                map(type, expected.to_dict("records")[0].values())
+            )
+
+    def test_batch_matches_the_pandas_path(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        import numpy as np
+        import pandas as pd
+
+        from learninghouse.services.brain import BrainService
+        from learninghouse.services.preprocessing import DatasetPreprocessing
+
+        _train_baseline_brain(isolated_client, unlocked_admin_headers)
+        brain = BrainService.load_brain("darkness")
+        requests = [
+            DatasetPreprocessing.add_time_information(dict(request))
+            for request in PLAN_REQUESTS
+        ]
+
+        expected = DatasetPreprocessing.prepare_prediction(
+            brain, pd.DataFrame(requests)
+        )
+
+        assert brain.dataset.plan is not None
+        transformed = brain.dataset.plan.transform(requests)
+
+        assert transformed is not None
+        assert np.array_equal(transformed, expected.to_numpy(dtype=np.float64))
+
+    def test_string_for_a_numerical_sensor_falls_back(
+        self, isolated_client, unlocked_admin_headers
+    ):
+        from learninghouse.services.brain import BrainService
+
+        _train_baseline_brain(isolated_client, unlocked_admin_headers)
+        brain = BrainService.load_brain("darkness")
+
+        assert brain.dataset.plan is not None
+        assert brain.dataset.plan.transform([{"azimuth": "200"}]) is None